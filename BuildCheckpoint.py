@@ -0,0 +1,99 @@
+import os
+import cPickle as pickle
+
+class BuildCheckpoint:
+    '''
+        Checkpoints of an index build (see index.indexing), kept in a directory so that an
+        interrupted build resumes where it stopped:
+            state.pkl                   the state of the build at the last checkpoint: its
+                                        settings, the shard being built, the number of its
+                                        runs, the size of the patent info file and a few
+                                        counters
+            run.<shard>.<number>.pkl    a run: the postings of the patents indexed between
+                                        two checkpoints, deleted once their shard is written
+            side.<shard>.<number>.pkl   what else was gathered from the same patents: their
+                                        metadata, MinHash signatures and IPC profile counts,
+                                        merged into the shard file once their shard is written
+            shard.<shard>.pkl           what the end of the build needs from a completed
+                                        shard: its document frequencies and terms, and its
+                                        merged side files
+
+        Every checkpoint only writes the files of the patents indexed since the previous one,
+        and a state of a fixed size (the files are named after the shard and run numbers), so
+        checkpoints cost the same throughout the build; only the end of a shard also merges
+        its side files. Every file is written to a temporary file, synced to
+        disk and renamed over the old one, and the files are written before the state
+        referring to them, so a build killed at any point leaves its last complete checkpoint
+        behind.
+    '''
+
+    def __init__(self, path, settings, interval=1000):
+        self.path = path
+        # Tuple of the build settings, a checkpoint is only resumed by the same build
+        self.settings = settings
+        self.interval = interval
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+    def load(self):
+        """
+        Return the state saved by the last checkpoint, or None if there is none
+        """
+        state_file = os.path.join(self.path, 'state.pkl')
+        if not os.path.exists(state_file):
+            return None
+        state = self.read('state.pkl')
+        if state['settings'] != self.settings:
+            raise RuntimeError, 'BuildCheckpoint: the checkpoint in %s is for another build' % self.path
+        return state
+
+    def save(self, state):
+        """
+        Save the state of the build (a dictionary), replacing the previous checkpoint
+        """
+        state['settings'] = self.settings
+        self.write('state.pkl', state)
+
+    def write(self, name, data):
+        """
+        Write data to the file name of the checkpoint
+
+        Returns:
+            name, to be recorded in the state
+        """
+        path = os.path.join(self.path, name)
+        f = open(path + '.tmp', 'wb')
+        pickle.dump(data, f, pickle.HIGHEST_PROTOCOL)
+        f.flush()
+        os.fsync(f.fileno())
+        f.close()
+        os.rename(path + '.tmp', path)
+        return name
+
+    def read(self, name):
+        f = open(os.path.join(self.path, name), 'rb')
+        data = pickle.load(f)
+        f.close()
+        return data
+
+    def remove_files(self, names):
+        """
+        Delete files no longer referred to by the state, e.g. the runs of a written shard
+        """
+        for name in names:
+            if os.path.exists(os.path.join(self.path, name)):
+                os.remove(os.path.join(self.path, name))
+
+    def remove(self):
+        """
+        Delete the checkpoint once the build is complete, and its directory if nothing else
+        is left in it. The state goes first: a build killed in between leaves files no state
+        refers to, which the next build overwrites, rather than a state whose files are gone.
+        """
+        if os.path.exists(os.path.join(self.path, 'state.pkl')):
+            os.remove(os.path.join(self.path, 'state.pkl'))
+        for name in os.listdir(self.path):
+            if (name.split('.')[0] in ('run', 'side', 'shard') and name.endswith('.pkl')) or name.endswith('.tmp'):
+                os.remove(os.path.join(self.path, name))
+        if os.listdir(self.path) == []:
+            os.rmdir(self.path)
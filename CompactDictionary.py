@@ -0,0 +1,248 @@
+import mmap
+import struct
+import fnmatch
+
+MAGIC = 'CDIC'
+HEADER = '<4sIII'
+BLOCK_SIZE = 16
+
+class CompactDictionary:
+    '''
+        Memory-mapped, sorted and front-coded term dictionary.
+
+        The file is laid out as follows (all integers are little-endian uint32):
+            header          magic "CDIC", number of terms, block size, length of the training path
+            training path   the path to the patent corpus
+            df array        the document frequency of every term, in term order
+            line array      the postings line of every term, in term order
+            block array     the offset of every block of terms in the term data
+            term data       the sorted terms, front-coded in blocks of <block size> terms
+
+        In a block, the first term is stored in full as <length><bytes>. Every following term
+        is stored as <length of prefix shared with the previous term><length of suffix><suffix>.
+        Lengths are variable-byte encoded. Lookups binary search the first terms of the blocks,
+        then decode a single block.
+
+        The object can be used where the python dictionary returned by search.read_dict is
+        expected: term in d, d[term] and d.get(term) return (df, postings line) tuples.
+    '''
+
+    def __init__(self, dictionary_file):
+        self.file = open(dictionary_file, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, self.num_terms, self.block_size, path_len = struct.unpack_from(HEADER, self.data, 0)
+        if magic != MAGIC:
+            raise RuntimeError, 'CompactDictionary: %s is not a compact dictionary file' % dictionary_file
+
+        offset = struct.calcsize(HEADER)
+        self.training_path = self.data[offset:offset + path_len]
+        offset += path_len
+
+        self.num_blocks = (self.num_terms + self.block_size - 1) / self.block_size
+        self.df_offset = offset
+        self.line_offset = self.df_offset + 4 * self.num_terms
+        self.block_offset = self.line_offset + 4 * self.num_terms
+        self.terms_offset = self.block_offset + 4 * self.num_blocks
+
+    @staticmethod
+    def is_compact(dictionary_file):
+        """
+        Check whether the given file is a compact dictionary file
+        """
+        f = open(dictionary_file, 'rb')
+        magic = f.read(len(MAGIC))
+        f.close()
+        return magic == MAGIC
+
+    @staticmethod
+    def write(entries, dictionary_file, training_path, block_size=BLOCK_SIZE):
+        """
+        Write a compact dictionary file.
+
+        Arguments:
+            entries         list of tuples (term, df, postings line), in any order
+            training_path   path to the patent corpus, stored with the dictionary
+        """
+        entries = sorted([(_to_bytes(term), df, line) for term, df, line in entries])
+
+        term_data = []
+        block_offsets = []
+        size = 0
+        previous = ''
+        for i, (term, df, line) in enumerate(entries):
+            if i % block_size == 0:
+                block_offsets.append(size)
+                encoded = _encode_vbyte(len(term)) + term
+            else:
+                prefix = _common_prefix_length(previous, term)
+                encoded = _encode_vbyte(prefix) + _encode_vbyte(len(term) - prefix) + term[prefix:]
+            term_data.append(encoded)
+            size += len(encoded)
+            previous = term
+
+        f = open(dictionary_file, 'wb')
+        f.write(struct.pack(HEADER, MAGIC, len(entries), block_size, len(training_path)))
+        f.write(training_path)
+        f.write(struct.pack('<%dI' % len(entries), *[df for term, df, line in entries]))
+        f.write(struct.pack('<%dI' % len(entries), *[line for term, df, line in entries]))
+        f.write(struct.pack('<%dI' % len(block_offsets), *block_offsets))
+        f.write(''.join(term_data))
+        f.close()
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+    def __len__(self):
+        return self.num_terms
+
+    def __contains__(self, term):
+        return self.__find(term) is not None
+
+    def __getitem__(self, term):
+        i = self.__find(term)
+        if i is None:
+            raise KeyError(term)
+        return self.__entry(i)
+
+    def get(self, term, default=None):
+        i = self.__find(term)
+        if i is None:
+            return default
+        return self.__entry(i)
+
+    def __iter__(self):
+        for i, term in self.__iter_terms(0):
+            yield term
+
+    def keys(self):
+        return list(self)
+
+    def iteritems(self):
+        for i, term in self.__iter_terms(0):
+            yield (term, self.__entry(i))
+
+    def prefix(self, prefix):
+        """
+        Return the list of all terms starting with prefix, in sorted order
+        """
+        prefix = _to_bytes(prefix)
+        matches = []
+        for i, term in self.__iter_terms(self.__find_block(prefix)):
+            if term.startswith(prefix):
+                matches.append(term)
+            elif term > prefix:
+                break
+        return matches
+
+    def match(self, pattern):
+        """
+        Return the list of all terms matching a wildcard pattern ('*' matches any sequence of
+        characters, '?' a single character). Only the terms sharing the part of the pattern
+        before the first wildcard are examined.
+        """
+        pattern = _to_bytes(pattern)
+        fixed = len(pattern)
+        for wildcard in '*?[':
+            if wildcard in pattern:
+                fixed = min(fixed, pattern.index(wildcard))
+        return [term for term in self.prefix(pattern[:fixed]) if fnmatch.fnmatchcase(term, pattern)]
+
+    def __entry(self, i):
+        df = struct.unpack_from('<I', self.data, self.df_offset + 4 * i)[0]
+        line = struct.unpack_from('<I', self.data, self.line_offset + 4 * i)[0]
+        return (df, line)
+
+    def __first_term(self, block):
+        offset = self.terms_offset + struct.unpack_from('<I', self.data, self.block_offset + 4 * block)[0]
+        length, offset = _decode_vbyte(self.data, offset)
+        return self.data[offset:offset + length]
+
+    def __find_block(self, term):
+        """
+        Binary search for the last block whose first term is not after term
+        """
+        lo = 0
+        hi = self.num_blocks
+        while hi - lo > 1:
+            mid = (lo + hi) / 2
+            if self.__first_term(mid) <= term:
+                lo = mid
+            else:
+                hi = mid
+        return lo
+
+    def __iter_terms(self, block):
+        """
+        Iterate over (index, term) starting from the first term of the given block
+        """
+        if self.num_terms == 0:
+            return
+        offset = self.terms_offset + struct.unpack_from('<I', self.data, self.block_offset + 4 * block)[0]
+        term = ''
+        for i in xrange(block * self.block_size, self.num_terms):
+            if i % self.block_size == 0:
+                length, offset = _decode_vbyte(self.data, offset)
+                term = self.data[offset:offset + length]
+                offset += length
+            else:
+                prefix, offset = _decode_vbyte(self.data, offset)
+                length, offset = _decode_vbyte(self.data, offset)
+                term = term[:prefix] + self.data[offset:offset + length]
+                offset += length
+            yield (i, term)
+
+    def __find(self, term):
+        """
+        Return the index of term in the dictionary, or None
+        """
+        term = _to_bytes(term)
+        block = self.__find_block(term)
+        for i, candidate in self.__iter_terms(block):
+            if candidate == term:
+                return i
+            if candidate > term or i + 1 >= (block + 1) * self.block_size:
+                return None
+        return None
+
+def _to_bytes(term):
+    """
+    Terms are stored as utf-8 encoded byte strings
+    """
+    if isinstance(term, unicode):
+        return term.encode('utf-8')
+    return term
+
+def _common_prefix_length(a, b):
+    i = 0
+    while i < len(a) and i < len(b) and a[i] == b[i]:
+        i += 1
+    return i
+
+def _encode_vbyte(number):
+    """
+    Variable-byte encoding: 7 bits per byte, the high bit is set on the last byte
+    """
+    encoded = []
+    while True:
+        encoded.insert(0, number % 128)
+        if number < 128:
+            break
+        number /= 128
+    encoded[-1] += 128
+    return ''.join([chr(b) for b in encoded])
+
+def _decode_vbyte(data, offset):
+    """
+    Decode a variable-byte encoded number at offset in data. Returns the number and
+    the offset of the byte following it.
+    """
+    number = 0
+    while True:
+        b = ord(data[offset])
+        offset += 1
+        if b < 128:
+            number = 128 * number + b
+        else:
+            return (128 * number + b - 128, offset)
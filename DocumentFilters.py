@@ -0,0 +1,145 @@
+import zlib
+import base64
+import binascii
+from IPC import IPC
+
+class DocumentFilters:
+    '''
+        Compressed bitmaps of the patents for every publication year, citation count and
+        IPC section, class and subclass, used to restrict a search to the patents matching
+        metadata constraints before any document is scored.
+
+        Patents are numbered in the order they are added. The bitmap of a value has bit i
+        set if patent number i has that value. Bitmaps are combined with python integer
+        AND/OR and only decompressed when a filter needs them.
+
+        The filter file contains the patent IDs in order on its first line, then one line
+        per bitmap:
+            <kind> <value> <bitmap>
+        where kind is year, cites or ipc, and bitmap is the zlib-compressed little-endian
+        bitmap, base64-encoded.
+    '''
+
+    def __init__(self, documents=None, compressed=None):
+        self.documents = documents if documents is not None else []
+        # (kind, value) -> compressed bitmap, and the bitmaps decompressed so far
+        self.compressed = compressed if compressed is not None else {}
+        self.bitmaps = {}
+        # (kind, value) -> list of patent numbers, for patents added since the last write
+        self.added = {}
+
+    def add_patent(self, pat_id, year, cites, ipc_symbol):
+        """
+        Add a patent with the given metadata (as written to the patent info file)
+        """
+        number = len(self.documents)
+        self.documents.append(pat_id)
+
+        values = [('cites', str(int(cites)) if cites.isdigit() else '0')]
+        if year.isdigit():
+            values.append(('year', year))
+        try:
+            ipc = IPC(ipc_symbol)
+            values += [('ipc', str(symbol)) for symbol in [ipc.section(), ipc.mainClass(), ipc.subclass()] if str(symbol) != '']
+        except RuntimeError:
+            pass
+
+        for key in set(values):
+            self.added.setdefault(key, []).append(number)
+
+    def write(self, filter_file):
+        """
+        Write the bitmaps to filter_file
+        """
+        for key, numbers in self.added.iteritems():
+            bits = self.__bits(self.bitmap(*key))
+            for number in numbers:
+                bits[number >> 3] |= 1 << (number & 7)
+            self.compressed[key] = base64.b64encode(zlib.compress(str(bits)))
+            self.bitmaps.pop(key, None)
+        self.added = {}
+
+        f = open(filter_file, 'w')
+        f.write(' '.join(self.documents) + '\n')
+        for (kind, value), compressed in sorted(self.compressed.iteritems()):
+            f.write(kind + ' ' + value + ' ' + compressed + '\n')
+        f.close()
+
+    @staticmethod
+    def read(filter_file):
+        """
+        Read a filter file written by DocumentFilters.write. The bitmaps stay compressed
+        until they are used.
+        """
+        f = open(filter_file, 'r')
+        documents = f.readline().split()
+        compressed = {}
+        for line in f:
+            kind, value, bitmap = line.split()
+            compressed[(kind, value)] = bitmap
+        f.close()
+        return DocumentFilters(documents, compressed)
+
+    def bitmap(self, kind, value):
+        """
+        Return the bitmap of the patents having the given value, as a python integer
+        """
+        key = (kind, value)
+        if key not in self.bitmaps:
+            if key not in self.compressed:
+                return 0
+            data = zlib.decompress(base64.b64decode(self.compressed[key]))
+            self.bitmaps[key] = int(binascii.hexlify(data[::-1]) or '0', 16)
+        return self.bitmaps[key]
+
+    def select(self, min_year=None, max_year=None, ipc=None, min_cites=None):
+        """
+        Return the set of patent IDs matching all the given constraints, or None if
+        there is no constraint.
+
+        Arguments:
+            min_year, max_year  bounds (inclusive) of the publication year
+            ipc                 list of IPC sections, classes or subclasses; patents in any of them match
+            min_cites           minimum number of citations
+        """
+        constraints = []
+        if min_year is not None or max_year is not None:
+            constraints.append(self.__union('year', lambda year: (min_year is None or int(year) >= min_year) and
+                                                                 (max_year is None or int(year) <= max_year)))
+        if ipc is not None:
+            symbols = set([str(IPC(symbol)) for symbol in ipc])
+            constraints.append(self.__union('ipc', lambda symbol: symbol in symbols))
+        if min_cites is not None:
+            constraints.append(self.__union('cites', lambda cites: int(cites) >= min_cites))
+        if constraints == []:
+            return None
+
+        bitmap = constraints[0]
+        for constraint in constraints[1:]:
+            bitmap &= constraint
+        return self.documents_of(bitmap)
+
+    def documents_of(self, bitmap):
+        """
+        Return the set of patent IDs of the bits set in bitmap
+        """
+        documents = set()
+        bits = bin(bitmap)[:1:-1]
+        number = bits.find('1')
+        while number != -1:
+            documents.add(self.documents[number])
+            number = bits.find('1', number + 1)
+        return documents
+
+    def __union(self, kind, matches):
+        bitmap = 0
+        for key_kind, value in self.compressed.keys():
+            if key_kind == kind and matches(value):
+                bitmap |= self.bitmap(kind, value)
+        return bitmap
+
+    def __bits(self, bitmap):
+        bits = bytearray((len(self.documents) + 7) / 8)
+        data = binascii.unhexlify('%0*x' % (2 * len(bits), bitmap)) if len(bits) > 0 else ''
+        bits[:] = bytearray(data[::-1])
+        return bits
@@ -0,0 +1,140 @@
+import math
+from IPC import IPC
+
+class IPCProfiles:
+    '''
+        Per-IPC-subclass term profiles used for IPC query expansion.
+
+        The terms harvested by PseudoRelevanceFeedback.generate_new_query_topIPC only
+        depend on the chosen subclass, so they are computed once at index time and
+        stored in a side file instead of re-reading every patent of the subclass for
+        each query.
+
+        The profile file starts with a line "# depth <depth>", followed by one subclass
+        per line:
+            <subclass> <term> <count> <term> <count> ...
+        where <count> is the number of occurences of the term in the titles and
+        abstracts of all the patents of that subclass, and terms are ordered by
+        decreasing tf.idf. By default (depth "all") every term is kept: the expansion
+        terms are only cut at lookup, and the profiles of a file can be updated when
+        new patents are indexed (see add_patent and update) and written again. With a
+        numeric depth, only the first <depth> terms are kept: the file is smaller, but
+        cannot give more than <depth> expansion terms, nor be updated, as the counts of
+        the terms left out are lost.
+    '''
+
+    def __init__(self, profiles=None, depth=None):
+        # subclass symbol -> {term: count}
+        self.profiles = profiles if profiles is not None else {}
+        # Number of terms kept per subclass in the file read, None if the profiles are complete
+        self.depth = depth
+
+    def add_patent(self, ipc_symbol, term_counts):
+        """
+        Add the term counts of one patent to the profile of its subclass, while
+        indexing or to update complete profiles read from a file.
+
+        Arguments:
+            ipc_symbol      the (primary) IPC symbol of the patent, as a string
+            term_counts     dictionary of normalized terms and their count in the patent
+        """
+        self.__check_complete()
+        try:
+            ipc = IPC(ipc_symbol)
+        except RuntimeError:
+            return
+
+        # Same membership rule as IPC.getPatents: the patent must lie below the subclass
+        subclass = ipc.subclass()
+        if ipc not in subclass:
+            return
+
+        profile = self.profiles.setdefault(str(subclass), {})
+        for term, count in term_counts.iteritems():
+            profile[term] = profile.get(term, 0) + count
+
+    def update(self, profiles):
+        """
+        Add the counts of other profiles, a dictionary subclass -> {term: count} (e.g. the
+        profiles of the patents indexed since the last checkpoint of index.py, or of a batch
+        of new patents)
+        """
+        self.__check_complete()
+        for subclass, term_counts in profiles.iteritems():
+            profile = self.profiles.setdefault(subclass, {})
+            for term, count in term_counts.iteritems():
+                profile[term] = profile.get(term, 0) + count
+
+    def __check_complete(self):
+        if self.depth is not None:
+            raise RuntimeError, 'IPCProfiles: profiles truncated to %d terms cannot be updated' % self.depth
+
+    def get_term_counts(self, subclass):
+        """
+        Return the stored {term: count} profile of the given subclass (an IPC object
+        or a string), or None if the subclass has no profile.
+        """
+        return self.profiles.get(str(subclass))
+
+    def write(self, profile_file, doc_freqs, n, depth=None):
+        """
+        Write the profiles to profile_file, ordering the terms of each subclass by
+        decreasing tf.idf.
+
+        Arguments:
+            doc_freqs   dictionary of the document frequency of every indexed term
+            n           the number of documents in the index
+            depth       if not None, the number of terms to keep per subclass
+        """
+        from nltk.stem.porter import PorterStemmer
+        stemmer = PorterStemmer()
+        f = open(profile_file, 'w')
+        f.write('# depth %s\n' % ('all' if depth is None else depth))
+        for subclass in sorted(self.profiles):
+            term_count = self.profiles[subclass]
+
+            # Same weighting as PseudoRelevanceFeedback.__get_top_terms
+            weights = {}
+            for term, count in term_count.iteritems():
+                stemmed_term = stemmer.stem(term)
+                if stemmed_term in doc_freqs:
+                    idf = math.log10(float(n)/float(doc_freqs[stemmed_term]))
+                    weights[term] = (1 + math.log10(count)) * idf
+                else:
+                    weights[term] = 0
+            # Ties are broken by term, so that the profiles do not depend on the order in
+            # which the patents were indexed (which differs in a sharded index)
+            top_terms = [x[0] for x in sorted(weights.items(), key=lambda x: (-x[1], x[0]))][:depth]
+
+            f.write(subclass + ' ')
+            f.write(' '.join([term + ' ' + str(term_count[term]) for term in top_terms]) + '\n')
+        f.close()
+
+    @staticmethod
+    def read(profile_file):
+        """
+        Read a profile file written by IPCProfiles.write
+        """
+        profiles = {}
+        depth = None
+        header = False
+        f = open(profile_file, 'r')
+        for line in f:
+            entries = line.split()
+            if len(entries) == 0:
+                continue
+            if entries[0] == '#':
+                depth = None if entries[2] == 'all' else int(entries[2])
+                header = True
+                continue
+            term_count = {}
+            i = 1
+            while i < len(entries):
+                term_count[entries[i]] = int(entries[i+1])
+                i += 2
+            profiles[entries[0]] = term_count
+        f.close()
+        if not header:
+            # Files without the depth line: a truncated profile holds exactly depth terms
+            depth = max([len(term_count) for term_count in profiles.itervalues()] or [0])
+        return IPCProfiles(profiles, depth)
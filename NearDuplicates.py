@@ -0,0 +1,162 @@
+import hashlib
+
+class NearDuplicates:
+    '''
+        Near-duplicate detection with MinHash signatures and locality-sensitive hashing.
+
+        Every patent is represented by the set of its shingles (runs of shingle_size
+        consecutive normalized terms). Its MinHash signature is computed with one permutation
+        hashing (Li et al., 2012): every shingle is hashed once, the hash picks one of
+        num_hashes bins and the signature holds the smallest hash of every bin. Two patents
+        agree on an entry of their signatures with a probability close to the Jaccard
+        similarity of their shingle sets. An empty bin takes the value of the next non-empty
+        bin, marked with its distance to it (rotation densification, Shrivastava, 2017).
+
+        The signatures are cut into bands of rows entries, and every band is hashed into a
+        bucket. Patents sharing a bucket are candidates, and candidates whose signatures agree
+        on at least threshold of their entries are near-duplicates, so a patent is only ever
+        compared to the few patents sharing one of its buckets. Near-duplicates are grouped
+        transitively into clusters.
+
+        The duplicates file holds one cluster per line, its representative first (see write).
+    '''
+
+    def __init__(self, num_hashes=64, rows=4, threshold=0.8, shingle_size=3):
+        self.num_hashes = num_hashes
+        self.rows = rows
+        self.threshold = threshold
+        self.shingle_size = shingle_size
+        self.buckets = {}
+        self.signatures = {}
+        # Union-find forest of the clusters
+        self.parents = {}
+
+    def add_patent(self, pat_id, terms):
+        """
+        Add a patent with the given list of normalized terms, in document order
+
+        Returns:
+            the patents added earlier found to be near-duplicates of this one
+        """
+        if len(terms) == 0:
+            return self.add_signature(pat_id, None)
+        size = self.shingle_size
+        shingles = set([' '.join(terms[i:i + size]) for i in xrange(max(1, len(terms) - size + 1))])
+        return self.add_signature(pat_id, self.__signature(shingles))
+
+    def add_signature(self, pat_id, signature):
+        """
+        Add a patent with the given MinHash signature, as computed by add_patent (None for a
+        patent without terms). Adding the signatures of an earlier detector in the same order
+        gives the same clusters.
+
+        Returns:
+            the patents added earlier found to be near-duplicates of this one
+        """
+        self.parents[pat_id] = pat_id
+        if signature is None:
+            return []
+        self.signatures[pat_id] = signature
+
+        candidates = set()
+        for start in xrange(0, len(signature), self.rows):
+            bucket = self.buckets.setdefault((start, tuple(signature[start:start + self.rows])), [])
+            candidates.update(bucket)
+            bucket.append(pat_id)
+
+        duplicates = []
+        for candidate in sorted(candidates):
+            if self.similarity(pat_id, candidate) >= self.threshold:
+                duplicates.append(candidate)
+                self.parents[self.__find(pat_id)] = self.__find(candidate)
+        return duplicates
+
+    def similarity(self, first, second):
+        """
+        Estimated Jaccard similarity of the shingles of two patents
+        """
+        first, second = self.signatures[first], self.signatures[second]
+        return sum([1 for i in xrange(len(first)) if first[i] == second[i]]) / float(len(first))
+
+    def clusters(self):
+        """
+        Return the clusters of near-duplicates, as lists of patent IDs, without the patents
+        having no near-duplicate
+        """
+        clusters = {}
+        for pat_id in self.parents:
+            clusters.setdefault(self.__find(pat_id), []).append(pat_id)
+        return [cluster for cluster in clusters.itervalues() if len(cluster) > 1]
+
+    def write(self, duplicates_file, priors=None):
+        """
+        Write the clusters to duplicates_file, one per line. The members of a cluster are
+        ordered by decreasing prior (e.g. the static rank of index.py), then by patent ID, so
+        the first one, the representative of the cluster, is the most cited.
+        """
+        if priors is None:
+            priors = {}
+        clusters = [sorted(cluster, key=lambda pat_id: (-priors.get(pat_id, 0), pat_id)) for cluster in self.clusters()]
+        f = open(duplicates_file, 'w')
+        for cluster in sorted(clusters):
+            f.write(' '.join(cluster) + '\n')
+        f.close()
+
+    @staticmethod
+    def read_clusters(duplicates_file):
+        """
+        Read the clusters written by NearDuplicates.write
+
+        Returns:
+            list of the clusters, each a list of patent IDs, most cited first
+        """
+        clusters = []
+        f = open(duplicates_file, 'r')
+        for line in f:
+            cluster = line.split()
+            if len(cluster) > 0:
+                clusters.append(cluster)
+        f.close()
+        return clusters
+
+    @staticmethod
+    def read(duplicates_file):
+        """
+        Read the clusters written by NearDuplicates.write
+
+        Returns:
+            dictionary patent ID -> representative of its cluster, for the patents having
+            near-duplicates
+        """
+        representatives = {}
+        f = open(duplicates_file, 'r')
+        for line in f:
+            cluster = line.split()
+            for pat_id in cluster:
+                representatives[pat_id] = cluster[0]
+        f.close()
+        return representatives
+
+    def __signature(self, shingles):
+        num_hashes = self.num_hashes
+        bins = [None] * num_hashes
+        for shingle in shingles:
+            value = int(hashlib.md5(shingle).hexdigest()[:16], 16)
+            slot, value = value % num_hashes, value / num_hashes
+            if bins[slot] is None or value < bins[slot]:
+                bins[slot] = value
+
+        signature = []
+        for i in xrange(num_hashes):
+            distance = 0
+            while bins[(i + distance) % num_hashes] is None:
+                distance += 1
+            signature.append((distance, bins[(i + distance) % num_hashes]))
+        return signature
+
+    def __find(self, pat_id):
+        parents = self.parents
+        while parents[pat_id] != pat_id:
+            parents[pat_id] = parents[parents[pat_id]]
+            pat_id = parents[pat_id]
+        return pat_id
@@ -0,0 +1,54 @@
+class NearestNeighbours:
+    '''
+        The most similar patents of every patent of the index, computed offline by neighbours.py.
+
+        The neighbours file holds one line per patent, sorted by patent ID:
+            <patent> <neighbour> <score> <neighbour> <score> ...
+        with the neighbours ordered by decreasing score. Only the offset of every line is kept
+        in memory: a lookup seeks to the line of the patent and reads it.
+    '''
+
+    def __init__(self, neighbours_file):
+        self.neighbours_file = neighbours_file
+        self.offsets = {}
+        f = open(neighbours_file, 'r')
+        offset = 0
+        for line in f:
+            self.offsets[line.split(' ', 1)[0].rstrip()] = offset
+            offset += len(line)
+        f.close()
+
+    def __contains__(self, patent):
+        return patent in self.offsets
+
+    def get(self, patent):
+        """
+        Return the neighbours of patent as a list of tuples (patent, score) ordered by
+        decreasing score, or None if the patent has no neighbours list
+        """
+        if patent not in self.offsets:
+            return None
+        f = open(self.neighbours_file, 'r')
+        f.seek(self.offsets[patent])
+        fields = f.readline().split()
+        f.close()
+        return [(fields[i], float(fields[i + 1])) for i in xrange(1, len(fields) - 1, 2)]
+
+    def read_all(self):
+        """
+        Return the neighbours of every patent, as a dictionary patent -> list of (patent, score)
+        """
+        return dict([(patent, self.get(patent)) for patent in self.offsets])
+
+    @staticmethod
+    def write(neighbours, neighbours_file):
+        """
+        Write the neighbours lists (dictionary patent -> list of (patent, score)) to neighbours_file
+        """
+        f = open(neighbours_file, 'w')
+        for patent in sorted(neighbours):
+            f.write(patent)
+            for neighbour, score in neighbours[patent]:
+                f.write(' ' + neighbour + ' ' + ('%.6g' % score))
+            f.write('\n')
+        f.close()
@@ -0,0 +1,222 @@
+import os
+import re
+import json
+import gzip
+import mmap
+import tarfile
+import zipfile
+import threading
+import collections
+import xml.etree.ElementTree as et
+
+class PatentSource:
+    '''
+        The patents of a corpus, each of them an XML element <doc> holding <str name="...">
+        fields, read from any of:
+            a directory holding one XML file per patent, named after the patent
+            a tar (.tar, .tar.gz, .tgz, .tar.bz2) or zip (.zip) archive of such files
+            a multi-record XML file (.xml): a sequence of <doc> elements under any root element
+            a JSON-lines file (.jsonl, .jsonl.gz): one object per line, mapping field names to
+                values, e.g. {"Patent Number": "EP0049154B2", "Title": "...", ...}. Lists are
+                joined with " | ", as in the XML files.
+
+        Archives and record files are streamed, without extracting anything to disk. The ID of
+        a patent is its file name without the extension for files, and its Patent Number field
+        for records. Only the patents of a directory come in the order of their IDs.
+
+        A patent is looked up (get) by opening its file in a directory or its member in a zip
+        archive. For the other sources, the position of every patent is found by reading the
+        whole source once, at the first lookup.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        if os.path.isdir(path):
+            self.kind = 'directory'
+        elif path.endswith('.zip'):
+            self.kind = 'zip'
+        elif path.endswith('.jsonl') or path.endswith('.jsonl.gz'):
+            self.kind = 'jsonl'
+        elif re.search(r'\.(tar|tar\.gz|tgz|tar\.bz2|tbz2)$', path):
+            self.kind = 'tar'
+        elif path.endswith('.xml'):
+            self.kind = 'xml'
+        else:
+            raise RuntimeError, 'PatentSource: unknown corpus format %s' % path
+        self.ordered = self.kind == 'directory'
+        # Position of every patent for lookups, and the open archive or file they refer to
+        self.positions = None
+        self.archive = None
+        self.lock = threading.Lock()
+
+    def patents(self, shard=0, shards=1, skip=None):
+        """
+        Iterate over the patents of the source, or over every shards-th of them starting with
+        the shard-th if shards is more than 1. The patents whose ID is in the set skip are
+        left out; in a directory or an archive, their files are not even read.
+
+        Returns:
+            iterator of tuples (patent ID, <doc> element)
+        """
+        for i, (pat_id, root) in enumerate(self.__read_all(skip)):
+            if i % shards == shard and root is not None:
+                yield (pat_id, root)
+
+    def get(self, pat_id):
+        """
+        Return the <doc> element of the patent pat_id
+        """
+        if self.kind == 'directory':
+            return et.parse(os.path.join(self.path, pat_id + '.xml')).getroot()
+
+        with self.lock:
+            if self.positions is None:
+                self.__index()
+            position = self.positions[pat_id]
+            if self.kind == 'zip':
+                member = self.archive.open(position)
+                root = et.parse(member).getroot()
+                member.close()
+            elif self.kind == 'tar':
+                root = et.parse(self.archive.extractfile(position)).getroot()
+            elif self.kind == 'xml':
+                start, end = position
+                root = et.fromstring(self.archive[start:end])
+            else:
+                self.archive.seek(position)
+                root = record_element(json.loads(self.archive.readline(), object_pairs_hook=collections.OrderedDict))
+        return root
+
+    def close(self):
+        """
+        Close the archive or file opened for lookups
+        """
+        if self.archive is not None:
+            self.archive.close()
+            self.archive = None
+            self.positions = None
+
+    def __read_all(self, skip=None):
+        # Skipped patents are still yielded, with no element, for the shards to stay the same
+        if skip is None:
+            skip = set()
+        if self.kind == 'directory':
+            for name in sorted(os.listdir(self.path)):
+                pat_id = os.path.splitext(name)[0]
+                if pat_id in skip:
+                    yield (pat_id, None)
+                    continue
+                yield (pat_id, et.parse(os.path.join(self.path, name)).getroot())
+
+        elif self.kind == 'zip':
+            archive = zipfile.ZipFile(self.path)
+            for name in archive.namelist():
+                if name.endswith('/'):
+                    continue
+                if member_id(name) in skip:
+                    yield (member_id(name), None)
+                    continue
+                member = archive.open(name)
+                root = et.parse(member).getroot()
+                member.close()
+                yield (member_id(name), root)
+            archive.close()
+
+        elif self.kind == 'tar':
+            # Stream mode: the archive is decompressed and read once, front to back
+            archive = tarfile.open(self.path, 'r|*')
+            for member in archive:
+                if not member.isfile():
+                    continue
+                if member_id(member.name) in skip:
+                    yield (member_id(member.name), None)
+                    continue
+                yield (member_id(member.name), et.parse(archive.extractfile(member)).getroot())
+            archive.close()
+
+        elif self.kind == 'xml':
+            root = None
+            for event, element in et.iterparse(self.path, events=('start', 'end')):
+                if root is None:
+                    root = element
+                elif event == 'end' and element.tag == 'doc':
+                    pat_id = record_id(element)
+                    yield (pat_id, element if pat_id not in skip else None)
+                    # Drop the records already read
+                    root.clear()
+
+        else:
+            f = self.__open_jsonl()
+            for line in f:
+                if line.strip() == '':
+                    continue
+                element = record_element(json.loads(line, object_pairs_hook=collections.OrderedDict))
+                pat_id = record_id(element)
+                yield (pat_id, element if pat_id not in skip else None)
+            f.close()
+
+    def __index(self):
+        positions = {}
+        if self.kind == 'zip':
+            self.archive = zipfile.ZipFile(self.path)
+            for name in self.archive.namelist():
+                if not name.endswith('/'):
+                    positions[member_id(name)] = name
+        elif self.kind == 'tar':
+            self.archive = tarfile.open(self.path, 'r:*')
+            for member in self.archive.getmembers():
+                if member.isfile():
+                    positions[member_id(member.name)] = member
+        elif self.kind == 'xml':
+            f = open(self.path, 'rb')
+            self.archive = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            f.close()
+            for match in re.finditer(r'<doc[\s>]', self.archive):
+                start = match.start()
+                end = self.archive.find('</doc>', start) + len('</doc>')
+                positions[record_id(et.fromstring(self.archive[start:end]))] = (start, end)
+        else:
+            self.archive = self.__open_jsonl()
+            while True:
+                position = self.archive.tell()
+                line = self.archive.readline()
+                if line == '':
+                    break
+                if line.strip() != '':
+                    positions[record_id(record_element(json.loads(line)))] = position
+        self.positions = positions
+
+    def __open_jsonl(self):
+        if self.path.endswith('.gz'):
+            return gzip.open(self.path, 'rb')
+        return open(self.path, 'rb')
+
+def member_id(name):
+    """
+    Patent ID of an archive member: its file name without directories and extension
+    """
+    return os.path.splitext(os.path.basename(name))[0]
+
+def record_id(element):
+    """
+    Patent ID of a record: its Patent Number field
+    """
+    for child in element:
+        if child.get('name') == 'Patent Number':
+            pat_id = child.text.strip()
+            # IDs are byte strings, as the file names of a directory
+            return pat_id.encode('utf-8') if isinstance(pat_id, unicode) else pat_id
+    raise RuntimeError, 'PatentSource: record without a Patent Number'
+
+def record_element(record):
+    """
+    Convert a JSON record (field name -> value) to a <doc> element with one <str> per field
+    """
+    element = et.Element('doc')
+    for name, value in record.iteritems():
+        child = et.SubElement(element, 'str', {'name': name})
+        if isinstance(value, list):
+            child.text = ' | '.join([unicode(v) for v in value])
+        elif value is not None:
+            child.text = unicode(value)
+    return element
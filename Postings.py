@@ -0,0 +1,125 @@
+from array import array
+from bisect import bisect_left
+from itertools import izip
+
+class DocumentTable:
+    '''
+        Numbering of the documents of a postings file, in the order of their names, so that
+        postings sorted by document name are also sorted by document number.
+    '''
+
+    def __init__(self, names):
+        self.names = sorted(names)
+        self.numbers = dict([(name, number) for number, name in enumerate(self.names)])
+
+class Postings:
+    '''
+        A decoded postings list, held in typed arrays instead of one tuple per posting:
+            documents   document numbers (see DocumentTable), increasing
+            weights     log tf of every posting
+            offsets     for a positional list, the positions of posting i are
+                        positions[offsets[i]:offsets[i + 1]]
+            positions   positions of all the postings, one after the other
+
+        A posting takes 12 bytes, plus 4 bytes per position, whatever the number of postings.
+        Iterating yields (document name, log tf) tuples, or (document name, log tf, positions)
+        for a positional list. Use a cursor (see PostingsCursor) to walk or seek through the
+        list without building them.
+    '''
+
+    def __init__(self, table, positional):
+        self.table = table
+        self.positional = positional
+        self.documents = array('i')
+        self.weights = array('d')
+        self.offsets = array('i', [0]) if positional else None
+        self.positions = array('i') if positional else None
+
+    def append(self, document, weight, positions=None):
+        """
+        Add a posting for the document number document, after all the others
+        """
+        self.documents.append(document)
+        self.weights.append(weight)
+        if self.positional:
+            self.positions.extend(positions)
+            self.offsets.append(len(self.positions))
+
+    def __len__(self):
+        return len(self.documents)
+
+    def __iter__(self):
+        names = self.table.names
+        if not self.positional:
+            return ((names[document], weight) for document, weight in izip(self.documents, self.weights))
+        return ((names[self.documents[i]], self.weights[i], self.get_positions(i)) for i in xrange(len(self.documents)))
+
+    def get_positions(self, i):
+        """
+        Return the positions of the i-th posting, as an array
+        """
+        return self.positions[self.offsets[i]:self.offsets[i + 1]]
+
+    def cursor(self):
+        return PostingsCursor(self)
+
+    @staticmethod
+    def merge(first, second):
+        """
+        Merge two postings lists of distinct documents (e.g. the two tiers of a term) into one
+        """
+        merged = Postings(first.table, first.positional)
+        i = j = 0
+        while i < len(first) or j < len(second):
+            if j == len(second) or (i < len(first) and first.documents[i] < second.documents[j]):
+                source, k = first, i
+                i += 1
+            else:
+                source, k = second, j
+                j += 1
+            merged.append(source.documents[k], source.weights[k], source.get_positions(k) if source.positional else None)
+        return merged
+
+class PostingsCursor:
+    '''
+        Position in a Postings list, moving forward only. seek jumps to a document with a
+        binary search over the rest of the list, so intersecting a short list with a long one
+        costs a few steps per posting of the short list.
+    '''
+
+    def __init__(self, postings):
+        self.postings = postings
+        self.index = 0
+
+    def valid(self):
+        """
+        Whether the cursor is on a posting (and not past the end of the list)
+        """
+        return self.index < len(self.postings.documents)
+
+    def document(self):
+        return self.postings.documents[self.index]
+
+    def name(self):
+        return self.postings.table.names[self.postings.documents[self.index]]
+
+    def weight(self):
+        return self.postings.weights[self.index]
+
+    def positions(self):
+        return self.postings.get_positions(self.index)
+
+    def next(self):
+        self.index += 1
+
+    def seek(self, document):
+        """
+        Move to the first posting of a document number not less than document
+
+        Returns:
+            True if the cursor is on a posting of document
+        """
+        documents = self.postings.documents
+        if self.index < len(documents) and documents[self.index] < document:
+            self.index = bisect_left(documents, document, self.index + 1)
+        return self.index < len(documents) and documents[self.index] == document
@@ -2,55 +2,78 @@ import nltk
 import math
 import operator
 from collections import Counter
-import xml.etree.ElementTree as et
 import text_processing
 from nltk.stem.porter import *
 from IPC import IPC
+import tracing
 
 class PseudoRelevanceFeedback:
     '''
         Class for making new search with Pseudo Relevance Feedback
     '''
 
-    def __init__(self, dictionary, postings_file, line_positions, training_path, n):
+    def __init__(self, dictionary, postings_file, line_positions, source, n, new_term_weight=0.5, old_term_boost=1.5):
         self.dictionary = dictionary
         self.postings_file = postings_file
         self.line_positions = line_positions
-        self.training_path = training_path
+        # PatentSource of the corpus, from which the feedback documents are read
+        self.source = source
         self.n = n
+        # tf given to new query terms, and factor applied to original terms that are also new terms
+        self.new_term_weight = new_term_weight
+        self.old_term_boost = old_term_boost
 
-    def generate_new_query_topk(self, old_results, no_of_terms, old_query_str):
+    def generate_new_query_topk(self, old_results, no_of_terms, old_query):
         """
             public method for finding new query words from the top k retreived files
 
             Arguments:
                 old_results     the k top ranked documents to retreive new query words from
                 no_of_terms     the number of new query terms that should be generated
-                old_query_str   the original query for the first search
+                old_query       the processed query of the first search (term -> tf, see
+                                search.process_query), with its wildcards already expanded
 
             Return:
                 query_weights    dictionary of the words with highest weight from the documents
         """
 
         content = self.__get_document_content(old_results)
-        top_query_terms, old_query_list = self.__get_new_terms(content, old_query_str, no_of_terms)
-        query_weights = self.__get_query_tf(top_query_terms, old_query_list)
+        top_query_terms = self.__get_new_terms(content, no_of_terms)
+        query_weights = self.__get_query_tf(top_query_terms, old_query)
         return query_weights
 
-    def generate_new_query_topIPC(self, old_results, no_of_terms, old_query_str, patent_info):
+    def generate_new_query_topIPC(self, old_results, no_of_terms, old_query, patent_info, ipc_profiles=None, term_cache=None):
         """
             public method for finding new query words from the top IPC subclass
 
             Arguments:
                 old_results     the k top ranked documents to retreive new query words from
                 no_of_terms     the number of new query terms that should be generated
-                old_query_str   the original query for the first search
+                old_query       the processed query of the first search (see generate_new_query_topk)
+                ipc_profiles    precomputed IPCProfiles of the index. If given, the term counts
+                                of the subclass are looked up instead of read from the patents,
+                                unless the profiles were cut to fewer than no_of_terms terms
+                term_cache      if not None, a dictionary in which the top terms of the profiles are
+                                kept, so that searches expanding with the same subclass share them
 
             Return:
                 query_weights    dictionary of the words with highest weight from the documents
         """
         best_IPC = self.__get_best_IPC(old_results, patent_info)
-        
+
+        term_count = None
+        if ipc_profiles is not None and (ipc_profiles.depth is None or no_of_terms <= ipc_profiles.depth):
+            term_count = ipc_profiles.get_term_counts(best_IPC)
+        if term_count is not None:
+            key = (str(best_IPC), no_of_terms)
+            if term_cache is not None and key in term_cache:
+                top_query_terms = term_cache[key]
+            else:
+                top_query_terms = self.__get_top_terms(term_count, no_of_terms)
+                if term_cache is not None:
+                    term_cache[key] = top_query_terms
+            return self.__get_query_tf(top_query_terms, old_query)
+
         patentNos = best_IPC.getPatents(patent_info)
 
         patentNos_dict = []
@@ -59,8 +82,8 @@ class PseudoRelevanceFeedback:
             
         content = self.__get_document_content(patentNos_dict)
         # query_weights = self.__get_new_terms_IPC(content, old_query_str, no_of_terms)
-        top_query_terms, old_query_list = self.__get_new_terms(content, old_query_str, no_of_terms)
-        query_weights = self.__get_query_tf(top_query_terms, old_query_list)
+        top_query_terms = self.__get_new_terms(content, no_of_terms)
+        query_weights = self.__get_query_tf(top_query_terms, old_query)
 
         return query_weights
 
@@ -125,9 +148,8 @@ class PseudoRelevanceFeedback:
         """
         content = ''
         for doc_name, score in old_results:
-            path = self.training_path + doc_name + '.xml'
-            tree = et.parse(path)
-            root = tree.getroot()
+            root = self.source.get(doc_name)
+            tracing.count('xml_parsed')
 
             for child in root:
                 if child.get('name') == 'Title':
@@ -141,25 +163,23 @@ class PseudoRelevanceFeedback:
 
         return content
 
-    def __get_new_terms(self, content, old_query_str, no_of_terms):
+    def __get_new_terms(self, content, no_of_terms):
         """
         Tokenize the string of words from the documents and compute the frequency of each word in the query list
 
         Arguments:
             content         string of words from the documents
-            old_query_str   the original query for the first search
 
         Returns: 
             top_query_terms list of the words from the documents with the highest weights
         """
-        old_query_list = self.__tokenize_string(old_query_str)
         new_query_list = self.__tokenize_string(content)
         # term_list = [x for x in new_query_list if x not in old_query_list]
 
         term_count = Counter(new_query_list)
 
         top_query_terms = self.__get_top_terms(term_count, no_of_terms)
-        return (top_query_terms, old_query_list)
+        return top_query_terms
 
     def __tokenize_string(self, the_string):
         """
@@ -214,7 +234,7 @@ class PseudoRelevanceFeedback:
         # calculate tf in query
         log_tf = self.__compute_tf(term_count)
 
-        if term in self.dictionary.keys():
+        if term in self.dictionary:
             (freq, postings_line) = self.dictionary[term]
             # calculate idf
             idf = math.log10(float(self.n)/float(freq))
@@ -222,21 +242,21 @@ class PseudoRelevanceFeedback:
         else:
             return 0
 
-    def __get_query_tf(self, new_query_terms, old_query_terms):
+    def __get_query_tf(self, new_query_terms, old_query):
         """
-            Set tf values for the new terms to 0.5 and for the old ones to 1.5
+            Set tf values for the new terms to new_term_weight (0.5 by default) and multiply
+            those of the old ones (old_query, term -> tf) by old_term_boost (1.5 by default)
+            if they are also new terms
             Reference: http://ceur-ws.org/Vol-1176/CLEF2010wn-ImageCLEF-Larson2010.pdf
         """
-        old_query_count = Counter(old_query_terms)
-
         query_weights = {}
         for term in new_query_terms:
-            query_weights[term] = 0.5
-        for term in old_query_terms:
+            query_weights[term] = self.new_term_weight
+        for term, term_tf in old_query.iteritems():
             if term in new_query_terms:
-                query_weights[term] = self.__compute_tf(old_query_count[term])*1.5
+                query_weights[term] = term_tf*self.old_term_boost
             else:
-                query_weights[term] = self.__compute_tf(old_query_count[term])
+                query_weights[term] = term_tf
         return query_weights
 
     def __get_query_tf_test(self, new_query_terms, old_query_terms):
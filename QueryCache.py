@@ -0,0 +1,111 @@
+import os
+import time
+import hashlib
+import cPickle as pickle
+from collections import OrderedDict
+
+class QueryCache:
+    '''
+        Cache of search results, keyed by the normalized query terms and the search settings.
+
+        Every entry remembers the generation of the index it was computed on (see
+        index_generation); entries of another generation are never returned. The cache holds
+        at most max_entries results, evicting the least recently used ones, and entries older
+        than ttl seconds expire. If a cache_file is given, the cache is read from it on
+        creation and written back by save(), so cached results survive process restarts.
+    '''
+
+    def __init__(self, max_entries=1000, ttl=None, cache_file=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.cache_file = cache_file
+        # key -> (generation, time stored, scores), least recently used first
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+        if cache_file is not None and os.path.exists(cache_file):
+            f = open(cache_file, 'rb')
+            try:
+                self.entries = pickle.load(f)
+            except (EOFError, pickle.UnpicklingError):
+                # A corrupted cache is simply discarded
+                self.entries = OrderedDict()
+            f.close()
+
+    @staticmethod
+    def make_key(query, settings):
+        """
+        Build the cache key of a query.
+
+        Arguments:
+            query       dictionary of normalized query terms and their weights (see search.process_query)
+            settings    tuple of the pipeline settings and of anything else in the query that
+                        influences the results (e.g. the normalized phrasal queries)
+        """
+        return repr(QueryCache.__canonical((sorted(query.items()), settings)))
+
+    @staticmethod
+    def __canonical(value):
+        # The stemmer returns the words it leaves unchanged as str and the others as unicode,
+        # which compare equal but have different representations
+        if isinstance(value, str):
+            return value.decode('utf-8')
+        if isinstance(value, (tuple, list)):
+            return tuple([QueryCache.__canonical(v) for v in value])
+        return value
+
+    @staticmethod
+    def index_generation(index_files):
+        """
+        Compute a stamp identifying the current version of the index from the size and
+        modification time of its files. Rebuilding the index changes the stamp.
+        """
+        stamp = hashlib.md5()
+        for path in index_files:
+            if path is not None and os.path.exists(path):
+                st = os.stat(path)
+                stamp.update('%s %d %f\n' % (path, st.st_size, st.st_mtime))
+        return stamp.hexdigest()
+
+    def get(self, key, generation):
+        """
+        Return the cached scores for key, or None if they are missing, expired or were
+        computed on another generation of the index
+        """
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        entry_generation, stored, scores = entry
+        if entry_generation != generation or (self.ttl is not None and time.time() - stored > self.ttl):
+            self.misses += 1
+            return None
+
+        # Move the entry to the most recently used end
+        self.entries[key] = entry
+        self.hits += 1
+        return scores
+
+    def put(self, key, generation, scores):
+        """
+        Store the scores of a query, evicting the least recently used entries if needed
+        """
+        self.entries.pop(key, None)
+        self.entries[key] = (generation, time.time(), scores)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def save(self):
+        """
+        Write the cache to its cache file (if any). The file is replaced atomically so
+        that a concurrent reader never sees a partial cache.
+        """
+        if self.cache_file is None:
+            return
+        tmp_file = self.cache_file + '.tmp'
+        f = open(tmp_file, 'wb')
+        pickle.dump(self.entries, f, pickle.HIGHEST_PROTOCOL)
+        f.close()
+        os.rename(tmp_file, self.cache_file)
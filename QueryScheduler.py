@@ -0,0 +1,163 @@
+import time
+import threading
+import search
+
+class QueryScheduler:
+    '''
+        Scheduler for a long-running search process (search.py -L) serving many callers at once.
+
+        Callers on any thread hand their query to search(), which blocks until its results are
+        ready. A single worker thread gathers the queries that arrive within batch_window seconds
+        of each other (at most max_batch of them) into a micro-batch, against an index loaded
+        once. The first passes of the batch are scored together (see search.score_first_passes):
+        the postings list of every distinct query term is fetched once and walked once, adding
+        to the scores of every query holding the term. The rest of the pipeline (phrasal
+        queries, expansion, second pass) then runs per query (search.run_search), sharing a
+        postings cache for the duration of the batch, so a postings list used by several of
+        them is fetched and decoded once. The expansion terms of an IPC subclass are computed
+        once for the lifetime of the scheduler. Identical queries in flight at the same time
+        are run once and share the result.
+
+        The searches use the settings of the search module imported here. search.py -L runs
+        as another module (__main__), so it passes its own settings (see search.get_settings).
+    '''
+
+    def __init__(self, dictionary_file, postings_file, patent_info_file, ipc_profile_file=None, batch_window=0.005, max_batch=16, cache=None, shards=None, duplicates_file=None, settings=None):
+        self.dictionary_file = dictionary_file
+        self.postings_file = postings_file
+        self.patent_info_file = patent_info_file
+        self.ipc_profile_file = ipc_profile_file
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.cache = cache
+        self.shards = shards
+        self.duplicates_file = duplicates_file
+        if settings is not None:
+            for name, value in settings.iteritems():
+                setattr(search, name, value)
+
+        # Index structures loaded by the first search, see search.run_search
+        self.index = {}
+        self.condition = threading.Condition()
+        self.pending = []
+        self.in_flight = {}
+        self.closed = False
+        self.batches = 0
+        self.searches = 0
+        self.requests = 0
+
+        self.worker = threading.Thread(target=self.__run)
+        self.worker.daemon = True
+        self.worker.start()
+
+    def search(self, query_file, output_file, stage_times=None):
+        """
+        Search for the query in query_file and write the results to output_file, like
+        search.search. Can be called from any thread; blocks until the results are ready.
+        If stage_times is given, the (stage name, seconds) of the search are appended to it;
+        callers sharing a search get the same stages.
+
+        Returns:
+            scores          list of tuples with document names and scores ordered by decreasing score
+            truncated       always False, time budgets are not supported by the scheduler
+        """
+        f = open(query_file, 'r')
+        key = f.read()
+        f.close()
+
+        with self.condition:
+            if self.closed:
+                raise RuntimeError, 'QueryScheduler: the scheduler is closed'
+            self.requests += 1
+            request = self.in_flight.get(key)
+            if request is None:
+                request = _Request(query_file, output_file)
+                self.in_flight[key] = request
+                self.pending.append((key, request))
+                self.condition.notify()
+            else:
+                request.output_files.append(output_file)
+
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        if stage_times is not None:
+            stage_times.extend(request.stage_times)
+        return (request.scores, False)
+
+    def close(self):
+        """
+        Run the queries already submitted, then stop the worker thread
+        """
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        self.worker.join()
+        if self.shards is not None and 'shards' in self.index:
+            self.index['shards'].close()
+        if 'executor' in self.index:
+            self.index['executor'].close()
+        if 'corpus' in self.index:
+            self.index['corpus'].close()
+
+    def __run(self):
+        while True:
+            with self.condition:
+                while not self.pending and not self.closed:
+                    self.condition.wait()
+                if not self.pending:
+                    return
+
+                # Wait a little for more queries to join the batch
+                batch_end = time.time() + self.batch_window
+                while len(self.pending) < self.max_batch and not self.closed and time.time() < batch_end:
+                    self.condition.wait(batch_end - time.time())
+                batch = self.pending[:self.max_batch]
+                self.pending = self.pending[self.max_batch:]
+
+            self.__run_batch(batch)
+
+    def __run_batch(self, batch):
+        self.index['postings memo'] = {}
+        batch_times = []
+        if self.shards is None and len(batch) > 1:
+            try:
+                batch_times = search.score_first_passes([request.query_file for key, request in batch], self.dictionary_file, self.postings_file,
+                                                        self.patent_info_file, self.duplicates_file, self.index)
+            except Exception:
+                # Every search then scores its own first pass, and reports its own errors
+                self.index['first passes'] = None
+        for key, request in batch:
+            # The stages of the batch count for each of its searches
+            request.stage_times.extend(batch_times)
+            try:
+                request.scores, truncated = search.run_search(request.query_file, self.dictionary_file, self.postings_file, request.output_files[0],
+                                                              self.patent_info_file, None, None, self.ipc_profile_file, None, self.cache, request.stage_times,
+                                                              shards=self.shards, duplicates_file=self.duplicates_file, index=self.index)
+            except Exception, e:
+                request.error = e
+
+            # Callers with the same query may still join until the request is removed
+            with self.condition:
+                del self.in_flight[key]
+            if request.error is None:
+                for output_file in request.output_files[1:]:
+                    search.write_to_output_file(output_file, request.scores)
+            request.done.set()
+        self.index['postings memo'] = None
+        self.index['first passes'] = None
+        self.batches += 1
+        self.searches += len(batch)
+
+class _Request:
+    '''
+        A query waiting for its results, and the output files of all the callers sharing it
+    '''
+
+    def __init__(self, query_file, output_file):
+        self.query_file = query_file
+        self.output_files = [output_file]
+        self.done = threading.Event()
+        self.scores = None
+        self.error = None
+        self.stage_times = []
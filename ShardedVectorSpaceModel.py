@@ -0,0 +1,176 @@
+import os
+import heapq
+import itertools
+import threading
+import multiprocessing
+import tracing
+
+def shard_file(path, shard):
+    """
+    Name of the file of the given shard for an index file, e.g. postings.txt -> postings.2.txt
+    """
+    root, extension = os.path.splitext(path)
+    return '%s.%d%s' % (root, shard, extension)
+
+class ShardedVectorSpaceModel:
+    '''
+        Vector Space Model over a document-partitioned index (see index.py -n).
+
+        Every shard is served by a local worker process that loads the dictionary, line
+        positions and document lengths of its shard once. Queries are scattered to all the
+        workers, which score their own documents, and their rankings are merged into one.
+
+        The dictionaries of all shards contain the whole vocabulary with the document
+        frequencies of the whole corpus, and the number of documents n is the sum over the
+        shards, so every document gets the score it would get in the unsharded index.
+
+        The object can be used where a VectorSpaceModel is expected. The length_vector and
+        last_line_pos arguments of its methods are ignored, since the workers use their own.
+
+        The document filter is sent to a worker only when it changes (usually once per search,
+        and once more for the candidates of two-phase retrieval), as a bitmap over the sorted
+        documents of its shard, and the worker keeps it for the following requests.
+    '''
+
+    def __init__(self, dictionary_file, postings_file, shards, top_k=None):
+        """
+        Start one worker per shard and wait until all of them have loaded their shard.
+
+        Arguments:
+            dictionary_file     dictionary file name given to index.py, without the shard number
+            postings_file       postings file name given to index.py, without the shard number
+            top_k               if not None, the number of documents each shard returns per query,
+                                and the length of the merged rankings
+        """
+        self.top_k = top_k
+        # Set of documents allowed by the metadata filters of the search, see VectorSpaceModel
+        self.document_filter = None
+        # The filter the workers hold, and the sorted documents of every shard to build its bitmaps
+        self.sent_filter = None
+        self.shard_documents = []
+        # Requests from concurrent stages (see StageExecutor.py) take turns on the pipes
+        self.lock = threading.Lock()
+        self.workers = []
+        for shard in xrange(shards):
+            connection, worker_connection = multiprocessing.Pipe()
+            worker = multiprocessing.Process(target=_serve_shard, args=(
+                shard_file(dictionary_file, shard), shard_file(postings_file, shard), worker_connection))
+            worker.daemon = True
+            worker.start()
+            self.workers.append((worker, connection))
+
+        self.n = 0
+        for worker, connection in self.workers:
+            n, documents = connection.recv()
+            self.n += n
+            self.shard_documents.append(documents)
+
+    def get_scores(self, query, last_line_pos, length_vector, n):
+        scores, truncated = self.__scatter('scores', query, n, None)
+        return scores
+
+    def get_scores_before(self, query, last_line_pos, length_vector, n, deadline):
+        return self.__scatter('scores', query, n, deadline)
+
+    def get_phrasal_score(self, phrase, last_line_pos, length_vector, n, weight=1.0, length_weighted=False):
+        scores, truncated = self.__scatter('phrasal', phrase, n, weight, length_weighted)
+        return scores
+
+    def get_proximity_scores(self, phrases, last_line_pos, length_vector, n, weight=1.0, length_weighted=False, window=10):
+        scores, truncated = self.__scatter('proximity', phrases, n, weight, length_weighted, window)
+        return scores
+
+    def close(self):
+        """
+        Stop the workers
+        """
+        for worker, connection in self.workers:
+            connection.send(None)
+            connection.close()
+        for worker, connection in self.workers:
+            worker.join()
+        self.workers = []
+
+    def __scatter(self, *request):
+        """
+        Send request to all the workers, then gather and merge their rankings
+
+        Returns:
+            scores      merged list of tuples with document names and scores ordered by decreasing score
+            truncated   True if any shard was truncated by a deadline
+        """
+        with self.lock:
+            if self.document_filter is not self.sent_filter:
+                for (worker, connection), documents in zip(self.workers, self.shard_documents):
+                    connection.send(('filter', filter_bitmap(documents, self.document_filter)))
+                self.sent_filter = self.document_filter
+            for worker, connection in self.workers:
+                connection.send((request, self.top_k))
+
+            rankings = []
+            truncated = False
+            for worker, connection in self.workers:
+                scores, shard_truncated, counters = connection.recv()
+                rankings.append([(-score, doc) for doc, score in scores])
+                truncated = truncated or shard_truncated
+                for counter, amount in counters.iteritems():
+                    tracing.count(counter, amount)
+
+        merged = ((doc, -score) for score, doc in heapq.merge(*rankings))
+        return (list(itertools.islice(merged, self.top_k)), truncated)
+
+def filter_bitmap(documents, document_filter):
+    """
+    Encode the documents of a shard (sorted list of names) allowed by document_filter (a set,
+    or None for all of them) as a bitmap string, bit i for documents[i], or None if there is
+    no filter
+    """
+    if document_filter is None:
+        return None
+    bits = bytearray((len(documents) + 7) / 8)
+    for i, doc in enumerate(documents):
+        if doc in document_filter:
+            bits[i >> 3] |= 1 << (i & 7)
+    return str(bits)
+
+def _serve_shard(dictionary_file, postings_file, connection):
+    """
+    Main loop of a shard worker: answer scoring requests until None is received
+    """
+    import search
+    from VectorSpaceModel import VectorSpaceModel
+
+    dictionary, training_path = search.read_dict(dictionary_file)
+    line_positions, last_line_pos = search.get_line_positions(postings_file)
+    length_vector, n = search.get_length_vector(postings_file, last_line_pos)
+    VSM = VectorSpaceModel(dictionary, postings_file, line_positions)
+    documents = sorted(length_vector)
+    connection.send((n, documents))
+
+    while True:
+        message = connection.recv()
+        if message is None:
+            break
+        if message[0] == 'filter':
+            bits = message[1]
+            VSM.document_filter = None if bits is None else set([doc for i, doc in enumerate(documents) if ord(bits[i >> 3]) & (1 << (i & 7))])
+            continue
+        request, top_k = message
+
+        trace = tracing.begin(None)
+        if request[0] == 'scores':
+            kind, query, n, deadline = request
+            scores, truncated = VSM.get_scores_before(query, last_line_pos, length_vector, n, deadline)
+        elif request[0] == 'proximity':
+            kind, phrases, n, weight, length_weighted, window = request
+            scores = VSM.get_proximity_scores(phrases, last_line_pos, length_vector, n, weight, length_weighted, window)
+            truncated = False
+        else:
+            kind, phrase, n, weight, length_weighted = request
+            scores = VSM.get_phrasal_score(phrase, last_line_pos, length_vector, n, weight, length_weighted)
+            truncated = False
+        tracing.end()
+
+        counters = dict([(counter, sum([stage[counter] for stage in trace.stages])) for counter in tracing.COUNTERS])
+        connection.send((scores[:top_k], truncated, counters))
+    connection.close()
@@ -0,0 +1,117 @@
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+import tracing
+
+# Function and shared state of the items mapped on the process pool. They are set before the
+# workers are forked, so that the workers inherit them instead of receiving them pickled.
+_process_work = None
+
+class StageExecutor:
+    '''
+        Runs independent stages of one search concurrently.
+
+        Stages that mostly wait on the disk (loading index structures, reading postings lists)
+        go to a pool of threads, which release the GIL while they wait. Phrase evaluations,
+        which spend their time decoding and intersecting positional postings, hold the GIL:
+        they go to a pool of processes forked from the search process, which share the
+        loaded index copy-on-write. Without processes, they are spread over the threads.
+
+        The counters (see tracing.py) of the work done for a task are handed back with its
+        result, so that the caller attributes them to its own stage. With no threads and no
+        processes, every task runs in the calling thread when it is submitted.
+    '''
+
+    def __init__(self, threads=0, processes=0):
+        self.threads = threads
+        self.processes = processes
+        self.thread_pool = None
+
+    def submit(self, function, *args):
+        """
+        Start function(*args) on the thread pool
+
+        Returns:
+            a task; its result() waits for the result of the function
+        """
+        if self.threads == 0:
+            return _Task(_collect(function, args))
+        return _Task(self.__get_thread_pool().apply_async(_collect, (function, args)))
+
+    def map(self, function, state, items):
+        """
+        Start function(state, item) for every item, on the process pool if there is one,
+        otherwise on the thread pool. Call it before submit, so that no thread of the pool
+        is running when the processes are forked.
+
+        Returns:
+            a task; its result() waits for the list of the results, in the order of items
+        """
+        if self.processes > 0 and len(items) > 1:
+            global _process_work
+            _process_work = (function, state)
+            pool = multiprocessing.Pool(min(self.processes, len(items)))
+            _process_work = None
+            task = _Task(pool.map_async(_run_in_process, items), list, pool)
+            pool.close()
+            return task
+        if self.threads > 0 and len(items) > 1:
+            thread_pool = self.__get_thread_pool()
+            return _Task([thread_pool.apply_async(_collect, (function, (state, item))) for item in items], list)
+        return _Task([_collect(function, (state, item)) for item in items], list)
+
+    def close(self):
+        """
+        Stop the thread pool
+        """
+        if self.thread_pool is not None:
+            self.thread_pool.close()
+            self.thread_pool.join()
+            self.thread_pool = None
+
+    def __get_thread_pool(self):
+        if self.thread_pool is None:
+            self.thread_pool = ThreadPool(self.threads)
+        return self.thread_pool
+
+class _Task:
+    '''
+        A task started by a StageExecutor. pending is an AsyncResult, a list of them, or an
+        already computed result, each of them holding (result, counters). pool is the process
+        pool to wait for once the result is in.
+    '''
+
+    def __init__(self, pending, kind=None, pool=None):
+        self.pending = pending
+        self.kind = kind
+        self.pool = pool
+
+    def result(self):
+        """
+        Wait for the result of the task and add the counters of its work to the current stage
+        """
+        pending = self.pending
+        if hasattr(pending, 'get'):
+            pending = pending.get()
+        if self.pool is not None:
+            self.pool.join()
+            self.pool = None
+        if self.kind is list:
+            outcomes = [outcome.get() if hasattr(outcome, 'get') else outcome for outcome in pending]
+        else:
+            outcomes = [pending]
+        for result, counters in outcomes:
+            for counter, amount in counters.iteritems():
+                tracing.count(counter, amount)
+        if self.kind is list:
+            return [result for result, counters in outcomes]
+        return outcomes[0][0]
+
+def _collect(function, args):
+    counters = {}
+    with tracing.collect(counters):
+        result = function(*args)
+    return (result, counters)
+
+def _run_in_process(item):
+    function, state = _process_work
+    return _collect(function, (state, item))
@@ -1,6 +1,10 @@
 import math
+import heapq
 import operator
-import phrasal_queries
+import time
+import tracing
+from itertools import izip
+from Postings import Postings, DocumentTable
 
 class VectorSpaceModel:
     '''
@@ -11,15 +15,45 @@ class VectorSpaceModel:
         self.dictionary = dictionary
         self.postings_file = postings_file
         self.line_positions = line_positions
+        # If not None, a dictionary (term, positional) -> postings list in which the fetched
+        # postings are kept, so that queries scored together read every list once
+        self.postings_memo = None
+        # If not None, the set of documents allowed by the metadata filters of the search
+        # (see DocumentFilters.py). Other documents are never scored.
+        self.document_filter = None
+        # If not None, (T, bounds) for a tiered postings file (see index.write_tiered_postings):
+        # the low tier of the term at line L is at line L + T, and bounds[L] is the highest
+        # log tf / document length of that low tier
+        self.tiers = None
+        # With tiers, scoring stops at the high tier once it has scored tier_top_k documents
+        # (None scores both tiers of every term). If tier_exact is True, it only stops when the
+        # low tier bounds show that the top tier_top_k documents cannot change.
+        self.tier_top_k = None
+        self.tier_exact = False
+        # If True, get_scores keeps its accumulators in self.accumulators, a tuple (query
+        # weights, unnormalized scores by document number, postings read, document filter), so
+        # that rescore can score an expansion of the query from them
+        self.keep_accumulators = False
+        self.accumulators = None
+        # DocumentTable numbering the documents of the postings (see Postings.py). Read from the
+        # document lengths line of the postings file when first needed if it is not given.
+        self.documents = None
 
-    def get_phrasal_score(self, phrase, last_line_pos, length_vector, n):
+    def get_phrasal_score(self, phrase, last_line_pos, length_vector, n, weight=1.0, length_weighted=False):
         """
         Run the given phrasal query against the index. Documents that contain the phrase 
         are retrieved, then ranked by treating the phrase as a free-text query (as suggested
         in Manning et al. section 7.2.3)
+
+        The scores are multiplied by weight, and additionally by the length of the phrase
+        if length_weighted is True.
         """
+        import phrasal_queries
         query_terms, query_count = phrasal_queries.process_phrasal(phrase)
-        individual, combined = phrasal_queries.get_phrasal_postings(query_terms, self)
+        # Phrases made only of stop words have nothing to match
+        if len(query_terms) == 0:
+            return []
+        individual, combined = phrasal_queries.get_phrasal_postings(query_terms, self, self.document_filter)
         docs = phrasal_queries.get_documents_with_phrase(query_terms, individual, combined)
         
         # set the tf value for each term
@@ -27,14 +61,76 @@ class VectorSpaceModel:
         for query_term, term_count in query_count.items():
             query_weight[query_term] = 1 + math.log10(term_count)
         
-        scores = self.__calculate_cosine_score(query_weight, length_vector, n, filter=docs)
+        scores, truncated = self.__calculate_cosine_score(query_weight, length_vector, n, filter=docs)
         
         # Fred: Intuitively, I feel like the scores from phrasal queries should be higher
         # than simple tf-idf but I don't really know what the best way would be. Multiplying
         # by the length of the query seems like an okay compromise.
-        weighted_scores = [(doc, len(phrase) * score) for doc, score in scores]
+        if length_weighted:
+            weight *= len(phrase)
+        if weight != 1.0:
+            scores = [(doc, weight * score) for doc, score in scores]
         return scores
     
+    def get_proximity_scores(self, phrases, last_line_pos, length_vector, n, weight=1.0, length_weighted=False, window=10):
+        """
+        Score all the given phrasal queries in a single pass over the positional postings of
+        their terms, instead of running each of them with get_phrasal_score.
+
+        The positional postings of every distinct term of the phrases are read once. In every
+        document holding all the terms of a phrase, each pair of consecutive terms of the phrase
+        gets a proximity from their positions (see phrasal_queries.pair_proximity): 1 if the
+        second term directly follows the first, less the further apart they are. The document
+        scores the cosine score of the phrase, as in get_phrasal_score, times the mean proximity
+        of the pairs: an exact match scores about what the phrasal query gives it, and near
+        matches, which the phrasal query misses, get part of it.
+
+        Returns:
+            list of tuples (document, score summed over the phrases) ordered by decreasing score
+        """
+        import phrasal_queries
+        processed = []
+        for phrase in phrases:
+            query_terms, query_count = phrasal_queries.process_phrasal(phrase)
+            if len(query_terms) > 0:
+                processed.append((phrase, query_terms, query_count))
+
+        # Each postings list is read once
+        postings = {}
+        for phrase, query_terms, query_count in processed:
+            for query_term in query_count:
+                if query_term not in postings:
+                    postings[query_term] = self.get_postings(query_term, True, self.document_filter)
+
+        scores = {}
+        for phrase, query_terms, query_count in processed:
+            query_weights = self.__get_query_weights(dict([(query_term, 1 + math.log10(term_count)) for query_term, term_count in query_count.items()]), n)
+            length_query = self.__get_length_query(query_weights)
+            if length_query == 0:
+                continue
+            phrase_weight = weight * len(phrase) if length_weighted else weight
+            pairs = zip(query_terms, query_terms[1:])
+            # The documents of the shortest list are looked up in the others
+            cursors = dict([(query_term, postings[query_term].cursor()) for query_term, weight_query in query_weights])
+            shortest = min(cursors.values(), key=lambda cursor: len(cursor.postings))
+            while shortest.valid():
+                document = shortest.document()
+                if len([1 for cursor in cursors.itervalues() if cursor.seek(document)]) < len(cursors):
+                    shortest.next()
+                    continue
+                proximity = 1.0
+                if pairs:
+                    proximity = sum([phrasal_queries.pair_proximity(cursors[first].positions(), cursors[second].positions(), window)
+                                     for first, second in pairs]) / len(pairs)
+                if proximity > 0:
+                    doc_name = shortest.name()
+                    score = sum([weight_query * cursors[query_term].weight() for query_term, weight_query in query_weights])
+                    score /= length_vector[doc_name] * length_query
+                    scores[doc_name] = scores.get(doc_name, 0.0) + phrase_weight * proximity * score
+                shortest.next()
+        tracing.count('documents_scored', len(scores))
+        return sorted(scores.items(), key=lambda x: (-x[1], x[0]))
+
     def get_scores(self, query, last_line_pos, length_vector, n):
         """
             public method for calculating scores with the vector space model
@@ -43,10 +139,120 @@ class VectorSpaceModel:
                 scores  list of tuples with document names and scores ordered by decreasing score
         """
         # query_count = self.__process_query(query)
-        scores = self.__calculate_cosine_score(query, length_vector, n)
+        accumulators = {} if self.keep_accumulators else None
+        scores, truncated = self.__calculate_cosine_score(query, length_vector, n, accumulators=accumulators)
+        if accumulators:
+            self.accumulators = (accumulators['weights'], accumulators['scores'], accumulators['postings'], accumulators['filter'])
         return scores
 
-    def __calculate_cosine_score(self, query, length_vector, n, filter=None):
+    def get_batch_scores(self, queries, last_line_pos, length_vector, n):
+        """
+            Score several queries together, as get_scores would score each of them: the postings
+            list of every distinct term of the queries is read and walked once, each posting
+            adding to the scores of all the queries holding the term. Tiered indexes are not
+            supported (their high tier is read per query).
+
+            Return:
+                list with, for every query, a tuple (scores, accumulators): scores as returned
+                by get_scores, and the accumulators get_scores would keep for rescore if
+                keep_accumulators is set (None otherwise)
+        """
+        if self.tiers is not None:
+            raise RuntimeError, 'VectorSpaceModel: batch scoring does not support tiered indexes'
+        filter = self.document_filter
+        numbers = self.__document_numbers(filter)
+        all_weights = [self.__get_query_weights(query, n) for query in queries]
+        all_scores = [{} for query in queries]
+        # term -> list of (scores of a query holding the term, weight of the term in that query)
+        targets = {}
+        for query_weights, scores in zip(all_weights, all_scores):
+            for query_term, weight_query in query_weights:
+                targets.setdefault(query_term, []).append((scores, weight_query))
+
+        postings = {}
+        for query_term, term_targets in targets.iteritems():
+            term_postings = self.get_postings(query_term, positional=False, documents=filter)
+            postings[query_term] = term_postings
+            for document, tf in izip(term_postings.documents, term_postings.weights):
+                if numbers is not None and document not in numbers:
+                    continue
+                for scores, weight_query in term_targets:
+                    if document in scores:
+                        scores[document] += tf * weight_query
+                    else:
+                        scores[document] = tf * weight_query
+
+        results = []
+        for query_weights, scores in zip(all_weights, all_scores):
+            accumulators = None
+            if self.keep_accumulators:
+                accumulators = (dict(query_weights), scores.copy(), dict([(query_term, postings[query_term]) for query_term, weight_query in query_weights]), filter)
+            results.append((self.__normalize(scores, query_weights, length_vector), accumulators))
+        return results
+
+    def rescore(self, query, last_line_pos, length_vector, n):
+        """
+            Score a query expanding the one last scored by get_scores with keep_accumulators set
+            (e.g. by pseudo-relevance feedback) from the accumulators of that first pass: the
+            scores are adjusted by the change in weight of every term, using the postings kept
+            from the first pass for the terms of the original query and reading only those of
+            the new terms, then normalized with the length of the new query. The ranking is
+            the one get_scores would return. If there are no accumulators, if a term of the
+            original query was dropped, or if the document filter grew since the first pass,
+            the query is scored from scratch.
+
+            Return:
+                scores  list of tuples with document names and scores ordered by decreasing score
+        """
+        filter = self.document_filter
+        if self.accumulators is None:
+            return self.get_scores(query, last_line_pos, length_vector, n)
+        first_weights, first_scores, first_postings, first_filter = self.accumulators
+        query_weights = self.__get_query_weights(query, n)
+        weights = dict(query_weights)
+        if [term for term, weight in first_weights.iteritems() if weight != 0 and weights.get(term, 0) == 0] or \
+                (first_filter is not None and (filter is None or not filter <= first_filter)):
+            return self.get_scores(query, last_line_pos, length_vector, n)
+
+        numbers = self.__document_numbers(filter)
+        if filter is None or filter is first_filter:
+            scores = first_scores.copy()
+        else:
+            scores = dict([(document, score) for document, score in first_scores.iteritems() if document in numbers])
+        for query_term, weight_query in query_weights:
+            delta = weight_query - first_weights.get(query_term, 0)
+            if delta == 0:
+                continue
+            if query_term in first_postings:
+                term_postings = first_postings[query_term]
+            else:
+                term_postings = self.get_postings(query_term, positional=False, documents=filter)
+            for document, tf in izip(term_postings.documents, term_postings.weights):
+                if numbers is not None and document not in numbers:
+                    continue
+                if document in scores:
+                    scores[document] += tf * delta
+                else:
+                    scores[document] = tf * delta
+        return self.__normalize(scores, query_weights, length_vector)
+
+    def get_scores_before(self, query, last_line_pos, length_vector, n, deadline):
+        """
+            public method for calculating scores with the vector space model within a deadline.
+            Query terms are processed in decreasing order of their weight (tf.idf), so that the
+            terms with the biggest impact on the ranking are scored first. Once the deadline
+            has passed, the remaining terms are skipped; the first term is scored whatever the time.
+
+            Arguments:
+                deadline    absolute time (as returned by time.time()) by which scoring should stop
+
+            Return:
+                scores      list of tuples with document names and scores ordered by decreasing score
+                truncated   True if some query terms were skipped because of the deadline
+        """
+        return self.__calculate_cosine_score(query, length_vector, n, deadline=deadline)
+
+    def __calculate_cosine_score(self, query, length_vector, n, filter=None, deadline=None, accumulators=None):
         """
         computes the cosine scores for a query and all given documents and returns the scores for relevant documents
 
@@ -56,42 +262,142 @@ class VectorSpaceModel:
             n               the number of documents in the training data
             filter          if not None, a set containing documents to contain scores for. All other documents are ignored.
                             Note that if a document in filter would have a score of zero, it will not appear in the output.
+            deadline        if not None, the time (as returned by time.time()) after which no more query terms are scored.
+                            The term with the highest weight is always scored, so the ranking is never empty.
+            accumulators    if not None, a dictionary which receives the query weights, the unnormalized scores,
+                            the postings read and the filter, unless the scoring stopped early (tiers or deadline)
 
         Returns:
             ordered_scores  list of tuples with document names and scores for relevant documents ordered by decreasing score
+            truncated       True if query terms were skipped because the deadline passed
         """
 
-        scores = {}
-        length_query = 0
+        truncated = False
+        if filter is None:
+            filter = self.document_filter
+        elif self.document_filter is not None:
+            filter = filter & self.document_filter
+
+        query_weights = self.__get_query_weights(query, n)
+        numbers = self.__document_numbers(filter)
 
-        for query_term, term_tf in query.items():
-            weight_query = self.__get_weight_query_term(query_term, term_tf, n)
+        if self.tiers is not None and self.tier_top_k is not None and deadline is None:
+            length_query = self.__get_length_query(query_weights)
+            scores = self.__accumulate(query_weights, filter, numbers, 0)
+            if not self.__high_tier_suffices(scores, query_weights, length_vector, length_query):
+                scores = self.__accumulate(query_weights, filter, numbers, 1, scores)
+        else:
+            scores = {}
+            postings = {} if accumulators is not None else None
+            for i, (query_term, weight_query) in enumerate(query_weights):
+                if i > 0 and deadline is not None and time.time() >= deadline:
+                    truncated = True
+                    break
+                self.__accumulate([(query_term, weight_query)], filter, numbers, None, scores, postings)
+            if accumulators is not None and not truncated:
+                accumulators['weights'] = dict(query_weights)
+                accumulators['scores'] = scores.copy()
+                accumulators['postings'] = postings
+                accumulators['filter'] = filter
+
+        return (self.__normalize(scores, query_weights, length_vector), truncated)
+
+    def __get_query_weights(self, query, n):
+        """
+        Return the (term, tf.idf weight) pairs of the query, the terms with the highest impact
+        first, so that a deadline cuts off the least useful ones
+        """
+        query_weights = [(query_term, self.__get_weight_query_term(query_term, term_tf, n)) for query_term, term_tf in query.items()]
+        query_weights.sort(key=operator.itemgetter(1), reverse=True)
+        return query_weights
+
+    def __get_length_query(self, query_weights):
+        length_query = 0
+        for query_term, weight_query in query_weights:
             length_query += math.pow(weight_query, 2)
-            term_postings = self.get_postings(query_term, positional=False)
-            all_relevant_documents = []
+        return math.sqrt(length_query)
+
+    def __normalize(self, scores, query_weights, length_vector):
+        """
+        Normalize the accumulated scores by the lengths of the documents and of the query, and
+        return them ordered by decreasing score
+        """
+        length_query = self.__get_length_query(query_weights)
+        names = self.documents.names if scores else None
+        normalized = [(names[document], score / (length_vector[names[document]] * length_query))
+                      for document, score in scores.iteritems()]
+        tracing.count('documents_scored', len(scores))
+
+        # score_list = [x[0] for x in sorted(scores.items(), key=operator.itemgetter(1), reverse=True)]
+        # Ties are broken by document name, so that the ranking does not depend on the order
+        # of the postings (and a sharded index ranks documents the same way)
+        return sorted(normalized, key=lambda x: (-x[1], x[0]))
 
-            for (doc_name, tf) in term_postings:
-                # Ignore any documents not in the filter set
-                if filter is not None and doc_name not in filter:
+    def __accumulate(self, query_weights, filter, numbers, tier, scores=None, postings=None):
+        """
+        Add the unnormalized scores of the given (term, weight) pairs, read from the postings
+        of the given tier, to scores, keyed by document number, and return it. numbers holds
+        the numbers of the documents of filter. The postings lists read are added to postings
+        if it is not None.
+        """
+        if scores is None:
+            scores = {}
+        for query_term, weight_query in query_weights:
+            term_postings = self.get_postings(query_term, positional=False, documents=filter, tier=tier)
+            if postings is not None:
+                postings[query_term] = term_postings
+
+            # The arrays of the list are walked directly, without building a tuple per posting
+            for document, tf in izip(term_postings.documents, term_postings.weights):
+                # Ignore any documents not in the filter set (memoized lists are not filtered)
+                if numbers is not None and document not in numbers:
                     continue
-            
-                all_relevant_documents.append(doc_name)
-                weight_d_t = float(tf)
-                if doc_name in scores.keys():
-                    scores[doc_name] += weight_d_t * weight_query
+                if document in scores:
+                    scores[document] += tf * weight_query
                 else:
-                    scores[doc_name] = weight_d_t * weight_query
-        
-        length_query = math.sqrt(length_query)
+                    scores[document] = tf * weight_query
+        return scores
 
-        for doc_name in all_relevant_documents:
-            scores[doc_name] = scores[doc_name]/(length_vector[doc_name]*length_query)
+    def __document_numbers(self, documents):
+        """
+        Return the set of the numbers (see DocumentTable) of a set of document names, or None
+        if documents is None
+        """
+        if documents is None:
+            return None
+        if self.documents is None:
+            self.documents = self.__read_documents()
+        numbers = self.documents.numbers
+        return set([numbers[doc_name] for doc_name in documents if doc_name in numbers])
 
-        # score_list = [x[0] for x in sorted(scores.items(), key=operator.itemgetter(1), reverse=True)]
-        ordered_scores = sorted(scores.items(), key=operator.itemgetter(1), reverse=True);
-        return ordered_scores
+    def __high_tier_suffices(self, scores, query_weights, length_vector, length_query):
+        """
+        Check whether the high tier yields enough documents to skip the low tier (Manning et al.
+        section 7.2.1). With tier_exact, the top tier_top_k documents of the high tier must also
+        be the top documents overall: no document of the low tier can score more than the bound
+        of the query terms, so if the k-th high tier score reaches it, the low tier cannot change
+        the top k.
+        """
+        if len(scores) < self.tier_top_k or length_query == 0:
+            return False
+        if not self.tier_exact:
+            tracing.count('low_tier_skipped')
+            return True
+        T, bounds = self.tiers
+        bound = 0.0
+        for query_term, weight_query in query_weights:
+            if query_term in self.dictionary:
+                bound += weight_query * bounds[int(self.dictionary[query_term][1])]
+        bound /= length_query
+        names = self.documents.names
+        kth = heapq.nlargest(self.tier_top_k, [score / length_vector[names[document]] for document, score in scores.iteritems()])[-1] / length_query
+        # Allow for rounding in the bounds written to the index
+        if kth < bound * (1 + 1e-9):
+            return False
+        tracing.count('low_tier_skipped')
+        return True
 
-    def get_postings(self, word, positional):
+    def get_postings(self, word, positional, documents=None, tier=None):
         """
         looks up a word in the given dictionary 
         and returns all postings that belong to that word
@@ -99,41 +405,77 @@ class VectorSpaceModel:
         Arguments:
             word            term that is meant to be look up
             positional      whether the postings should include positional information.
+            documents       if not None, a set of documents: the postings of other documents may
+                            be skipped without being decoded
+            tier            with a tiered index, 0 for the high tier only, 1 for the low tier only,
+                            or None for both (merged, so that the postings stay sorted by document)
 
         Returns:
-            if positional is False:
-                list of tuples (doc_name, tf) corresponding to the word
-            Otherwise;
-                list of tuples (doc_name, tf, positions) corresponding to the word
-                where 'positions' is a list of integers where the 
+            the postings of the word, as a Postings object (see Postings.py), sorted by document.
+            Iterating over it gives tuples (doc_name, tf) if positional is False, otherwise
+            (doc_name, tf, positions), positions being an array of the positions of the word
+            in the document.
         """
 
+        memo = self.postings_memo
+        if memo is not None and (word, positional, tier) in memo:
+            return memo[(word, positional, tier)]
+
+        if self.documents is None:
+            self.documents = self.__read_documents()
+
         # dictionary contains word
-        if word in self.dictionary.keys():
+        if word in self.dictionary:
             (freq, postings_line) = self.dictionary[word]
+            if self.tiers is not None and tier is None:
+                doc_tf_list = Postings.merge(self.get_postings(word, positional, documents, 0),
+                                             self.get_postings(word, positional, documents, 1))
+                if memo is not None and documents is None:
+                    memo[(word, positional, tier)] = doc_tf_list
+                return doc_tf_list
+            postings_line = int(postings_line)
+            if tier == 1:
+                postings_line += self.tiers[0]
             f = open(self.postings_file, 'r')
-            f.seek(self.line_positions[int(postings_line)])
-            postings_list = f.readline().split()
-            doc_tf_list = []
+            f.seek(self.line_positions[postings_line])
+            line = f.readline()
+            tracing.count('postings_lists')
+            tracing.count('postings_bytes', len(line))
+            postings_list = line.split()
+            doc_tf_list = Postings(self.documents, positional)
+            numbers = self.documents.numbers
             count = 0
             while count < len(postings_list):
                 doc_name = postings_list[count]
                 tf = postings_list[count+1]
                 num_positions = int(postings_list[count+2])
-                if not positional:
-                    doc_tf_list.append( ( doc_name, float(tf) ) )
+                if documents is not None and doc_name not in documents:
+                    count += 3 + num_positions
+                elif not positional:
+                    doc_tf_list.append(numbers[doc_name], float(tf))
                     count += 3 + num_positions
                 else:
                     count += 3
-                    positions = [int(p) for p in postings_list[count:(count + num_positions)]]
-                    doc_tf_list.append((doc_name, float(tf), positions))
+                    doc_tf_list.append(numbers[doc_name], float(tf), [int(p) for p in postings_list[count:(count + num_positions)]])
                     count += num_positions
                         
             f.close()
+            if memo is not None and documents is None:
+                memo[(word, positional, tier)] = doc_tf_list
             return doc_tf_list
         # dictionary does not contain word
         else:
-            return []
+            return Postings(self.documents, positional)
+
+    def __read_documents(self):
+        """
+        Number the documents of the document lengths line, the last line of the postings file
+        """
+        f = open(self.postings_file, 'r')
+        f.seek(self.line_positions[-1])
+        fields = f.readline().split()
+        f.close()
+        return DocumentTable(fields[0::2])
 
     def __get_weight_query_term(self, term, term_tf, n):
         """
@@ -152,7 +494,7 @@ class VectorSpaceModel:
         # calculate tf in query
         # log_tf = 1 + math.log10(term_count)
 
-        if term in self.dictionary.keys():
+        if term in self.dictionary:
             (freq, postings_line) = self.dictionary[term]
             # calculate idf
             idf = math.log10(float(n)/float(freq))
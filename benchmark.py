@@ -0,0 +1,161 @@
+#!/usr/bin/python
+import sys
+import getopt
+import os
+import time
+import json
+import resource
+import subprocess
+import socket
+
+def benchmark_indexing(corpus_path, work_path):
+    """
+    Build an index of corpus_path in work_path with index.py, in a child process so that
+    its peak memory usage can be measured on its own.
+
+    Returns:
+        dictionary with the number of documents, the time taken, documents per second
+        and the peak resident set size of the indexer in kilobytes
+    """
+    command = [sys.executable, 'index.py', '-i', corpus_path,
+               '-d', os.path.join(work_path, 'dictionary.txt'),
+               '-p', os.path.join(work_path, 'postings.txt'),
+               '-q', os.path.join(work_path, 'patent_info.txt'),
+               '-c', os.path.join(work_path, 'ipc_profiles.txt'),
+               '-f', os.path.join(work_path, 'filters.txt'),
+               '-u', os.path.join(work_path, 'duplicates.txt')]
+
+    start = time.time()
+    subprocess.check_call(command)
+    seconds = time.time() - start
+
+    # The patent info file has one line per patent indexed, whatever the format of the corpus
+    f = open(os.path.join(work_path, 'patent_info.txt'), 'r')
+    num_docs = sum([1 for line in f])
+    f.close()
+
+    return {
+        'documents': num_docs,
+        'seconds': seconds,
+        'docs_per_sec': num_docs / seconds,
+        # The indexer is the only child process at this point
+        'peak_rss_kb': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    }
+
+def benchmark_search(query_files, work_path, repetitions):
+    """
+    Run every query repetitions times against the index in work_path and collect the
+    time spent in every stage of the search.
+
+    Returns:
+        dictionary of stage name -> summary of its times (see summarize), including a
+        'total' stage for the whole search
+    """
+    import search
+
+    dictionary_file = os.path.join(work_path, 'dictionary.txt')
+    postings_file = os.path.join(work_path, 'postings.txt')
+    patent_info_file = os.path.join(work_path, 'patent_info.txt')
+    ipc_profile_file = os.path.join(work_path, 'ipc_profiles.txt')
+    output_file = os.path.join(work_path, 'output.txt')
+
+    stages = {}
+    for repetition in xrange(repetitions):
+        for query_file in query_files:
+            stage_times = []
+            start = time.time()
+            search.search(query_file, dictionary_file, postings_file, output_file, patent_info_file,
+                          None, None, ipc_profile_file, stage_times=stage_times)
+            stage_times.append(('total', time.time() - start))
+
+            for stage, seconds in stage_times:
+                stages.setdefault(stage, []).append(seconds)
+
+    return dict([(stage, summarize(times)) for stage, times in stages.iteritems()])
+
+def percentile(sorted_values, p):
+    """
+    Nearest-rank percentile of an already sorted list
+    """
+    rank = int(round(p / 100.0 * len(sorted_values) + 0.5)) - 1
+    return sorted_values[max(0, min(len(sorted_values) - 1, rank))]
+
+def summarize(values):
+    values = sorted(values)
+    return {
+        'count': len(values),
+        'mean': sum(values) / len(values),
+        'p50': percentile(values, 50),
+        'p95': percentile(values, 95),
+        'p99': percentile(values, 99),
+    }
+
+def query_files_in(query_path):
+    return [os.path.join(query_path, q) for q in sorted(os.listdir(query_path)) if q.endswith('.xml')]
+
+def run_benchmark(corpus_path, query_path, work_path, repetitions, results_file):
+    """
+    Benchmark indexing and searching, print a summary and append the results as one JSON
+    line to results_file so that runs can be compared over time.
+    """
+    if not corpus_path.endswith('/'):
+        corpus_path += '/'
+    if not os.path.isdir(work_path):
+        os.makedirs(work_path)
+
+    query_files = query_files_in(query_path)
+    result = {
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'host': socket.gethostname(),
+        'corpus': corpus_path,
+        'queries': len(query_files),
+        'repetitions': repetitions,
+    }
+    result['indexing'] = benchmark_indexing(corpus_path, work_path)
+    result['search'] = benchmark_search(query_files, work_path, repetitions)
+
+    f = open(results_file, 'a')
+    f.write(json.dumps(result, sort_keys=True) + '\n')
+    f.close()
+
+    indexing = result['indexing']
+    print 'indexing: %d documents in %.2fs (%.1f docs/s), peak RSS %d KB' % (
+        indexing['documents'], indexing['seconds'], indexing['docs_per_sec'], indexing['peak_rss_kb'])
+    for stage, summary in sorted(result['search'].items()):
+        print 'search: %-20s p50 %.4fs  p95 %.4fs  p99 %.4fs' % (stage, summary['p50'], summary['p95'], summary['p99'])
+
+def usage():
+    print "usage: " + sys.argv[0] + " -i directory-of-documents -q directory-of-queries [-w work-directory] [-r repetitions] [-o results-file]"
+
+
+######################
+# MAIN
+######################
+
+if __name__ == '__main__':
+    corpus_path = "patsnap-corpus/"
+    query_path = "queries/"
+    work_path = "benchmark-index/"
+    repetitions = 5
+    results_file = "benchmark_results.jsonl"
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'i:q:w:r:o:')
+    except getopt.GetoptError, err:
+        usage()
+        sys.exit(2)
+    for o, a in opts:
+        if o == '-i':
+            corpus_path = a
+        elif o == '-q':
+            query_path = a
+        elif o == '-w':
+            work_path = a
+        elif o == '-r':
+            repetitions = int(a)
+        elif o == '-o':
+            results_file = a
+        else:
+            assert False, "unhandled option"
+
+    run_benchmark(corpus_path, query_path, work_path, repetitions, results_file)
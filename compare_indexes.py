@@ -0,0 +1,121 @@
+#!/usr/bin/python
+import sys
+import getopt
+import os
+import search
+import sweep
+
+def compare_indexes(query_path, reference_files, candidate_files, patent_info_file, ipc_profile_file, cutoff, work_path):
+    """
+    Run every query of query_path on a reference index and on a candidate index built from
+    the same corpus (e.g. a pruned one, see index.py -P) and measure how far the rankings of
+    the candidate deviate from those of the reference.
+
+    Arguments:
+        reference_files     tuple (dictionary file, postings file) of the reference index
+        candidate_files     tuple (dictionary file, postings file) of the candidate index
+        cutoff              rank at which the rankings are compared
+
+    Returns:
+        dictionary with the size of both postings files, and per query and on average the
+        share of the top cutoff of the reference found in the top cutoff of the candidate,
+        the symmetric difference of both top cutoff (Carmel et al., 2001: 0 for the same
+        documents, 1 for no document in common) and the average precision on both indexes
+        for the queries with relevance judgments
+    """
+    output_file = os.path.join(work_path, 'compare_output.txt')
+    queries = []
+    for name in sorted(os.listdir(query_path)):
+        base, extension = os.path.splitext(name)
+        if extension != '.xml':
+            continue
+        qrels = os.path.join(query_path, base + '-qrels+ve.txt')
+        relevant = None
+        if os.path.exists(qrels):
+            with open(qrels) as r:
+                relevant = set([l.strip() for l in r.readlines() if l.strip() != ''])
+        queries.append((os.path.join(query_path, name), relevant))
+
+    results = []
+    for query_file, relevant in queries:
+        rankings = []
+        for dictionary_file, postings_file in (reference_files, candidate_files):
+            scores, truncated = search.search(query_file, dictionary_file, postings_file, output_file, patent_info_file,
+                                              None, None, ipc_profile_file)
+            rankings.append([doc for doc, score in scores])
+        reference, candidate = set(rankings[0][:cutoff]), set(rankings[1][:cutoff])
+        result = {
+            'query': query_file,
+            'overlap': len(reference & candidate) / float(max(len(reference), 1)),
+            'symmetric_difference': len(reference ^ candidate) / float(max(len(reference | candidate), 1)),
+        }
+        if relevant is not None:
+            result['ap_reference'] = sweep.average_precision(rankings[0], relevant)
+            result['ap_candidate'] = sweep.average_precision(rankings[1], relevant)
+        results.append(result)
+
+    judged = [result for result in results if 'ap_reference' in result]
+    return {
+        'reference_bytes': os.path.getsize(reference_files[1]),
+        'candidate_bytes': os.path.getsize(candidate_files[1]),
+        'queries': results,
+        'overlap': sum([result['overlap'] for result in results]) / max(len(results), 1),
+        'symmetric_difference': sum([result['symmetric_difference'] for result in results]) / max(len(results), 1),
+        'map_reference': sum([result['ap_reference'] for result in judged]) / max(len(judged), 1),
+        'map_candidate': sum([result['ap_candidate'] for result in judged]) / max(len(judged), 1),
+    }
+
+def print_comparison(comparison, cutoff):
+    print 'postings file: %d bytes -> %d bytes (%.1f%%)' % (comparison['reference_bytes'], comparison['candidate_bytes'],
+                                                             100.0 * comparison['candidate_bytes'] / comparison['reference_bytes'])
+    print '%-30s %-12s %-12s %-10s %-10s' % ('query', 'overlap@%d' % cutoff, 'symdiff@%d' % cutoff, 'AP ref', 'AP cand')
+    for result in comparison['queries']:
+        print '%-30s %-12.4f %-12.4f %-10s %-10s' % (os.path.basename(result['query']), result['overlap'], result['symmetric_difference'],
+                                                     '%.4f' % result['ap_reference'] if 'ap_reference' in result else '-',
+                                                     '%.4f' % result['ap_candidate'] if 'ap_candidate' in result else '-')
+    print '%-30s %-12.4f %-12.4f %-10.4f %-10.4f' % ('mean', comparison['overlap'], comparison['symmetric_difference'],
+                                                     comparison['map_reference'], comparison['map_candidate'])
+
+def usage():
+    print "usage: " + sys.argv[0] + " -r reference-dictionary-file,reference-postings-file -s candidate-dictionary-file,candidate-postings-file [-q directory-of-queries] [-i patent-info-file] [-c ipc-profile-file] [-k cutoff]"
+
+
+######################
+# MAIN
+######################
+
+if __name__ == '__main__':
+    query_path = "queries/"
+    reference_files = None
+    candidate_files = None
+    patent_info_file = "patent_info.txt"
+    ipc_profile_file = "ipc_profiles.txt"
+    cutoff = 50
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'r:s:q:i:c:k:')
+    except getopt.GetoptError, err:
+        usage()
+        sys.exit(2)
+    for o, a in opts:
+        if o == '-r':
+            reference_files = tuple(a.split(','))
+        elif o == '-s':
+            candidate_files = tuple(a.split(','))
+        elif o == '-q':
+            query_path = a
+        elif o == '-i':
+            patent_info_file = a
+        elif o == '-c':
+            ipc_profile_file = a
+        elif o == '-k':
+            cutoff = int(a)
+        else:
+            assert False, "unhandled option"
+
+    if reference_files is None or candidate_files is None:
+        usage()
+        sys.exit(2)
+
+    comparison = compare_indexes(query_path, reference_files, candidate_files, patent_info_file, ipc_profile_file, cutoff, os.getcwd())
+    print_comparison(comparison, cutoff)
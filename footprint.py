@@ -0,0 +1,214 @@
+#!/usr/bin/python
+import sys
+import getopt
+import os
+import gc
+import heapq
+import resource
+import multiprocessing
+from CompactDictionary import CompactDictionary
+import search
+
+def analyze_index(dictionary_file, postings_file, patent_info_file, ipc_profile_file, top):
+    """
+    Report what takes space in the index files.
+
+    Every postings line is of the form "doc tf count positions... doc tf count positions...".
+    The bytes of every line are split between the doc/tf fields (document name, tf and the
+    number of positions, with their separators) and the positions.
+
+    Returns:
+        dictionary with the size of every file, the number of postings lists, the share of
+        the postings taken by positions and by doc/tf fields, the distribution of bytes per
+        postings list and the top terms by size of their postings list
+    """
+    dictionary, training_path = search.read_dict(dictionary_file)
+    terms_by_line = dict([(int(line), term) for term, (df, line) in dictionary.iteritems()])
+    # The tiers of a tiered index are counted as separate postings lists
+    tiers = search.get_tiers(postings_file, search.get_line_positions(postings_file)[0])
+    if tiers is not None:
+        terms_by_line.update([(line + tiers[0], term + ' (low tier)') for line, term in terms_by_line.items()])
+
+    sizes = []
+    largest = []
+    doc_bytes = 0
+    position_bytes = 0
+    f = open(postings_file, 'r')
+    for line_number, line in enumerate(f):
+        if line_number not in terms_by_line:
+            # The last line holds the document lengths, after the tier bounds of a tiered index
+            continue
+        fields = line.split()
+        i = 0
+        while i < len(fields):
+            num_positions = int(fields[i + 2])
+            doc_bytes += len(fields[i]) + len(fields[i + 1]) + len(fields[i + 2]) + 3
+            position_bytes += sum([len(p) + 1 for p in fields[i + 3:i + 3 + num_positions]])
+            i += 3 + num_positions
+        sizes.append(len(line))
+        entry = (len(line), terms_by_line[line_number])
+        if len(largest) < top:
+            heapq.heappush(largest, entry)
+        else:
+            heapq.heappushpop(largest, entry)
+    f.close()
+
+    sizes.sort()
+    files = {}
+    for name, path in [('dictionary', dictionary_file), ('postings', postings_file),
+                       ('patent_info', patent_info_file), ('ipc_profiles', ipc_profile_file)]:
+        files[name] = os.path.getsize(path) if path is not None and os.path.exists(path) else None
+
+    return {
+        'files': files,
+        'compact_dictionary': isinstance(dictionary, CompactDictionary),
+        'postings_lists': len(sizes),
+        'postings_bytes': sum(sizes),
+        'doc_tf_bytes': doc_bytes,
+        'position_bytes': position_bytes,
+        'bytes_per_list': {
+            'mean': sum(sizes) / float(max(1, len(sizes))),
+            'p50': sizes[len(sizes) / 2] if sizes else 0,
+            'p95': sizes[int(len(sizes) * 0.95)] if sizes else 0,
+            'max': sizes[-1] if sizes else 0,
+        },
+        'top_terms': sorted(largest, reverse=True),
+    }
+
+def analyze_memory(dictionary_file, postings_file, patent_info_file):
+    """
+    Measure the memory taken by every structure search() keeps in memory: the growth of the
+    resident set size of the process when loading it and the size of the python objects
+    (as counted by sys.getsizeof, recursively). Every structure is loaded in a fresh child
+    process, so that memory freed by loading one structure is not reused by the next.
+
+    Returns:
+        list of tuples (structure, resident bytes, object bytes). Resident bytes are None
+        where /proc/self/statm is not available.
+    """
+    loaders = [
+        ('dictionary', lambda: search.read_dict(dictionary_file)[0]),
+        ('line_positions', lambda: search.get_line_positions(postings_file)[0]),
+        ('length_vector', lambda: search.get_length_vector(postings_file, last_line_pos)[0]),
+        ('patent_info', lambda: search.get_patent_info(patent_info_file)),
+    ]
+    last_line_pos = search.get_line_positions(postings_file)[1]
+
+    structures = []
+    for name, loader in loaders:
+        queue = multiprocessing.Queue()
+        process = multiprocessing.Process(target=measure_structure, args=(loader, queue))
+        process.start()
+        resident, objects = queue.get()
+        process.join()
+        structures.append((name, resident, objects))
+    return structures
+
+def measure_structure(loader, queue):
+    gc.collect()
+    before = resident_bytes()
+    structure = loader()
+    gc.collect()
+    after = resident_bytes()
+    queue.put((after - before if before is not None else None, object_bytes(structure)))
+
+def resident_bytes():
+    """
+    Current resident set size of the process in bytes, or None if unknown
+    """
+    try:
+        f = open('/proc/self/statm', 'r')
+        resident_pages = int(f.read().split()[1])
+        f.close()
+    except (IOError, IndexError, ValueError):
+        return None
+    return resident_pages * resource.getpagesize()
+
+def object_bytes(o):
+    """
+    Size of a python object and of the objects it holds. A compact dictionary is counted
+    as the size of its memory-mapped file, which is paged in on demand.
+    """
+    if isinstance(o, CompactDictionary):
+        return len(o.data)
+    seen = set()
+    total = 0
+    stack = [o]
+    while stack:
+        o = stack.pop()
+        if id(o) in seen:
+            continue
+        seen.add(id(o))
+        total += sys.getsizeof(o)
+        if isinstance(o, dict):
+            stack.extend(o.keys())
+            stack.extend(o.values())
+        elif isinstance(o, (list, tuple, set, frozenset)):
+            stack.extend(o)
+    return total
+
+def print_report(index, memory):
+    print 'files:'
+    for name, size in sorted(index['files'].items()):
+        print '  %-14s %s' % (name, 'missing' if size is None else format_bytes(size))
+    if index['compact_dictionary']:
+        print '  (compact dictionary)'
+
+    total = max(1, index['doc_tf_bytes'] + index['position_bytes'])
+    print 'postings: %d lists, %s' % (index['postings_lists'], format_bytes(index['postings_bytes']))
+    print '  doc/tf fields  %s (%.1f%%)' % (format_bytes(index['doc_tf_bytes']), 100.0 * index['doc_tf_bytes'] / total)
+    print '  positions      %s (%.1f%%)' % (format_bytes(index['position_bytes']), 100.0 * index['position_bytes'] / total)
+    per_list = index['bytes_per_list']
+    print '  bytes per list mean %.0f, p50 %d, p95 %d, max %d' % (per_list['mean'], per_list['p50'], per_list['p95'], per_list['max'])
+    print 'top terms by postings size:'
+    for size, term in index['top_terms']:
+        print '  %-20s %s' % (term, format_bytes(size))
+
+    print 'in memory (resident, python objects):'
+    for name, resident, objects in memory:
+        print '  %-14s %-12s %s' % (name, 'unknown' if resident is None else format_bytes(resident), format_bytes(objects))
+
+def format_bytes(size):
+    for unit in ['B', 'KB', 'MB']:
+        if abs(size) < 1024:
+            return '%.1f %s' % (size, unit)
+        size /= 1024.0
+    return '%.1f GB' % size
+
+def usage():
+    print "usage: " + sys.argv[0] + " [-d dictionary-file] [-p postings-file] [-i patent-info-file] [-c ipc-profile-file] [-n number-of-top-terms]"
+
+
+######################
+# MAIN
+######################
+
+if __name__ == '__main__':
+    dictionary_file = "dictionary.txt"
+    postings_file = "postings.txt"
+    patent_info_file = "patent_info.txt"
+    ipc_profile_file = "ipc_profiles.txt"
+    top = 20
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'd:p:i:c:n:')
+    except getopt.GetoptError, err:
+        usage()
+        sys.exit(2)
+    for o, a in opts:
+        if o == '-d':
+            dictionary_file = a
+        elif o == '-p':
+            postings_file = a
+        elif o == '-i':
+            patent_info_file = a
+        elif o == '-c':
+            ipc_profile_file = a
+        elif o == '-n':
+            top = int(a)
+        else:
+            assert False, "unhandled option"
+
+    memory = analyze_memory(dictionary_file, postings_file, patent_info_file)
+    index = analyze_index(dictionary_file, postings_file, patent_info_file, ipc_profile_file, top)
+    print_report(index, memory)
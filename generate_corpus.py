@@ -0,0 +1,192 @@
+#!/usr/bin/python
+import sys
+import getopt
+import os
+import re
+import random
+import bisect
+from array import array
+from collections import Counter
+import xml.etree.ElementTree as et
+from xml.sax.saxutils import escape
+
+SYLLABLES = ['ba', 'co', 'di', 'fe', 'gu', 'ha', 'ki', 'lo', 'mu', 'ne', 'po', 'ra', 'si', 'tu', 've', 'xo', 'zy',
+             'tra', 'str', 'pho', 'cel', 'mer', 'ion', 'ate', 'ent', 'ous', 'ive', 'yl', 'ox', 'ine']
+
+def generate_corpus(source_path, output_path, scale, num_queries, seed=3245, zipf_exponent=1.0):
+    """
+    Generate a synthetic patent corpus scale times as large as the corpus at source_path.
+
+    The generated patents have the same XML schema as the source corpus. Their metadata
+    (IPC, year, citations, ...) is copied from randomly chosen source patents, and their
+    title and abstract are drawn from a Zipfian distribution over a vocabulary made of the
+    source words (in decreasing order of frequency) followed by synthetic words. The
+    vocabulary grows with the square root of the scale (Heaps' law), and title and abstract
+    lengths follow the source corpus.
+
+    The patents are written to <output_path>/corpus and num_queries query files, built from
+    the text of random generated patents, to <output_path>/queries.
+    """
+    rng = random.Random(seed)
+    word_counts, title_lengths, abstract_lengths, metadata = read_source_corpus(source_path)
+
+    real_words = [word for word, count in word_counts.most_common()]
+    vocabulary = real_words + synthetic_words(int(len(real_words) * (scale ** 0.5)) - len(real_words), set(real_words), rng)
+    sampler = ZipfSampler(len(vocabulary), zipf_exponent, rng)
+
+    corpus_path = os.path.join(output_path, 'corpus')
+    query_path = os.path.join(output_path, 'queries')
+    for path in [corpus_path, query_path]:
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+    num_patents = int(len(metadata) * scale)
+    query_patents = set(rng.sample(xrange(num_patents), min(num_queries, num_patents)))
+    query_number = 0
+    for i in xrange(num_patents):
+        title = [vocabulary[sampler.sample()] for _ in xrange(rng.choice(title_lengths))]
+        abstract = [vocabulary[sampler.sample()] for _ in xrange(rng.choice(abstract_lengths))]
+        pat_id = 'SYN%08dA1' % i
+        write_patent(os.path.join(corpus_path, pat_id + '.xml'), pat_id, title, abstract, rng.choice(metadata))
+
+        if i in query_patents:
+            query_number += 1
+            start = rng.randint(0, max(0, len(abstract) - 25))
+            write_query(os.path.join(query_path, 'q%d.xml' % query_number), title[:6], abstract[start:start + 25])
+
+    return num_patents
+
+def read_source_corpus(source_path):
+    """
+    Collect the statistics of the source corpus needed to imitate it.
+
+    Returns:
+        word_counts         Counter of the lowercased words of the titles and abstracts
+        title_lengths       list of the number of words of every title
+        abstract_lengths    list of the number of words of every abstract
+        metadata            list of the (name, text) fields of every patent, except title and abstract
+    """
+    word_counts = Counter()
+    title_lengths = []
+    abstract_lengths = []
+    metadata = []
+    for pat in sorted(os.listdir(source_path)):
+        root = et.parse(os.path.join(source_path, pat)).getroot()
+        fields = []
+        for child in root:
+            name = child.get('name')
+            text = (child.text or '').strip()
+            if name in ['Title', 'Abstract']:
+                words = re.findall(r'[a-z]+', text.lower())
+                word_counts.update(words)
+                if name == 'Title':
+                    title_lengths.append(max(1, len(words)))
+                else:
+                    abstract_lengths.append(max(1, len(words)))
+            elif name != 'Patent Number':
+                fields.append((name, text.encode('utf-8')))
+        metadata.append(fields)
+    return (word_counts, title_lengths, abstract_lengths, metadata)
+
+def synthetic_words(count, existing, rng):
+    """
+    Create count made-up words that are not in existing
+    """
+    words = []
+    seen = set(existing)
+    while len(words) < count:
+        word = ''.join([rng.choice(SYLLABLES) for _ in xrange(rng.randint(2, 4))])
+        if word not in seen:
+            seen.add(word)
+            words.append(word)
+    return words
+
+class ZipfSampler:
+    '''
+        Draws ranks in [0, size) with probability proportional to 1 / (rank + 1) ** exponent
+    '''
+
+    def __init__(self, size, exponent, rng):
+        self.rng = rng
+        self.cumulative = array('d')
+        total = 0.0
+        for rank in xrange(size):
+            total += 1.0 / (rank + 1) ** exponent
+            self.cumulative.append(total)
+        self.total = total
+
+    def sample(self):
+        return bisect.bisect_left(self.cumulative, self.rng.random() * self.total)
+
+def write_patent(path, pat_id, title, abstract, metadata):
+    """
+    Write a patent in the XML format of the patsnap corpus
+    """
+    fields = [('Patent Number', pat_id), ('Title', ' '.join(title).capitalize())]
+    fields += metadata
+    fields.append(('Abstract', sentences(abstract)))
+
+    f = open(path, 'w')
+    f.write('<?xml version="1.0" ?>\n<doc>\n')
+    for name, text in fields:
+        f.write('\t<str name="%s">\n\t\t%s\n\t</str>\n' % (escape(name, {'"': '&quot;'}), escape(text)))
+    f.write('</doc>\n')
+    f.close()
+
+def write_query(path, title, description):
+    """
+    Write a query in the XML format of the queries directory
+    """
+    f = open(path, 'w')
+    f.write('<?xml version="1.0" ?>\n<query>\n')
+    f.write('  <title>\n    %s\n  </title>\n' % escape(' '.join(title).capitalize()))
+    f.write('  <description>\n    Relevant documents will describe %s\n  </description>\n' % escape(sentences(description)))
+    f.write('</query>\n')
+    f.close()
+
+def sentences(words):
+    """
+    Join words into sentences of about 20 words
+    """
+    chunks = [' '.join(words[i:i + 20]).capitalize() for i in xrange(0, len(words), 20)]
+    return '. '.join(chunks) + '.'
+
+def usage():
+    print "usage: " + sys.argv[0] + " -i source-corpus -o output-directory -s scale [-n number-of-queries] [-r random-seed]"
+
+
+######################
+# MAIN
+######################
+
+if __name__ == '__main__':
+    source_path = "patsnap-corpus/"
+    output_path = None
+    scale = 10
+    num_queries = 50
+    seed = 3245
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'i:o:s:n:r:')
+    except getopt.GetoptError, err:
+        usage()
+        sys.exit(2)
+    for o, a in opts:
+        if o == '-i':
+            source_path = a
+        elif o == '-o':
+            output_path = a
+        elif o == '-s':
+            scale = float(a)
+        elif o == '-n':
+            num_queries = int(a)
+        elif o == '-r':
+            seed = int(a)
+        else:
+            assert False, "unhandled option"
+
+    if output_path is None:
+        usage()
+        sys.exit(2)
+
+    generate_corpus(source_path, output_path, scale, num_queries, seed)
@@ -6,14 +6,49 @@ import os
 import string
 import math
 import re
+from itertools import islice
 from nltk.stem.porter import *
-import xml.etree.ElementTree as et
 import text_processing
+from IPCProfiles import IPCProfiles
+from CompactDictionary import CompactDictionary
+from ShardedVectorSpaceModel import shard_file
+from DocumentFilters import DocumentFilters
+from NearDuplicates import NearDuplicates
+from PatentSource import PatentSource
+from BuildCheckpoint import BuildCheckpoint
 
-def indexing(training_path, postings_file, dictionary_file, patent_info_file):
+def indexing(training_path, postings_file, dictionary_file, patent_info_file, ipc_profile_file=None, profile_depth=None, compact=False, shards=1, filter_file=None, tier_fraction=None, duplicates_file=None, pruning=None, checkpoint_path=None, checkpoint_interval=1000):
     """
     Create an index of the corpus at training_path, placing the index in
     dictionary_file, postings_file and patent_info_file.
+    The corpus is a directory holding one XML file per patent, an archive of such files or a
+    file of patent records (see PatentSource.py).
+    If ipc_profile_file is given, the expansion term profiles of every IPC subclass
+    (see IPCProfiles.py) are written there. All the terms are kept, so that the profiles can
+    be updated with new patents, unless profile_depth is given: only that many terms are then
+    kept per subclass.
+    If compact is True, dictionary_file is written in the binary format of
+    CompactDictionary.py instead of the text format described below.
+    If shards is more than 1, the patents are partitioned into that many shards, and
+    every shard gets its own dictionary and postings file (see shard_file). The patent
+    info and IPC profile files cover the whole corpus.
+    If filter_file is given, the metadata bitmaps used to filter searches (see
+    DocumentFilters.py) are written there.
+    If tier_fraction is given, the postings lists are split into two tiers (see
+    write_tiered_postings): the share tier_fraction of the patents with the highest static
+    rank (see static_rank) form the high tier. Tiered indexes cannot be sharded.
+    If duplicates_file is given, the clusters of near-duplicate patents (see NearDuplicates.py)
+    are written there, the most cited patent of every cluster first.
+    If pruning is given, a tuple (method, aggressiveness), the postings contributing little
+    to the scores of their patents are left out of the postings file (see prune_postings).
+    The document frequencies and lengths stay those of the full index, so the postings kept
+    score as they would without pruning.
+    If checkpoint_path is given, the build saves a checkpoint in that directory every
+    checkpoint_interval patents and at the end of every shard (see BuildCheckpoint.py).
+    A build interrupted by a crash or a kill is resumed from its last checkpoint by running
+    it again with the same arguments: the patents already indexed are skipped, and the
+    index holds the same postings as that of an uninterrupted build. The checkpoint is
+    deleted once the build is complete.
     
     dictionary_file will contain a list of the terms contained in the corpus.
     On every line, the following information will be included (separated by spaces):
@@ -26,21 +61,135 @@ def indexing(training_path, postings_file, dictionary_file, patent_info_file):
     be found in the given patent (a standard positional index). The list is always
     <tf> elements long.
     """
-    pats = sorted(os.listdir(training_path))
+    if tier_fraction is not None and shards > 1:
+        raise RuntimeError, 'index: a tiered index cannot be sharded'
+    if tier_fraction is not None and pruning is not None:
+        raise RuntimeError, 'index: a tiered index cannot be pruned'
+    source = PatentSource(training_path)
+
+    ipc_profiles = IPCProfiles()
+    filters = DocumentFilters()
+    duplicates = NearDuplicates() if duplicates_file is not None else None
+    priors = {}
+    doc_freqs = {}
+    n = 0
+    shard_terms = []
+    kept, total = 0, 0
+    first_shard = 0
+
+    checkpoint = None
+    state = None
+    if checkpoint_path is not None:
+        settings = (training_path, postings_file, patent_info_file, shards, tier_fraction, pruning, duplicates_file is not None)
+        checkpoint = BuildCheckpoint(checkpoint_path, settings, checkpoint_interval)
+        state = checkpoint.load()
+    if state is None:
+        pi = open(patent_info_file, 'w')
+        if checkpoint is not None:
+            state = {'shard': 0, 'runs': 0, 'patent info size': 0, 'n': 0, 'kept': 0, 'total': 0}
+    else:
+        # The patent info written after the last checkpoint is written again
+        pi = open(patent_info_file, 'r+')
+        pi.truncate(state['patent info size'])
+        pi.seek(0, 2)
+        first_shard, n, kept, total = state['shard'], state['n'], state['kept'], state['total']
+        resume_build(checkpoint, state, ipc_profiles, filters, priors, duplicates, doc_freqs, shard_terms)
+        print 'checkpoint: resuming shard %d of %d, %d patents already indexed' % (first_shard, shards, len(priors))
+
+    for shard in xrange(first_shard, shards):
+        # Shards are built one after the other, so only one shard is held in memory
+        if checkpoint is None:
+            postings = index_patents(source.patents(shard, shards), pi, ipc_profiles, filters, priors, duplicates)
+        else:
+            postings = index_patents_with_checkpoints(source, shard, shards, pi, ipc_profiles, filters, priors, duplicates, checkpoint, state)
+        if not source.ordered:
+            # Postings lists are sorted by patent ID
+            for word_postings in postings.itervalues():
+                word_postings.sort(key=lambda posting: posting[0])
+        for word, word_postings in postings.iteritems():
+            doc_freqs[word] = doc_freqs.get(word, 0) + len(word_postings)
+        pruned = None
+        if pruning is not None:
+            pruned = prune_postings(postings, pruning[0], pruning[1])
+            kept += sum([len(word_postings) for word_postings in pruned.itervalues()])
+            total += sum([len(word_postings) for word_postings in postings.itervalues()])
+
+        if shards == 1:
+            high_tier = None
+            if tier_fraction is not None:
+                ranked = sorted(priors.iteritems(), key=lambda prior: (-prior[1], prior[0]))
+                high_tier = set([pat for pat, prior in ranked[:int(math.ceil(tier_fraction * len(ranked)))]])
+            n = write_dict_postings(postings, postings_file, dictionary_file, training_path, compact, high_tier, pruned)
+        else:
+            f = open(shard_file(postings_file, shard), 'w')
+            lines, doc_lengths = write_postings(postings if pruned is None else pruned, f, 0)
+            size = f.tell()
+            f.close()
+            if pruned is not None:
+                doc_lengths = document_lengths(postings)
+            shard_terms.append((lines, doc_lengths, size))
+            n += len(doc_lengths)
+        if checkpoint is not None:
+            # What the rest of the build needs from the shard, its runs and side files being
+            # deleted: the side files are merged into the shard file
+            shard_data = merge_side_files(checkpoint, shard, state['runs'])
+            shard_data.update({'doc freqs': dict([(word, len(word_postings)) for word, word_postings in postings.iteritems()]),
+                               'terms': shard_terms[-1] if shards > 1 else None})
+            checkpoint.write('shard.%d.pkl' % shard, shard_data)
+            runs = state['runs']
+            state.update({'shard': shard + 1, 'runs': 0, 'n': n, 'kept': kept, 'total': total})
+            save_checkpoint(checkpoint, state, pi)
+            checkpoint.remove_files([name % (shard, number) for number in xrange(runs) for name in ['run.%d.%d.pkl', 'side.%d.%d.pkl']])
+        postings = None
+        pruned = None
+    pi.close()
+    if pruning is not None:
+        size = sum([os.path.getsize(shard_file(postings_file, shard) if shards > 1 else postings_file) for shard in xrange(shards)])
+        print 'pruning: kept %d of %d postings (%.1f%%), postings file %d bytes' % (kept, total, 100.0 * kept / max(total, 1), size)
+    if filter_file is not None:
+        filters.write(filter_file)
+    if duplicates is not None:
+        duplicates.write(duplicates_file, priors)
+
+    # The dictionaries of the shards need the document frequencies of the whole corpus, and
+    # every shard must know every term for the query weights to be the same in every shard:
+    # terms missing from a shard get an empty postings list.
+    for shard, (lines, doc_lengths, size) in enumerate(shard_terms):
+        # A resumed build may have appended to the postings file of the shard already
+        f = open(shard_file(postings_file, shard), 'r+')
+        f.truncate(size)
+        f.seek(0, 2)
+        missing = dict([(word, []) for word in doc_freqs if word not in lines])
+        lines.update(write_postings(missing, f, len(lines))[0])
+        write_doc_lengths(doc_lengths, f)
+        f.close()
+        write_dictionary(lines, doc_freqs, shard_file(dictionary_file, shard), training_path, compact)
     
-    pi = open(patent_info_file, 'w')
+    if ipc_profile_file is not None:
+        ipc_profiles.write(ipc_profile_file, doc_freqs, n, profile_depth)
+    if checkpoint is not None:
+        checkpoint.remove()
+
+def index_patents(patents, pi, ipc_profiles, filters, priors, duplicates=None, metadata=None):
+    """
+    Index the given patents, an iterable of tuples (patent ID, XML element, see PatentSource.py):
+    their patent info is written to the file pi and added to
+    filters, their terms added to ipc_profiles and their static rank to priors. If
+    duplicates is given, they are also checked for near-duplicates of the patents added so far.
+    If metadata is given, a tuple (patent ID, year, cites, IPC, static rank) is appended to
+    it for every patent.
+
+    Returns:
+        postings    dictionary term -> list of tuples (patent ID, list of positions)
+    """
     postings = dict()
-    for pat in pats:
-        tree = et.parse(os.path.join(training_path, pat))
-        
-        pat_id = os.path.splitext(pat)[0]
-        
-        root = tree.getroot()
+    for pat_id, root in patents:
         title_content = ""
         abstract_content = ""
 
         year = ""
         cites = "0"
+        family_cites = "0"
         ipc = ""
         inventor = ""
         content = ""
@@ -59,6 +208,9 @@ def indexing(training_path, postings_file, dictionary_file, patent_info_file):
             if child.get('name') == 'Cited By Count':
                 cites = child.text.encode('utf-8').strip()
 
+            if child.get('name') == 'Family Members Cited By Count' and child.text is not None:
+                family_cites = child.text.encode('utf-8').strip()
+
             if child.get('name') == 'IPC Primary':
                 ipc = child.text.encode('utf-8').strip()
 
@@ -66,6 +218,10 @@ def indexing(training_path, postings_file, dictionary_file, patent_info_file):
                 inventor = child.text.encode('utf-8').strip()
 
         pi.write(pat_id + " | " + year + " | " + cites +  " | " + ipc + " | " + inventor + "\n")
+        filters.add_patent(pat_id, year, cites, ipc)
+        priors[pat_id] = static_rank(cites, family_cites)
+        if metadata is not None:
+            metadata.append((pat_id, year, cites, ipc, priors[pat_id]))
         
         stemmer = PorterStemmer()
         # remove non utf-8 characters, http://stackoverflow.com/a/20078869
@@ -74,6 +230,7 @@ def indexing(training_path, postings_file, dictionary_file, patent_info_file):
         sentences = nltk.sent_tokenize(content)
         i = 0
         occurences = dict()
+        terms = []
         for sentence in sentences:
             # tokenize sentences in words
             words = nltk.word_tokenize(sentence)
@@ -86,77 +243,359 @@ def indexing(training_path, postings_file, dictionary_file, patent_info_file):
                     occurences[normalized].append(i)
                 else:
                     occurences[normalized] = [i]
+                terms.append(normalized)
                 
                 i += 1
         
+        if duplicates is not None:
+            duplicates.add_patent(pat_id, terms)
+        ipc_profiles.add_patent(ipc, dict([(word, len(positions)) for word, positions in occurences.iteritems()]))
+        
         for word, positions in occurences.iteritems():
             if word in postings:
                 postings[word].append((pat_id, positions))
             else:
                 postings[word] = [(pat_id, positions)]
-        
-    pi.close()
-    write_dict_postings(postings, postings_file, dictionary_file, training_path)    
+
+    return postings
+
+def index_patents_with_checkpoints(source, shard, shards, pi, ipc_profiles, filters, priors, duplicates, checkpoint, state):
+    """
+    Index the patents of a shard of source as index_patents does, saving a checkpoint every
+    checkpoint.interval patents. A checkpoint writes what was gathered from these patents
+    only: their postings to a run, and to a side file their metadata (as passed to filters,
+    with their static rank), their MinHash signatures and their IPC profile counts. The
+    state then only records the number of runs of the shard, the files being named after
+    it, so a checkpoint costs the same at the end of the corpus as at its start. The patents
+    already indexed (see resume_build) are skipped, their postings being read back from the
+    runs of the shard.
+
+    Returns:
+        postings    dictionary term -> list of tuples (patent ID, list of positions)
+    """
+    postings = {}
+    for number in xrange(state['runs']):
+        add_run(postings, checkpoint.read('run.%d.%d.pkl' % (shard, number)))
+
+    patents = source.patents(shard, shards, set(priors))
+    while True:
+        metadata = []
+        run_profiles = IPCProfiles()
+        run = index_patents(islice(patents, checkpoint.interval), pi, run_profiles, filters, priors, duplicates, metadata)
+        if len(metadata) == 0:
+            return postings
+        signatures = {}
+        if duplicates is not None:
+            signatures = dict([(patent[0], duplicates.signatures[patent[0]]) for patent in metadata if patent[0] in duplicates.signatures])
+        number = state['runs']
+        checkpoint.write('side.%d.%d.pkl' % (shard, number), {'patents': metadata, 'signatures': signatures, 'profiles': run_profiles.profiles})
+        checkpoint.write('run.%d.%d.pkl' % (shard, number), run)
+        state['runs'] = number + 1
+        save_checkpoint(checkpoint, state, pi)
+        ipc_profiles.update(run_profiles.profiles)
+        add_run(postings, run)
+
+def resume_build(checkpoint, state, ipc_profiles, filters, priors, duplicates, doc_freqs, shard_terms):
+    """
+    Rebuild what an interrupted build had gathered at its last checkpoint: the patents of the
+    shard files of the completed shards, then of the side files of the current shard, are
+    added again, in the same order, to ipc_profiles, filters, priors and duplicates, and the
+    document frequencies and terms of the completed shards to doc_freqs and shard_terms (see
+    indexing)
+    """
+    gathered = [checkpoint.read('shard.%d.pkl' % shard) for shard in xrange(state['shard'])]
+    for shard_state in gathered:
+        for word, df in shard_state['doc freqs'].iteritems():
+            doc_freqs[word] = doc_freqs.get(word, 0) + df
+        if shard_state['terms'] is not None:
+            shard_terms.append(shard_state['terms'])
+    gathered += [checkpoint.read('side.%d.%d.pkl' % (state['shard'], number)) for number in xrange(state['runs'])]
+
+    for side in gathered:
+        for pat_id, year, cites, ipc, prior in side['patents']:
+            filters.add_patent(pat_id, year, cites, ipc)
+            priors[pat_id] = prior
+            if duplicates is not None:
+                duplicates.add_signature(pat_id, side['signatures'].get(pat_id))
+        ipc_profiles.update(side['profiles'])
+
+def merge_side_files(checkpoint, shard, runs):
+    """
+    Merge the side files of the given number of runs of a shard into one, in order
+
+    Returns:
+        dictionary with the patents, signatures and profiles of all the side files
+    """
+    merged = {'patents': [], 'signatures': {}}
+    profiles = IPCProfiles()
+    for number in xrange(runs):
+        side = checkpoint.read('side.%d.%d.pkl' % (shard, number))
+        merged['patents'].extend(side['patents'])
+        merged['signatures'].update(side['signatures'])
+        profiles.update(side['profiles'])
+    merged['profiles'] = profiles.profiles
+    return merged
+
+def add_run(postings, run):
+    """
+    Append the postings of a run to postings, both dictionaries term -> list of postings
+    """
+    for word, word_postings in run.iteritems():
+        if word in postings:
+            postings[word].extend(word_postings)
+        else:
+            postings[word] = word_postings
+
+def save_checkpoint(checkpoint, state, pi):
+    """
+    Save the state of the build, with the size of the patent info file pi written so far
+    """
+    pi.flush()
+    os.fsync(pi.fileno())
+    state['patent info size'] = pi.tell()
+    checkpoint.save(state)
+
+def prune_postings(data, method, aggressiveness, top_k=10):
+    """
+    Static index pruning: leave out the postings contributing little to the score of their
+    patent. The contribution of a posting is its log tf weighted by the idf of the term,
+    normalized by the length of the patent, as the Vector Space Model scores it.
+
+    Arguments:
+        method          'term' for term-centric pruning (Carmel et al., 2001): the postings of
+                        a term contributing less than aggressiveness times the top_k-th highest
+                        contribution of that term are dropped, so that the top_k patents of
+                        every single-term query are unchanged.
+                        'document' for document-centric pruning (Buttcher and Clarke, 2006):
+                        the share aggressiveness of the terms of every patent contributing
+                        the least to it are dropped.
+        aggressiveness  between 0 (nothing pruned) and 1
+
+    Returns:
+        dictionary term -> list of tuples (patent ID, list of positions) kept, in the order of data
+    """
+    lengths = dict([(pat, math.sqrt(length)) for pat, length in document_lengths(data).iteritems()])
+    n = len(lengths)
+    contributions = {}
+    for word, postings in data.iteritems():
+        idf = math.log10(float(n) / len(postings))
+        contributions[word] = [idf * log_tf(len(positions)) / lengths[pat] for pat, positions in postings]
+
+    if method == 'term':
+        pruned = {}
+        for word, postings in data.iteritems():
+            scores = contributions[word]
+            if len(scores) <= top_k:
+                pruned[word] = postings
+                continue
+            threshold = aggressiveness * sorted(scores, reverse=True)[top_k - 1]
+            pruned[word] = [posting for posting, score in zip(postings, scores) if score >= threshold]
+        return pruned
+    elif method == 'document':
+        terms = {}
+        for word, postings in data.iteritems():
+            for i, (pat, positions) in enumerate(postings):
+                terms.setdefault(pat, []).append((contributions[word][i], word))
+        dropped = set()
+        for pat, pat_terms in terms.iteritems():
+            # Ties are broken by term, so that the pruned index does not depend on the order of data
+            pat_terms.sort()
+            for score, word in pat_terms[:int(aggressiveness * len(pat_terms))]:
+                dropped.add((word, pat))
+        return dict([(word, [(pat, positions) for pat, positions in postings if (word, pat) not in dropped])
+                     for word, postings in data.iteritems()])
+    raise RuntimeError, 'index: unknown pruning method %s' % method
+
+def document_lengths(data):
+    """
+    Return the length of every patent of the postings lists of data, as a dictionary patent ID
+    -> sum of the squared log tf of its terms
+    """
+    doc_lengths = {}
+    for word, postings in data.iteritems():
+        for pat, positions in postings:
+            tf = log_tf(len(positions))
+            doc_lengths[pat] = doc_lengths.get(pat, 0.0) + tf * tf
+    return doc_lengths
+
+def static_rank(cites, family_cites):
+    """
+    Query-independent prior of a patent, from its own citations and (with half the weight)
+    those of its family, as found in the patent XML
+    """
+    cites = int(cites) if cites.isdigit() else 0
+    family_cites = int(family_cites) if family_cites.isdigit() else 0
+    return cites + 0.5 * family_cites
     
-def write_dict_postings(data, postings_file, dictionary_file, training_path):
+def write_dict_postings(data, postings_file, dictionary_file, training_path, compact=False, high_tier=None, pruned=None):
+    """
+    Write the postings lists of data to postings_file and the dictionary to dictionary_file.
+    If high_tier is given, the postings are written in two tiers, see write_tiered_postings.
+    If pruned is given, its postings lists are written instead of those of data, with the
+    document frequencies and lengths of data.
+
+    Returns:
+        the number of documents indexed
+    """
     f = open(postings_file, 'w')
-    d = open(dictionary_file, 'w')
+    if pruned is not None:
+        lines = write_postings(pruned, f, 0)[0]
+        doc_lengths = document_lengths(data)
+    elif high_tier is None:
+        lines, doc_lengths = write_postings(data, f, 0)
+    else:
+        lines, doc_lengths = write_tiered_postings(data, f, high_tier)
+    write_doc_lengths(doc_lengths, f)
+    f.close()
 
-    line_index = 0
-    current_word = ""
-    current_word_freq = {}
+    doc_freqs = dict([(word, len(postings)) for word, postings in data.iteritems()])
+    write_dictionary(lines, doc_freqs, dictionary_file, training_path, compact)
+    return len(doc_lengths)
+
+def write_postings(data, f, line_index):
+    """
+    Write the postings lists of data to the file f, one per line, starting at line line_index
+
+    Returns:
+        lines           dictionary term -> line of its postings list
+        doc_lengths     dictionary patent ID -> sum of the squared log tf of its terms
+    """
+    lines = {}
     doc_lengths = {}
     for word, postings in data.iteritems():
-        doc_freq = len(postings)
-        d.write(word + ' ' + str(doc_freq) + ' ' + str(line_index) + '\n')
-        for pat, positions in postings:
-            tf = len(positions)
-            log_tf = 0 if tf == 0 else 1 + math.log(tf)
-            doc_lengths[pat] = doc_lengths.get(pat, 0.0) + log_tf * log_tf
-            
-            f.write(pat + ' ' + str(log_tf) + ' ' + str(len(positions)) + ' ')
-            f.write(' '.join([str(p) for p in positions]) + ' ')
-        f.write('\n')    
+        lines[word] = line_index
+        write_postings_list(postings, f, doc_lengths)
         line_index += 1
+    return (lines, doc_lengths)
 
+def write_tiered_postings(data, f, high_tier):
+    """
+    Write the postings lists of data to the file f in two tiers. The postings of the patents
+    in high_tier are written first, one line per term, then the postings of all the other
+    patents, in the same term order: if there are T terms, the low tier of the term at line
+    L is at line L + T. Both tiers are sorted by patent ID.
+
+    The tiers are followed by a line "#tiers T bound bound ...", holding for every term
+    the highest log tf / document length among its low tier postings. The score a term
+    can add to a low tier patent is bounded by its query weight times this bound.
+
+    Returns:
+        lines           dictionary term -> line of its high tier postings list
+        doc_lengths     dictionary patent ID -> sum of the squared log tf of its terms
+    """
+    words = data.keys()
+    doc_lengths = {}
+    for word in words:
+        write_postings_list([(pat, positions) for pat, positions in data[word] if pat in high_tier], f, doc_lengths)
+    for word in words:
+        write_postings_list([(pat, positions) for pat, positions in data[word] if pat not in high_tier], f, doc_lengths)
+
+    bounds = []
+    for word in words:
+        bounds.append(max([log_tf(len(positions)) / math.sqrt(doc_lengths[pat])
+                           for pat, positions in data[word] if pat not in high_tier] or [0.0]))
+    f.write('#tiers ' + str(len(words)) + ' ' + ' '.join([repr(bound) for bound in bounds]) + '\n')
+
+    lines = dict([(word, line) for line, word in enumerate(words)])
+    return (lines, doc_lengths)
+
+def write_postings_list(postings, f, doc_lengths):
+    """
+    Write one postings list to the file f as one line, adding the squared log tf of every
+    posting to the length of its document in doc_lengths
+    """
+    for pat, positions in postings:
+        tf = log_tf(len(positions))
+        doc_lengths[pat] = doc_lengths.get(pat, 0.0) + tf * tf
+        
+        f.write(pat + ' ' + str(tf) + ' ' + str(len(positions)) + ' ')
+        f.write(' '.join([str(p) for p in positions]) + ' ')
+    f.write('\n')
+
+def log_tf(tf):
+    return 0 if tf == 0 else 1 + math.log(tf)
+
+def write_doc_lengths(doc_lengths, f):
+    """
+    Write the last line of the postings file, holding the length of every document
+    """
     for doc, length in doc_lengths.iteritems():
         f.write(doc + ' ' + str(math.sqrt(length)) + ' ')
 
-    d.write("# " + training_path)
+def write_dictionary(lines, doc_freqs, dictionary_file, training_path, compact=False):
+    entries = sorted([(word, doc_freqs[word], line) for word, line in lines.iteritems()], key=lambda entry: entry[2])
+    if compact:
+        CompactDictionary.write(entries, dictionary_file, training_path)
+        return
 
-    f.close()
+    d = open(dictionary_file, 'w')
+    for word, doc_freq, line in entries:
+        d.write(word + ' ' + str(doc_freq) + ' ' + str(line) + '\n')
+    d.write("# " + training_path)
     d.close()
 
 def usage():
-    print "usage: " + sys.argv[0] + " -i directory-of-documents -d dictionary-file -p postings-file -q patent-info-file"
+    print "usage: " + sys.argv[0] + " -i directory-or-archive-of-documents -d dictionary-file -p postings-file -q patent-info-file [-c ipc-profile-file] [-t ipc-profile-depth] [-z] [-n number-of-shards] [-f filter-file] [-T high-tier-fraction] [-u duplicates-file] [-P term|document:aggressiveness] [-k checkpoint-directory] [-K checkpoint-interval]"
 
 
 ######################
 # MAIN
 ######################
 
-training_path = "patsnap-corpus/"
-dictionary_file = "dictionary.txt"
-postings_file = "postings.txt"
-patent_info_file = "patent_info.txt"
-
-try:
-    opts, args = getopt.getopt(sys.argv[1:], 'i:d:p:q:')
-except getopt.GetoptError, err:
-    usage()
-    sys.exit(2)
-for o, a in opts:
-    if o == '-i':
-        training_path = a
-        if "/" not in training_path:
-            training_path += "/"
-    elif o == '-d':
-        dictionary_file = a
-    elif o == '-p':
-        postings_file = a
-    elif o == '-q':
-        patent_info_file = a
-    else:
-        assert False, "unhandled option"
+if __name__ == '__main__':
+    training_path = "patsnap-corpus/"
+    dictionary_file = "dictionary.txt"
+    postings_file = "postings.txt"
+    patent_info_file = "patent_info.txt"
+    ipc_profile_file = "ipc_profiles.txt"
+    profile_depth = None
+    compact = False
+    shards = 1
+    filter_file = None
+    tier_fraction = None
+    duplicates_file = None
+    pruning = None
+    checkpoint_path = None
+    checkpoint_interval = 1000
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'i:d:p:q:c:t:zn:f:T:u:P:k:K:')
+    except getopt.GetoptError, err:
+        usage()
+        sys.exit(2)
+    for o, a in opts:
+        if o == '-i':
+            training_path = a
+            if os.path.isdir(training_path) and "/" not in training_path:
+                training_path += "/"
+        elif o == '-d':
+            dictionary_file = a
+        elif o == '-p':
+            postings_file = a
+        elif o == '-q':
+            patent_info_file = a
+        elif o == '-c':
+            ipc_profile_file = a
+        elif o == '-t':
+            profile_depth = int(a)
+        elif o == '-z':
+            compact = True
+        elif o == '-n':
+            shards = int(a)
+        elif o == '-f':
+            filter_file = a
+        elif o == '-T':
+            tier_fraction = float(a)
+        elif o == '-u':
+            duplicates_file = a
+        elif o == '-P':
+            method, aggressiveness = a.split(':')
+            pruning = (method, float(aggressiveness))
+        elif o == '-k':
+            checkpoint_path = a
+        elif o == '-K':
+            checkpoint_interval = int(a)
+        else:
+            assert False, "unhandled option"
 
-indexing(training_path, postings_file, dictionary_file, patent_info_file)
+    indexing(training_path, postings_file, dictionary_file, patent_info_file, ipc_profile_file, profile_depth, compact, shards, filter_file, tier_fraction, duplicates_file, pruning, checkpoint_path, checkpoint_interval)
@@ -0,0 +1,256 @@
+#!/usr/bin/python
+import sys
+import getopt
+import os
+import time
+import json
+import random
+import shutil
+import socket
+import tempfile
+import threading
+from benchmark import summarize, query_files_in
+from QueryScheduler import QueryScheduler
+
+def read_log(log_file):
+    """
+    Read a query log: one request per line, either "query-file" or "seconds query-file",
+    seconds being the time of the request from the start of the log
+
+    Returns:
+        list of tuples (seconds or None, query file)
+    """
+    log = []
+    f = open(log_file, 'r')
+    for line in f:
+        fields = line.split()
+        if len(fields) == 1:
+            log.append((None, fields[0]))
+        elif len(fields) == 2:
+            log.append((float(fields[0]), fields[1]))
+    f.close()
+    return log
+
+def synthesize_log(query_files, requests, seed=3245, zipf_exponent=1.0):
+    """
+    Synthesize a log of requests drawn from query_files, the popularity of the queries
+    following a Zipf law (the first query being the most popular), so that the same queries
+    come back as they do in real logs
+
+    Returns:
+        list of tuples (None, query file)
+    """
+    rng = random.Random(seed)
+    weights = [1.0 / (rank + 1) ** zipf_exponent for rank in xrange(len(query_files))]
+    total = sum(weights)
+    log = []
+    for i in xrange(requests):
+        target = rng.random() * total
+        rank = 0
+        while rank < len(weights) - 1 and target >= weights[rank]:
+            target -= weights[rank]
+            rank += 1
+        log.append((None, query_files[rank]))
+    return log
+
+def load_test(scheduler, log, concurrency, rate, work_path, seed=3245):
+    """
+    Replay log against scheduler (a QueryScheduler) and measure its throughput and latency.
+
+    In closed loop (rate None and no times in the log), concurrency clients each send the next
+    request of the log as soon as their previous one is answered. In open loop, requests
+    arrive on their own schedule whatever the state of the server: at the times of the log,
+    or, if rate is given, as a Poisson process of rate requests per second. At most
+    concurrency requests are then in flight; the latency of a request is counted from its
+    scheduled arrival, so that time spent waiting for a free client is included.
+
+    Returns:
+        dictionary with the number of requests, errors, throughput, latency summary (see
+        benchmark.summarize) and the summary of every stage of the searches
+    """
+    open_loop = rate is not None or any([seconds is not None for seconds, query_file in log])
+    if open_loop:
+        arrivals = schedule(log, rate, seed)
+    latencies = []
+    stages = {}
+    errors = {}
+    lock = threading.Lock()
+    semaphore = threading.Semaphore(concurrency)
+    next_request = [0]
+
+    def send(i, arrival):
+        query_file = log[i][1]
+        stage_times = []
+        try:
+            scheduler.search(query_file, os.path.join(work_path, 'output.%d.txt' % i), stage_times)
+        except Exception, e:
+            with lock:
+                errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+            return
+        latency = time.time() - arrival
+        with lock:
+            latencies.append(latency)
+            for stage, seconds in stage_times:
+                stages.setdefault(stage, []).append(seconds)
+
+    def client():
+        while True:
+            with lock:
+                i = next_request[0]
+                next_request[0] += 1
+            if i >= len(log):
+                return
+            send(i, time.time())
+
+    def open_loop_request(i, arrival):
+        try:
+            send(i, arrival)
+        finally:
+            semaphore.release()
+
+    start = time.time()
+    threads = []
+    if open_loop:
+        for i, offset in enumerate(arrivals):
+            delay = start + offset - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            semaphore.acquire()
+            thread = threading.Thread(target=open_loop_request, args=(i, start + offset))
+            thread.start()
+            threads.append(thread)
+    else:
+        for c in xrange(concurrency):
+            thread = threading.Thread(target=client)
+            thread.start()
+            threads.append(thread)
+    for thread in threads:
+        thread.join()
+    seconds = time.time() - start
+
+    result = {
+        'mode': 'open' if open_loop else 'closed',
+        'concurrency': concurrency,
+        'rate': rate,
+        'requests': len(log),
+        'completed': len(latencies),
+        'errors': errors,
+        'seconds': seconds,
+        'throughput': len(latencies) / seconds,
+        'stages': dict([(stage, summarize(times)) for stage, times in stages.iteritems()]),
+    }
+    if latencies:
+        result['latency'] = summarize(latencies)
+        result['latency']['max'] = max(latencies)
+    return result
+
+def schedule(log, rate, seed=3245):
+    """
+    Return the arrival time of every request of log, in seconds from the start: a Poisson
+    process of rate requests per second if rate is given, otherwise the times of the log
+    """
+    if rate is None:
+        start = min([seconds for seconds, query_file in log if seconds is not None])
+        return [(seconds - start) if seconds is not None else 0.0 for seconds, query_file in log]
+    rng = random.Random(seed)
+    arrivals = []
+    offset = 0.0
+    for request in log:
+        arrivals.append(offset)
+        offset += rng.expovariate(rate)
+    return arrivals
+
+def print_result(result):
+    print 'mode: %s loop, concurrency %d%s' % (result['mode'], result['concurrency'],
+                                               ', %.1f requests/s offered' % result['rate'] if result['rate'] else '')
+    print 'requests: %d, completed %d, errors %d %s' % (result['requests'], result['completed'], sum(result['errors'].values()),
+                                                       ' '.join(['%s=%d' % error for error in sorted(result['errors'].items())]))
+    print 'throughput: %.2f queries/s over %.2fs' % (result['throughput'], result['seconds'])
+    if 'latency' in result:
+        latency = result['latency']
+        print 'latency: mean %.4fs  p50 %.4fs  p95 %.4fs  p99 %.4fs  max %.4fs' % (
+            latency['mean'], latency['p50'], latency['p95'], latency['p99'], latency['max'])
+    for stage, summary in sorted(result['stages'].items()):
+        print 'stage: %-20s p50 %.4fs  p95 %.4fs  p99 %.4fs' % (stage, summary['p50'], summary['p95'], summary['p99'])
+    if 'batches' in result:
+        print 'scheduler: %d requests, %d searches in %d batches' % (result['scheduler_requests'], result['searches'], result['batches'])
+
+def usage():
+    print "usage: " + sys.argv[0] + " [-q directory-of-queries | -l query-log-file | -s number-of-requests] [-c concurrency] [-a arrival-rate] [-d dictionary-file] [-p postings-file] [-i patent-info-file] [-x ipc-profile-file] [-w batch-window] [-o results-file]"
+
+
+######################
+# MAIN
+######################
+
+if __name__ == '__main__':
+    query_path = "queries/"
+    log_file = None
+    synthesized = None
+    concurrency = 4
+    rate = None
+    dictionary_file = "dictionary.txt"
+    postings_file = "postings.txt"
+    patent_info_file = "patent_info.txt"
+    ipc_profile_file = "ipc_profiles.txt"
+    batch_window = 0.005
+    results_file = "loadtest_results.jsonl"
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'q:l:s:c:a:d:p:i:x:w:o:')
+    except getopt.GetoptError, err:
+        usage()
+        sys.exit(2)
+    for o, a in opts:
+        if o == '-q':
+            query_path = a
+        elif o == '-l':
+            log_file = a
+        elif o == '-s':
+            synthesized = int(a)
+        elif o == '-c':
+            concurrency = int(a)
+        elif o == '-a':
+            rate = float(a)
+        elif o == '-d':
+            dictionary_file = a
+        elif o == '-p':
+            postings_file = a
+        elif o == '-i':
+            patent_info_file = a
+        elif o == '-x':
+            ipc_profile_file = a
+        elif o == '-w':
+            batch_window = float(a)
+        elif o == '-o':
+            results_file = a
+        else:
+            assert False, "unhandled option"
+
+    if log_file is not None:
+        log = read_log(log_file)
+    elif synthesized is not None:
+        log = synthesize_log(query_files_in(query_path), synthesized)
+    else:
+        log = [(None, query_file) for query_file in query_files_in(query_path)]
+
+    work_path = tempfile.mkdtemp(prefix='loadtest')
+    scheduler = QueryScheduler(dictionary_file, postings_file, patent_info_file, ipc_profile_file, batch_window)
+    try:
+        # The first search loads the index: it is not part of the measurements
+        scheduler.search(log[0][1], os.path.join(work_path, 'warmup.txt'))
+        warmup = (scheduler.batches, scheduler.searches, scheduler.requests)
+        result = load_test(scheduler, log, concurrency, rate, work_path)
+    finally:
+        scheduler.close()
+        shutil.rmtree(work_path)
+    result['time'] = time.strftime('%Y-%m-%dT%H:%M:%S')
+    result['host'] = socket.gethostname()
+    result['batches'] = scheduler.batches - warmup[0]
+    result['searches'] = scheduler.searches - warmup[1]
+    result['scheduler_requests'] = scheduler.requests - warmup[2]
+
+    f = open(results_file, 'a')
+    f.write(json.dumps(result, sort_keys=True) + '\n')
+    f.close()
+    print_result(result)
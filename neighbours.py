@@ -0,0 +1,128 @@
+#!/usr/bin/python
+import sys
+import getopt
+import os
+import math
+import heapq
+from VectorSpaceModel import VectorSpaceModel
+from NearestNeighbours import NearestNeighbours
+import search
+
+def compute_neighbours(dictionary_file, postings_file, top_n, previous=None):
+    """
+    Compute the top_n most similar patents of every patent of the index.
+
+    The similarity of patent e to patent d is the score e gets when d is run as a free-text
+    query: the log tf of every term of d weighted by its idf and normalized by the length of
+    that vector, against the log tf of e normalized by the length of e. It is computed a term
+    at a time over the postings lists, as the Vector Space Model does for a query.
+
+    Arguments:
+        previous    if not None, the neighbours lists of an earlier run (dictionary patent ->
+                    list of (patent, score)). Only the patents missing from it get a new list;
+                    the others keep theirs, without the patents no longer in the index, and
+                    merged with the patents added since. Their scores are not recomputed with
+                    the document frequencies of the grown index.
+
+    Returns:
+        dictionary patent -> list of (patent, score) ordered by decreasing score
+    """
+    dictionary, training_path = search.read_dict(dictionary_file)
+    line_positions, last_line_pos = search.get_line_positions(postings_file)
+    length_vector, n = search.get_length_vector(postings_file, last_line_pos)
+    VSM = VectorSpaceModel(dictionary, postings_file, line_positions)
+    VSM.tiers = search.get_tiers(postings_file, line_positions)
+
+    # Every postings list without positions, and the terms of every patent with their log tf
+    postings = {}
+    idf = {}
+    terms = {}
+    for term, (df, line) in dictionary.iteritems():
+        postings[term] = VSM.get_postings(term, False)
+        idf[term] = math.log10(float(n) / float(df))
+        for doc, tf in postings[term]:
+            terms.setdefault(doc, []).append((term, tf))
+    query_lengths = dict([(doc, math.sqrt(sum([(tf * idf[term]) ** 2 for term, tf in doc_terms])))
+                          for doc, doc_terms in terms.iteritems()])
+
+    added = set(terms.keys()) if previous is None else set([doc for doc in terms if doc not in previous])
+    neighbours = {}
+    for doc in added:
+        scores = {}
+        for term, tf in terms[doc]:
+            weight = tf * idf[term]
+            for other, other_tf in postings[term]:
+                scores[other] = scores.get(other, 0.0) + weight * other_tf
+        del scores[doc]
+        neighbours[doc] = top_neighbours(scores, query_lengths[doc], length_vector, top_n)
+
+    if previous is None:
+        return neighbours
+
+    # Scores of the patents already listed against the added ones
+    added_scores = {}
+    for doc in added:
+        for term, tf in terms[doc]:
+            for other, other_tf in postings[term]:
+                if other not in added:
+                    scores = added_scores.setdefault(other, {})
+                    scores[doc] = scores.get(doc, 0.0) + other_tf * idf[term] * tf
+    for doc in terms:
+        if doc in added:
+            continue
+        kept = [(other, score) for other, score in previous[doc] if other in terms]
+        scores = added_scores.get(doc, {})
+        fresh = [(other, score / (query_lengths[doc] * length_vector[other])) for other, score in scores.iteritems()]
+        neighbours[doc] = heapq.nsmallest(top_n, kept + fresh, key=lambda neighbour: (-neighbour[1], neighbour[0]))
+    return neighbours
+
+def top_neighbours(scores, query_length, length_vector, top_n):
+    """
+    Normalize the scores of the neighbours of a patent and return the top_n of them,
+    ties being broken by patent ID
+    """
+    if query_length == 0:
+        return []
+    normalized = [(other, score / (query_length * length_vector[other])) for other, score in scores.iteritems()]
+    return heapq.nsmallest(top_n, normalized, key=lambda neighbour: (-neighbour[1], neighbour[0]))
+
+def usage():
+    print "usage: " + sys.argv[0] + " [-d dictionary-file] [-p postings-file] [-o neighbours-file] [-n number-of-neighbours] [-u]"
+
+
+######################
+# MAIN
+######################
+
+if __name__ == '__main__':
+    dictionary_file = "dictionary.txt"
+    postings_file = "postings.txt"
+    neighbours_file = "neighbours.txt"
+    top_n = 20
+    update = False
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'd:p:o:n:u')
+    except getopt.GetoptError, err:
+        usage()
+        sys.exit(2)
+    for o, a in opts:
+        if o == '-d':
+            dictionary_file = a
+        elif o == '-p':
+            postings_file = a
+        elif o == '-o':
+            neighbours_file = a
+        elif o == '-n':
+            top_n = int(a)
+        elif o == '-u':
+            update = True
+        else:
+            assert False, "unhandled option"
+
+    previous = None
+    if update and os.path.exists(neighbours_file):
+        previous = NearestNeighbours(neighbours_file).read_all()
+    neighbours = compute_neighbours(dictionary_file, postings_file, top_n, previous)
+    NearestNeighbours.write(neighbours, neighbours_file)
+    print 'neighbours: %d patents, %d new lists' % (len(neighbours), len([doc for doc in neighbours if previous is None or doc not in previous]))
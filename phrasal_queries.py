@@ -3,26 +3,34 @@ import string
 import math
 from collections import Counter
 from bisect import bisect_left
+from array import array
 import text_processing
+import pos_tagging
 
 __action_words = set(['with', 'using', 'through', 'means'])
 __complementizers = set(['to'])
 
-def generate_phrasal_queries(title, description):
+def generate_phrasal_queries(title, description, tagger='perceptron'):
     """
     Generate some phrasal queries from a given query title and description.
+    The description is tagged with the given tagger (see pos_tagging.tag).
+    Words with wildcards ('*' or '?', see search.process_query) are not part of any
+    phrase: they end a phrase as the end of a sentence does.
     """
-    p_title, _ = process_phrasal(title, False)
-    p_desc, _ = process_phrasal(description, False)
+    p_title, _ = process_phrasal(break_wildcards(title), False)
+    p_desc, _ = process_phrasal(break_wildcards(description), False)
     
-    # For the title, we want some subsets of length 2, 3 plus the title itself
-    queries = [' '.join(p_title)]
-    for i in range(0, len(p_title) - 2):
-        queries.append(' '.join(p_title[i:i+3]))
-    for i in range(0, len(p_title) - 1):
-        queries.append(' '.join(p_title[i:i+2]))
+    # For the title, we want some subsets of length 2, 3 plus the title itself,
+    # within every sentence of it
+    queries = []
+    for part in split_sentences(p_title):
+        queries.append(' '.join(part))
+        for i in range(0, len(part) - 2):
+            queries.append(' '.join(part[i:i+3]))
+        for i in range(0, len(part) - 1):
+            queries.append(' '.join(part[i:i+2]))
     
-    tagged_desc = nltk.pos_tag(p_desc)
+    tagged_desc = pos_tagging.tag(p_desc, tagger)
     
     for i, (tok, pos) in enumerate(tagged_desc):
         if tok in __action_words:
@@ -32,6 +40,26 @@ def generate_phrasal_queries(title, description):
     
     return queries
 
+def break_wildcards(text):
+    """
+    Replace the words of text containing wildcards by the end of a sentence
+    """
+    if '*' not in text and '?' not in text:
+        return text
+    return ' '.join(['.' if '*' in word or '?' in word else word for word in text.split()])
+
+def split_sentences(tokens):
+    """
+    Split a list of tokens at the '.' tokens, leaving out the empty sentences
+    """
+    sentences = [[]]
+    for token in tokens:
+        if token == '.':
+            sentences.append([])
+        else:
+            sentences[-1].append(token)
+    return [sentence for sentence in sentences if sentence != []]
+
 def generate_queries_from_to(tagged_desc, where):
     outstanding_terms = []
     i = where
@@ -137,18 +165,22 @@ def list_contains(a, x):
 def get_documents_with_phrase(query_terms, individual_postings, combined_postings):
     """
     Extract the documents containing the given phrase (query_terms) from
-    the postings of all those terms together (combined_postings).
+    the documents containing all those terms together (combined_postings,
+    sorted document numbers).
     
     Algorithm from the set of slides "Query Languages" by Raymond Mooney,
     University of Texas at Austin (https://www.cs.utexas.edu/~mooney/ir-course/slides/QueryLanguages.ppt)
     """
     retrieved = set()
-    for doc, _, __ in combined_postings:
+    # The documents come in increasing order, so every cursor only moves forward
+    cursors = dict([(query_term, individual_postings[query_term].cursor()) for query_term in query_terms])
+    for doc in combined_postings:
         positions = {}
         for query_term in query_terms:
             if query_term in positions:
                 continue
-            positions[query_term] = get_positions(individual_postings[query_term], doc)
+            cursors[query_term].seek(doc)
+            positions[query_term] = cursors[query_term].positions()
         
         # An optimization in Mooney's slides is to use the smallest list of positions.
         # We're not bothering with that here.
@@ -161,41 +193,49 @@ def get_documents_with_phrase(query_terms, individual_postings, combined_posting
                     break
             # If we found a correct position for all the query terms, this document contains the phrase
             if not position_not_found:
-                retrieved.add(doc)
+                retrieved.add(cursors[query_terms[0]].name())
                 # No need to check any further positions
                 break
     return retrieved
 
-def get_positions(postings, document):
+def pair_proximity(first, second, window):
     """
-    Get the list of positions for this document in the given postings list.
+    Proximity of two terms in a document, from their sorted lists of positions: 1 if the
+    second term directly follows the first somewhere (ordered adjacency), otherwise
+    1 / (s + 1)^2 for the minimum span s between an occurrence of each, or 0 if s is more
+    than window.
     """
-    
-    # Basically binary search through the postings for our patent ID
-    if len(postings) == 0:
-        return None
-    
-    mid = len(postings) / 2
-    if postings[mid][0] == document:
-        return postings[mid][2]
-    elif postings[mid][0] > document:
-        return get_positions(postings[:mid], document)
-    else:
-        return get_positions(postings[mid+1:], document)
+    span = None
+    i = j = 0
+    while i < len(first) and j < len(second):
+        distance = second[j] - first[i]
+        if distance == 1:
+            return 1.0
+        if distance != 0 and (span is None or abs(distance) < span):
+            span = abs(distance)
+        if first[i] < second[j]:
+            i += 1
+        else:
+            j += 1
+    if span is None or span > window:
+        return 0.0
+    return 1.0 / (span + 1) ** 2
 
-def get_phrasal_postings(query_terms, VSM):
+def get_phrasal_postings(query_terms, VSM, documents=None):
     """
-    Retrieve a postings list for the given phrasal query. The
-    postings list will contain the documents that contain all
-    the given query terms.
+    Retrieve the positional postings of the terms of the given phrasal
+    query, and the numbers of the documents that contain all the given
+    query terms. If documents is not None, only the postings of those
+    documents are retrieved.
     """
     
     query_set = list(set(query_terms)) # Duplicates are not important here so get rid of them
-    merged_postings = VSM.get_postings(query_terms[0], True)
-    positional_postings = {query_terms[0]: merged_postings}
+    first_postings = VSM.get_postings(query_terms[0], True, documents)
+    positional_postings = {query_terms[0]: first_postings}
+    merged_postings = first_postings.documents
     
     for query_term in query_terms[1:]:
-        fresh_postings = VSM.get_postings(query_term, True)
+        fresh_postings = VSM.get_postings(query_term, True, documents)
         positional_postings[query_term] = fresh_postings
         
         merged_postings = merge_postings(merged_postings, fresh_postings)
@@ -204,36 +244,19 @@ def get_phrasal_postings(query_terms, VSM):
 
 def merge_postings(a, b):
     """
-    Merge the postings lists a and b.
-    Reused from A0134784X's homework 2
+    Intersect the sorted document numbers a with the postings list b.
+    The cursor on b seeks to every document of a, skipping the postings
+    in between (this replaces the skip pointers of A0134784X's homework 2).
     """
-    skip1 = int(math.sqrt(len(a)))
-    skip2 = int(math.sqrt(len(b)))
-    
-    intersection = []
-    i = j = 0
-    while i < len(a) and j < len(b):
-        if a[i][0] == b[j][0]:
-            intersection.append(a[i])
-            i += 1
-            j += 1
-        elif a[i][0] < b[j][0]:
-            i += try_skip(a, i, b, j, skip1)
-        else:
-            j += try_skip(b, j, a, i, skip2)
-            
+    intersection = array('i')
+    cursor = b.cursor()
+    for document in a:
+        if cursor.seek(document):
+            intersection.append(document)
+        elif not cursor.valid():
+            break
     return intersection
 
-def try_skip(us, p_us, other, p_other, stride):
-    """
-    Determine whether to skip in the list iteration or not.
-    Also reused from A0134784X's homework 2
-    """
-    if p_us % stride == 0 and p_us + stride < len(us) and us[p_us + stride][0] < other[p_other][0]:
-        return stride
-    else:
-        return 1
-
 def process_phrasal(phrase, normalize=True):
     """
     Tokenize and stem the phrase words and compute the frequency of each word in the query list
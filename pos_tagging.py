@@ -0,0 +1,122 @@
+import re
+from collections import OrderedDict
+
+# nltk.pos_tag creates (and loads the model of) a new perceptron tagger on every call.
+# The tagger is created once, on the first call to tag, and kept for the lifetime of the
+# process, along with the tags of the last CACHE_SIZE token sequences.
+CACHE_SIZE = 1000
+__tagger = None
+__cache = OrderedDict()
+
+# Closed word classes of the lexicon tagger. Phrase generation only looks at nouns (NN*),
+# verbs (V*), "to" (TO) and the sentence ends, so open words only need to be told apart
+# as nouns, verbs or something else.
+__word_classes = [
+    ('DT', 'a an the this these those each every any some no another all both either neither'),
+    ('IN', 'of in on at by for from with within without into onto upon over under above below '
+           'between among through throughout during before after against along across around '
+           'about via per than whereby wherein whereas while if whether because as like near'),
+    ('CC', 'and or but nor'),
+    ('PRP', 'it they he she we i you them him her us itself themselves'),
+    ('PRP$', 'its their his our your my'),
+    ('MD', 'can could may might must shall should will would'),
+    ('RB', 'not also then thus therefore further only more most very so too'),
+    ('WDT', 'which that what whose'),
+    ('WP', 'who whom'),
+    ('EX', 'there'),
+    ('TO', 'to'),
+    ('VBZ', 'is has does comprises includes contains provides allows enables'),
+    ('VBP', 'are have do comprise include contain provide allow enable'),
+    ('VBD', 'was were had did'),
+    ('VB', 'be'),
+    ('VBN', 'been'),
+    ('JJ', 'such other same different new first second third main least'),
+]
+__lexicon = dict((word, pos) for pos, words in __word_classes for word in words.split())
+
+# Open words are verbs after "to", a modal or a relative pronoun ("which", "that"), whatever
+# their suffix, and open words coordinated with a verb ("digest, treat or decompose") are
+# verbs of the same form
+__verb_contexts = set(['TO', 'MD', 'WDT', 'WP'])
+__base_verbs = set(['VB', 'VBP', 'VBZ'])
+__number = re.compile(r'^[0-9]+([.,][0-9]+)*$')
+
+def tag(tokens, mode='perceptron'):
+    """
+    Tag the given list of tokens with their part of speech, as nltk.pos_tag does.
+
+    Arguments:
+        tokens      list of tokens, as returned by nltk.word_tokenize
+        mode        'perceptron' for the nltk averaged perceptron tagger, kept in memory
+                    between calls, or 'lexicon' for the lexicon and suffix tagger (see tag_lexicon)
+
+    Returns:
+        list of tuples (token, tag)
+    """
+    key = (mode, tuple(tokens))
+    if key in __cache:
+        tags = __cache.pop(key)
+        __cache[key] = tags
+        return list(tags)
+
+    if mode == 'perceptron':
+        tags = __get_tagger().tag(tokens)
+    elif mode == 'lexicon':
+        tags = tag_lexicon(tokens)
+    else:
+        raise RuntimeError, ('pos_tagging: unknown tagger %s' % mode)
+
+    __cache[key] = tags
+    if len(__cache) > CACHE_SIZE:
+        __cache.popitem(last=False)
+    return list(tags)
+
+def tag_lexicon(tokens):
+    """
+    Tag the given list of tokens with a lexicon of function words and suffix rules. It only
+    aims at the distinctions used for phrase generation: nouns (NN, NNS), verbs (VB*), "to" (TO)
+    and punctuation, whose tag is the token itself. Open words are nouns unless their suffix
+    or the word before them says otherwise.
+    """
+    tags = []
+    previous = None
+    # Tag of the last open word, for coordination
+    last_open = None
+    for token in tokens:
+        word = token.lower()
+        if word in __lexicon:
+            pos = __lexicon[word]
+        elif not re.search(r'\w', word):
+            pos = token
+        elif __number.match(word):
+            pos = 'CD'
+        elif previous in __verb_contexts:
+            pos = 'VB' if previous in ('TO', 'MD') else 'VBP'
+        elif previous in (',', 'CC') and last_open in __base_verbs:
+            pos = last_open
+        elif word.endswith('ing') and len(word) > 4:
+            pos = 'VBG'
+        elif word.endswith('ed') and len(word) > 4:
+            pos = 'VBN' if previous in ('VBZ', 'VBP', 'VBD', 'VB', 'VBN') else 'VBD'
+        elif word.endswith('ly') and len(word) > 4:
+            pos = 'RB'
+        elif re.search(r'(able|ible|ous|ive|ical|ic|al|ful|less)$', word) and len(word) > 5:
+            pos = 'JJ'
+        elif previous == 'PRP' and word.endswith('s'):
+            pos = 'VBZ'
+        elif word.endswith('s') and not word.endswith('ss') and len(word) > 3:
+            pos = 'NNS'
+        else:
+            pos = 'NN'
+        tags.append((token, pos))
+        if word not in __lexicon and pos[0].isalpha():
+            last_open = pos
+        previous = pos
+    return tags
+
+def __get_tagger():
+    global __tagger
+    if __tagger is None:
+        from nltk.tag.perceptron import PerceptronTagger
+        __tagger = PerceptronTagger()
+    return __tagger
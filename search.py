@@ -1,23 +1,71 @@
 #!/usr/bin/python
+import time
+process_start = time.time()
+
 import sys
+import os
 import getopt
-import nltk
 import math
+import fnmatch
+import string
 import xml.etree.ElementTree as et
 from collections import Counter
 from VectorSpaceModel import VectorSpaceModel
-from PseudoRelevanceFeedback import PseudoRelevanceFeedback
-from IPC import IPC
-from collections import Counter
+from Postings import DocumentTable
+from CompactDictionary import CompactDictionary
 import text_processing
-import phrasal_queries
+import tracing
+import_time = time.time() - process_start
+
+# nltk, the feedback and phrasal query modules are imported in the stages using them,
+# so that disabled stages cost nothing at startup.
 
 DEBUG_RESULTS = False
 PRINT_IPC = False
 USE_PRF = True
 USE_IPC = True
-
-def search(query_file, dictionary_file, postings_file, output_file, patent_info_file, retrieve, not_retrieve):
+USE_PHRASES = True
+# Ranking parameters, see sweep.py to measure their effect on quality and latency
+PRF_DOCUMENTS = 0
+PRF_TERMS = 0
+IPC_DOCUMENTS = 10
+IPC_TERMS = 120
+NEW_TERM_WEIGHT = 0.5
+OLD_TERM_BOOST = 1.5
+PHRASE_WEIGHT = 1.0
+PHRASE_LENGTH_WEIGHTED = False
+# How the phrasal queries are scored: 'phrases' runs every phrase as a phrasal query,
+# 'proximity' scores all of them in one pass over the positional postings, rewarding the
+# pairs of consecutive phrase terms at most PROXIMITY_WINDOW positions apart (see
+# VectorSpaceModel.get_proximity_scores)
+PHRASE_SCORING = 'phrases'
+PROXIMITY_WINDOW = 10
+# Part of speech tagger used to generate the phrasal queries: 'perceptron' (nltk) or 'lexicon'
+# (see pos_tagging.py)
+POS_TAGGER = 'perceptron'
+STARTUP_REPORT = False
+CACHE_SIZE = 1000
+CACHE_TTL = 7 * 24 * 3600
+# Number of documents every shard returns per query in a sharded search (None for all)
+SHARD_TOP_K = None
+# Threads and processes running the independent stages of a search concurrently (see
+# StageExecutor.py). With both at 0, or with a time budget, stages run one after another.
+STAGE_THREADS = 0
+PHRASE_PROCESSES = 0
+# Two-phase retrieval: if not None, the number of the best documents of the first pass that
+# the phrasal queries and the second pass score again. The other documents keep the score
+# of the first pass and are ranked after them.
+CANDIDATES = None
+# Score the expanded query from the accumulators of the first pass (see VectorSpaceModel.rescore)
+# instead of from scratch. Not used on a sharded index.
+INCREMENTAL_RESCORING = True
+# Number of documents the high tier of a tiered index (see index.py -T) must score for its
+# low tier to be skipped. None always reads both tiers. With TIER_EXACT, the low tier is only
+# skipped when it cannot change the top TIER_TOP_K documents.
+TIER_TOP_K = 100
+TIER_EXACT = True
+
+def search(query_file, dictionary_file, postings_file, output_file, patent_info_file, retrieve, not_retrieve, ipc_profile_file=None, time_budget=None, cache=None, stage_times=None, trace_file=None, profiler=None, shards=None, filter_file=None, filters=None, duplicates_file=None):
     """
     reads in and executes queries with the content of dictionary and postings file
     and writes the answers to the output_file
@@ -29,31 +77,206 @@ def search(query_file, dictionary_file, postings_file, output_file, patent_info_
         postings_file:  path to postings file, each posting corresponding to different dictionary entries
                         (form: "file_name <space> file_name <space>...")
         output_file:    path to the file where the output should be written
-        
+        ipc_profile_file: path to the IPC subclass term profiles written by index.py.
+                        If None or missing, IPC expansion reads the patents of the subclass.
+        time_budget:    if not None, the number of seconds the search may take. Query terms are
+                        then scored in decreasing order of impact, and the phrasal queries and the
+                        query expansion are truncated or skipped once the deadline comes near.
+        cache:          if not None, a QueryCache. Results of queries with the same normalized terms
+                        and settings on the same index are taken from it instead of recomputed.
+                        Truncated results are not cached.
+        stage_times:    if not None, a list to which (stage, seconds) tuples are appended for every
+                        step of the search (loading the index, each scoring stage, ...)
+        trace_file:     if not None, the wall time, postings lists and bytes read, documents scored
+                        and XML files parsed in every stage are appended to this file as a JSON line
+        profiler:       if not None, a tracing.Profiler run for the duration of the search
+        shards:         if not None, the number of shards of the index (built with index.py -n).
+                        Every shard is then searched by its own worker process, see
+                        ShardedVectorSpaceModel.py. dictionary_file and postings_file are the
+                        names given to index.py, without the shard numbers.
+        filter_file:    path to the metadata bitmaps written by index.py (see DocumentFilters.py)
+        filters:        if not None, a dictionary of metadata constraints, with any of the keys
+                        min_year, max_year, ipc (list of IPC sections, classes or subclasses) and
+                        min_cites. Only the patents matching all of them are scored.
+        duplicates_file: if not None, path to the near-duplicate clusters written by index.py
+                        (see NearDuplicates.py). Only the representative of every cluster is
+                        scored, so near-duplicates are collapsed into one result.
+
+    Returns:
+        scores          list of tuples with document names and scores ordered by decreasing score
+        truncated       True if part of the search was skipped because of the time budget
     """
-    
-    # Obtain dictionary, patent info, other information for this query
-    dictionary, training_path = read_dict(dictionary_file)   
-    line_positions, last_line_pos = get_line_positions(postings_file);
-    patent_info = get_patent_info(patent_info_file)
-    length_vector, n = get_length_vector(postings_file, last_line_pos)
-    query_title, query_content = extract_query_words(query_file)
-    
-    # Create a normal query object and some phrasal queries from that
+    if trace_file is not None:
+        tracing.begin(query_file)
+    if profiler is not None:
+        profiler.start()
+    try:
+        scores, truncated = run_search(query_file, dictionary_file, postings_file, output_file, patent_info_file, retrieve, not_retrieve, ipc_profile_file, time_budget, cache, stage_times, shards, filter_file, filters, duplicates_file)
+    finally:
+        if profiler is not None:
+            profiler.stop()
+        if trace_file is not None:
+            tracing.end(trace_file)
+    return (scores, truncated)
+
+def search_by_patent(patent, neighbours_file, output_file, filter_file=None, filters=None):
+    """
+    Find the patents most similar to the given patent of the index, as precomputed by
+    neighbours.py, and write them to output_file. The metadata filters (see search) are
+    applied to the neighbours.
+
+    Returns:
+        scores  list of tuples with document names and scores ordered by decreasing score
+    """
+    from NearestNeighbours import NearestNeighbours
+    if not os.path.exists(neighbours_file):
+        raise RuntimeError, 'search: query by patent needs the neighbours file written by neighbours.py'
+    scores = NearestNeighbours(neighbours_file).get(patent)
+    if scores is None:
+        raise RuntimeError, 'search: patent %s has no neighbours list' % patent
+    if filters:
+        from DocumentFilters import DocumentFilters
+        if filter_file is None or not os.path.exists(filter_file):
+            raise RuntimeError, 'search: filters need the filter file written by index.py'
+        selected = DocumentFilters.read(filter_file).select(**filters)
+        scores = [(doc, score) for doc, score in scores if doc in selected]
+    write_to_output_file(output_file, scores)
+    return scores
+
+def run_search(query_file, dictionary_file, postings_file, output_file, patent_info_file, retrieve, not_retrieve, ipc_profile_file, time_budget, cache, stage_times, shards=None, filter_file=None, filters=None, duplicates_file=None, index=None):
+    """
+    Run the search itself, see search for the arguments.
+
+    If index is not None, it is a dictionary in which the loaded index structures are kept
+    (see load), so that a long-running process (see QueryScheduler.py) loads them only once.
+    Its entry 'postings memo', if present, is handed to the Vector Space Model so that
+    postings lists are shared between the searches of a batch.
+    """
+    owns_index = index is None
+    if owns_index:
+        index = {}
+    start = time.time()
+    deadline = None if time_budget is None else start + time_budget
+    truncated = False
+    times = []
+
+    # The dictionary of every shard holds the whole vocabulary with the document
+    # frequencies of the whole corpus, so the first one serves for the query.
+    index_files = [dictionary_file, postings_file]
+    if shards is not None:
+        from ShardedVectorSpaceModel import shard_file
+        index_files = [shard_file(f, shard) for shard in xrange(shards) for f in [dictionary_file, postings_file]]
+
+    # Obtain the dictionary, the normalized query and its phrasal queries, which make the
+    # cache key. The first query loads nltk, its tokenizer models and the stop words.
+    dictionary, training_path = load(index, times, 'dictionary', read_dict, index_files[0])
+    query_title, query_content = timed(times, 'query file', extract_query_words, query_file)
     org_query_str = query_title + ' ' + query_content
-    org_query = process_query(org_query_str)
-    phrases = phrasal_queries.generate_phrasal_queries(query_title, query_content)
+    org_query = timed(times, 'query processing', process_query, org_query_str, dictionary)
+
+    # Create some phrasal queries from the query
+    phrases = []
+    if USE_PHRASES:
+        import phrasal_queries
+        phrases = timed(times, 'phrase generation', phrasal_queries.generate_phrasal_queries, query_title, query_content, POS_TAGGER)
     #print phrases
-    VSM = VectorSpaceModel(dictionary, postings_file, line_positions)
-    
+
+    if cache is not None:
+        filter_key = None if not filters else tuple(sorted([(k, tuple(v) if isinstance(v, list) else v) for k, v in filters.items()]))
+        # Queries with the same normalized terms and phrases share an entry, whatever their
+        # stop words, punctuation and word forms with the same stem
+        cache_key = cache.make_key(org_query, (USE_PHRASES, USE_PRF, USE_IPC, PRF_DOCUMENTS, PRF_TERMS, IPC_DOCUMENTS, IPC_TERMS,
+                                               NEW_TERM_WEIGHT, OLD_TERM_BOOST, PHRASE_WEIGHT, PHRASE_LENGTH_WEIGHTED, POS_TAGGER, TIER_TOP_K, TIER_EXACT, CANDIDATES, PHRASE_SCORING, PROXIMITY_WINDOW, filter_key,
+                                               duplicates_file is not None, SHARD_TOP_K if shards is not None else None, normalize_phrases(phrases)))
+        generation = cache.index_generation(index_files + [patent_info_file, ipc_profile_file, filter_file, duplicates_file])
+        scores = cache.get(cache_key, generation)
+        tracing.set_info('cache_hit', scores is not None)
+        if scores is not None:
+            if DEBUG_RESULTS:
+                print_result_info(scores, retrieve, not_retrieve, load(index, times, 'patent info', get_patent_info, patent_info_file))
+            write_to_output_file(output_file, scores)
+            if stage_times is not None:
+                stage_times.extend(times)
+            return (scores, False)
+
+    # Obtain patent info and other information for this query
+    patent_info = None
+    if USE_IPC or DEBUG_RESULTS or duplicates_file is not None:
+        patent_info = load(index, times, 'patent info', get_patent_info, patent_info_file)
+    VSM, line_positions, last_line_pos, length_vector, n = open_index(index, times, dictionary, dictionary_file, postings_file, patent_info,
+                                                                      shards, filter_file, filters, duplicates_file)
+
+    if STARTUP_REPORT:
+        print_startup_report(times)
+
+    # The phrasal queries and the IPC profiles do not depend on the first pass: with an
+    # executor, they run while it does. Phrases are evaluated on processes (they are CPU-bound),
+    # except on a sharded index, whose workers already are processes. In two-phase retrieval,
+    # the phrasal queries need the candidates of the first pass, so they start after it.
+    phrasal_state = (VSM, last_line_pos, length_vector, n)
+    executor = None
+    if deadline is None and (STAGE_THREADS > 0 or PHRASE_PROCESSES > 0):
+        from StageExecutor import StageExecutor
+        if 'executor' not in index:
+            index['executor'] = StageExecutor(STAGE_THREADS, PHRASE_PROCESSES if shards is None else 0)
+        executor = index['executor']
+        if CANDIDATES is None:
+            phrase_task, profiles_task = start_independent_stages(executor, phrasal_state, phrases, index, ipc_profile_file)
+
+    # The first pass is always run, the later stages are optional when a deadline is set. A
+    # long-running process may have scored it along with the other queries of a batch.
+    first_passes = index.get('first passes')
+    with tracing.stage('first pass', times):
+        if first_passes is not None and deadline is None and not filters and shards is None and first_pass_key(org_query) in first_passes:
+            scores, VSM.accumulators = first_passes[first_pass_key(org_query)]
+        elif deadline is None:
+            scores = VSM.get_scores(org_query, last_line_pos, length_vector, n)
+        else:
+            scores, truncated = VSM.get_scores_before(org_query, last_line_pos, length_vector, n, deadline)
+
+    # Two-phase retrieval: the later stages only score the candidates, through the document
+    # filter (the first pass already applied the metadata filters)
+    candidates = None
+    if CANDIDATES is not None:
+        first_scores = scores
+        candidates = set([doc for doc, score in scores[:CANDIDATES]])
+        VSM.document_filter = candidates
+        if executor is not None:
+            phrase_task, profiles_task = start_independent_stages(executor, phrasal_state, phrases, index, ipc_profile_file)
+
+    # Rough estimate of the cost of another scoring pass
+    pass_time = times[-1][1]
+
     # Run generated phrasal queries and put the scores together
     phrasal_scores = {}
-    for phrase in phrases:
-        phrasal_score = VSM.get_phrasal_score(phrase, last_line_pos, length_vector, n)
-        for doc, score in phrasal_score:
-            phrasal_scores[doc] = phrasal_scores.get(doc, 0.0) + score
-        
-    scores = VSM.get_scores(org_query, last_line_pos, length_vector, n)
+    with tracing.stage('phrasal queries', times):
+        if executor is not None and PHRASE_SCORING == 'proximity':
+            phrase_results = [phrase_task.result()]
+        elif executor is not None:
+            phrase_results = phrase_task.result()
+        elif PHRASE_SCORING == 'proximity':
+            phrase_results = []
+            if deadline is not None and time.time() >= deadline:
+                truncated = True
+            else:
+                phrase_results.append(get_proximity_score(phrasal_state, phrases))
+        else:
+            phrase_results = []
+            for phrase in phrases:
+                if deadline is not None and time.time() >= deadline:
+                    truncated = True
+                    break
+                phrase_results.append(get_phrasal_score(phrasal_state, phrase))
+        # Scores are added in the order of the phrases, however they were computed
+        for phrasal_score in phrase_results:
+            for doc, score in phrasal_score:
+                phrasal_scores[doc] = phrasal_scores.get(doc, 0.0) + score
+
+    # Only expand the query if there is enough time left for a second pass
+    expand = (USE_PRF or USE_IPC) and len(scores) > 0
+    if expand and deadline is not None and deadline - time.time() < pass_time:
+        truncated = True
+        expand = False
 
     # usage of IPC: take best results, 
     # look in patents of their subclasses and add best words to the query, rerun query
@@ -61,48 +284,97 @@ def search(query_file, dictionary_file, postings_file, output_file, patent_info_
     new_query_PRF = {}
     new_query_IPC = {}
     PRF = None
-
-    if USE_PRF:
-        no_of_documents = 0
-        no_of_terms = 0
-        PRF = PseudoRelevanceFeedback(dictionary, postings_file, line_positions, training_path, n)
-        new_query_PRF = PRF.generate_new_query_topk(scores[:no_of_documents], no_of_terms, org_query_str)
-
-    if USE_IPC:
-    	no_of_documents = 10
-        no_of_terms = 120
-        if PRF is None:
-            PRF = PseudoRelevanceFeedback(dictionary, postings_file, line_positions, training_path, n)
-    	new_query_IPC = PRF.generate_new_query_topIPC(scores[:no_of_documents], no_of_terms, org_query_str, patent_info)
-
-    # merge new_queries        
-    new_query = new_query_PRF.copy()
-    new_query.update(new_query_IPC)
-
-    if USE_PRF or USE_IPC:
-        scores = VSM.get_scores(new_query, last_line_pos, length_vector, n)
+    with tracing.stage('expansion', times):
+        if expand:
+            from PseudoRelevanceFeedback import PseudoRelevanceFeedback
+            from PatentSource import PatentSource
+            # The feedback documents are read from the corpus, which may be an archive
+            if 'corpus' not in index:
+                index['corpus'] = PatentSource(training_path)
+
+        if USE_PRF and expand:
+            no_of_documents = PRF_DOCUMENTS
+            no_of_terms = PRF_TERMS
+            PRF = PseudoRelevanceFeedback(dictionary, postings_file, line_positions, index['corpus'], n, NEW_TERM_WEIGHT, OLD_TERM_BOOST)
+            new_query_PRF = PRF.generate_new_query_topk(scores[:no_of_documents], no_of_terms, org_query)
+
+        if USE_IPC and expand:
+            no_of_documents = IPC_DOCUMENTS
+            no_of_terms = IPC_TERMS
+            if PRF is None:
+                PRF = PseudoRelevanceFeedback(dictionary, postings_file, line_positions, index['corpus'], n, NEW_TERM_WEIGHT, OLD_TERM_BOOST)
+            if executor is not None:
+                ipc_profiles = profiles_task.result()
+            else:
+                ipc_profiles = get_ipc_profiles(index, ipc_profile_file)
+            # The expansion terms of a subclass are shared by all the searches on the index
+            term_cache = index.setdefault('expansion terms', {})
+            new_query_IPC = PRF.generate_new_query_topIPC(scores[:no_of_documents], no_of_terms, org_query, patent_info, ipc_profiles, term_cache)
+
+        # merge new_queries        
+        new_query = new_query_PRF.copy()
+        new_query.update(new_query_IPC)
+
+    with tracing.stage('second pass', times):
+        if expand and deadline is None and INCREMENTAL_RESCORING and shards is None:
+            scores = VSM.rescore(new_query, last_line_pos, length_vector, n)
+        elif expand and deadline is None:
+            scores = VSM.get_scores(new_query, last_line_pos, length_vector, n)
+        elif expand and deadline - time.time() < pass_time:
+            # Expansion took too long, keep the ranking of the first pass
+            truncated = True
+        elif expand:
+            scores, second_truncated = VSM.get_scores_before(new_query, last_line_pos, length_vector, n, deadline)
+            truncated = truncated or second_truncated
+    if executor is not None and USE_IPC and not expand:
+        profiles_task.result()
+    if shards is not None and owns_index:
+        VSM.close()
+    if executor is not None and owns_index:
+        executor.close()
+    if 'corpus' in index and owns_index:
+        index['corpus'].close()
     
-    # Merge phrasal scores with normal scores
+    # Merge phrasal scores with normal scores, and rank by the combined scores (ties broken
+    # by document name, as in VectorSpaceModel)
     scores = [(doc, score + phrasal_scores.get(doc, 0)) for doc, score in scores]
+    scores.sort(key=lambda x: (-x[1], x[0]))
+    if candidates is not None:
+        # The candidates scored again come first, then the other documents of the first pass
+        rescored = [(doc, score) for doc, score in scores if doc in candidates]
+        rescored_docs = set([doc for doc, score in rescored])
+        scores = rescored + [(doc, score) for doc, score in first_scores if doc not in rescored_docs]
         
     
     if DEBUG_RESULTS:
         print_result_info(scores, retrieve, not_retrieve, patent_info)
     
-    write_to_output_file(output_file, scores)
+    tracing.set_info('truncated', truncated)
+    if cache is not None and not truncated:
+        cache.put(cache_key, generation, scores)
+
+    timed(times, 'output', write_to_output_file, output_file, scores)
+    if stage_times is not None:
+        stage_times.extend(times)
+    return (scores, truncated)
 
 
 def read_dict(dictionary_file):
     """
-    read dictionary_file and transfers it to the data structure of a python dictionary
+    read dictionary_file and transfers it to the data structure of a python dictionary.
+    Compact dictionary files (written by index.py -z) are memory-mapped instead.
     
     Arguments:
         dictionary_file   path to the file where the dictionary is saved
     
     Returns:
-        dict structure
+        dict structure (or CompactDictionary) of the form term -> (df, postings line)
     """
     
+    if CompactDictionary.is_compact(dictionary_file):
+        dictionary = CompactDictionary(dictionary_file)
+        return dictionary, dictionary.training_path
+
     d = open(dictionary_file, 'r')
 
     dictionary = {}
@@ -140,6 +412,195 @@ def get_line_positions(postings_file):
     f.close()
     return (line_offset, last_line_pos)
 
+def get_tiers(postings_file, line_positions):
+    """
+    Read the tiers line of a tiered postings file (see index.write_tiered_postings)
+
+    Returns:
+        None if the postings file is not tiered, otherwise (T, bounds) where T is the number of
+        terms and bounds the list of the low tier bounds of every term, by line
+    """
+    if len(line_positions) < 2:
+        return None
+    f = open(postings_file, 'r')
+    f.seek(line_positions[-2])
+    line = f.readline()
+    f.close()
+    if not line.startswith('#tiers '):
+        return None
+    fields = line.split()
+    return (int(fields[1]), [float(bound) for bound in fields[2:]])
+
+def get_duplicate_clusters(duplicates_file):
+    """
+    Return the clusters of near-duplicates of the duplicates file (see NearDuplicates.py)
+    """
+    from NearDuplicates import NearDuplicates
+    return NearDuplicates.read_clusters(duplicates_file)
+
+def collapse_duplicates(documents, clusters):
+    """
+    Return the set of the given documents without near-duplicates: of every cluster, only the
+    first member (the most cited) found in documents is kept
+    """
+    collapsed = set(documents)
+    for cluster in clusters:
+        members = [doc for doc in cluster if doc in collapsed]
+        collapsed.difference_update(members[1:])
+    return collapsed
+
+def open_index(index, times, dictionary, dictionary_file, postings_file, patent_info, shards, filter_file, filters, duplicates_file):
+    """
+    Load the structures the Vector Space Model needs (see load) and set it up with the
+    scoring settings and the document filter of the search, see search for the arguments
+
+    Returns:
+        (VSM, line_positions, last_line_pos, length_vector, n), the line positions, last line
+        position and document lengths being None on a sharded index
+    """
+    if shards is None:
+        line_positions, last_line_pos = load(index, times, 'line positions', get_line_positions, postings_file)
+        length_vector, n = load(index, times, 'length vector', get_length_vector, postings_file, last_line_pos)
+        VSM = VectorSpaceModel(dictionary, postings_file, line_positions)
+        VSM.documents = load(index, times, 'documents', DocumentTable, length_vector.keys())
+        VSM.postings_memo = index.get('postings memo')
+        VSM.tiers = load(index, times, 'tiers', get_tiers, postings_file, line_positions)
+        VSM.tier_top_k = TIER_TOP_K
+        VSM.tier_exact = TIER_EXACT
+        VSM.keep_accumulators = INCREMENTAL_RESCORING
+    else:
+        # The workers load the line positions and document lengths of their shard
+        from ShardedVectorSpaceModel import ShardedVectorSpaceModel
+        VSM = load(index, times, 'shards', ShardedVectorSpaceModel, dictionary_file, postings_file, shards, SHARD_TOP_K)
+        line_positions, last_line_pos, length_vector, n = None, None, None, VSM.n
+
+    # Metadata filters are applied while scoring, so that excluded patents are never scored
+    VSM.document_filter = None
+    if filters:
+        from DocumentFilters import DocumentFilters
+        if filter_file is None or not os.path.exists(filter_file):
+            raise RuntimeError, 'search: filters need the filter file written by index.py'
+        document_filters = load(index, times, 'filters', DocumentFilters.read, filter_file)
+        VSM.document_filter = timed(times, 'filter selection', lambda: document_filters.select(**filters))
+    if duplicates_file is not None:
+        if not os.path.exists(duplicates_file):
+            raise RuntimeError, 'search: collapsing near-duplicates needs the duplicates file written by index.py'
+        clusters = load(index, times, 'duplicates', get_duplicate_clusters, duplicates_file)
+        if VSM.document_filter is None:
+            VSM.document_filter = load(index, times, 'representatives', collapse_duplicates, patent_info, clusters)
+        else:
+            # Collapsed after filtering: a cluster is represented by its first member passing the filters
+            VSM.document_filter = timed(times, 'duplicate collapsing', collapse_duplicates, VSM.document_filter, clusters)
+    return (VSM, line_positions, last_line_pos, length_vector, n)
+
+def score_first_passes(query_files, dictionary_file, postings_file, patent_info_file, duplicates_file, index):
+    """
+    Run the first pass of several searches together, for a long-running process (see
+    QueryScheduler.py): the postings list of every distinct term of the queries is read and
+    walked once (see VectorSpaceModel.get_batch_scores). The results are kept in
+    index['first passes'], where run_search takes the first pass of its query from. Sharded
+    and tiered indexes are not batched; their searches score their own first pass.
+
+    Returns:
+        list of (stage, seconds) tuples for the steps of the batch (see timed)
+    """
+    times = []
+    dictionary, training_path = load(index, times, 'dictionary', read_dict, dictionary_file)
+    queries = {}
+    for query_file in query_files:
+        query_title, query_content = extract_query_words(query_file)
+        query = process_query(query_title + ' ' + query_content, dictionary)
+        queries[first_pass_key(query)] = query
+    patent_info = None
+    if duplicates_file is not None:
+        patent_info = load(index, times, 'patent info', get_patent_info, patent_info_file)
+    VSM, line_positions, last_line_pos, length_vector, n = open_index(index, times, dictionary, dictionary_file, postings_file, patent_info,
+                                                                      None, None, None, duplicates_file)
+    if VSM.tiers is not None:
+        return times
+    keys = queries.keys()
+    results = timed(times, 'batch first pass', VSM.get_batch_scores, [queries[key] for key in keys], last_line_pos, length_vector, n)
+    index['first passes'] = dict(zip(keys, results))
+    return times
+
+def first_pass_key(query):
+    """
+    Key of the first pass of a normalized query (see process_query) in index['first passes']
+    """
+    return tuple(sorted(query.items()))
+
+def get_settings():
+    """
+    Return the settings of this module (its upper case globals, e.g. those set from the command
+    line), by name
+    """
+    return dict([(name, value) for name, value in globals().items() if name.isupper()])
+
+def normalize_phrases(phrases):
+    """
+    Return what the scores of the phrasal queries depend on, as part of the cache key: the
+    sorted normalized terms of every phrase (see phrasal_queries.process_phrasal), with its
+    length if the phrase scores are weighted by it
+    """
+    if len(phrases) == 0:
+        return ()
+    import phrasal_queries
+    normalized = []
+    for phrase in phrases:
+        query_terms, query_count = phrasal_queries.process_phrasal(phrase)
+        if len(query_terms) > 0:
+            normalized.append((tuple(query_terms), len(phrase) if PHRASE_LENGTH_WEIGHTED else None))
+    return tuple(sorted(normalized))
+
+def start_independent_stages(executor, phrasal_state, phrases, index, ipc_profile_file):
+    """
+    Start the phrasal queries and the loading of the IPC profiles on the executor (see
+    StageExecutor.py)
+
+    Returns:
+        (phrase task, IPC profiles task), the latter being None if IPC expansion is disabled
+    """
+    if PHRASE_SCORING == 'proximity':
+        phrase_task = executor.submit(get_proximity_score, phrasal_state, phrases)
+    else:
+        phrase_task = executor.map(get_phrasal_score, phrasal_state, phrases)
+    profiles_task = None
+    if USE_IPC:
+        profiles_task = executor.submit(get_ipc_profiles, index, ipc_profile_file)
+    return (phrase_task, profiles_task)
+
+def get_phrasal_score(phrasal_state, phrase):
+    """
+    Run one phrasal query with the settings of the search
+
+    Arguments:
+        phrasal_state   tuple (VSM, last_line_pos, length_vector, n) of the search
+    """
+    VSM, last_line_pos, length_vector, n = phrasal_state
+    return VSM.get_phrasal_score(phrase, last_line_pos, length_vector, n, PHRASE_WEIGHT, PHRASE_LENGTH_WEIGHTED)
+
+def get_proximity_score(phrasal_state, phrases):
+    """
+    Score all the phrasal queries in one proximity pass with the settings of the search
+
+    Arguments:
+        phrasal_state   tuple (VSM, last_line_pos, length_vector, n) of the search
+    """
+    VSM, last_line_pos, length_vector, n = phrasal_state
+    return VSM.get_proximity_scores(phrases, last_line_pos, length_vector, n, PHRASE_WEIGHT, PHRASE_LENGTH_WEIGHTED, PROXIMITY_WINDOW)
+
+def get_ipc_profiles(index, ipc_profile_file):
+    """
+    Return the IPC profiles of the index, read from ipc_profile_file the first time, or None
+    if there is no profile file
+    """
+    if ipc_profile_file is None or not os.path.exists(ipc_profile_file):
+        return None
+    if 'ipc profiles' not in index:
+        from IPCProfiles import IPCProfiles
+        index['ipc profiles'] = IPCProfiles.read(ipc_profile_file)
+    return index['ipc profiles']
+
 def get_patent_info(patent_info_file):
     """
         Returns:
@@ -190,6 +651,7 @@ def extract_query_words(query_file):
     """
 
     tree = et.parse(query_file)
+    tracing.count('xml_parsed')
     root = tree.getroot()
 
     query_title = ''
@@ -206,18 +668,31 @@ def extract_query_words(query_file):
 
     return (query_title, query_content)
 
-def process_query(query_str):
+def process_query(query_str, dictionary=None):
     """
     Tokenize and stem the query words and compute the frequency of each word in the query list
 
     Arguments:
         query_str       string of query words
+        dictionary      if not None, words containing wildcards ('*' or '?', e.g. "vacu*") are
+                        expanded to all the matching terms of the dictionary
 
     Returns: 
         query_count     a dictionary with the stemmed words and the its frequency in the query
     """
+    import nltk
     
     query_list = []
+    if dictionary is not None:
+        plain_words = []
+        for word in query_str.split():
+            if '*' not in word and '?' not in word:
+                plain_words.append(word)
+                continue
+            pattern = word.strip(string.punctuation.replace('*', '').replace('?', '')).lower()
+            query_list.extend(expand_wildcard(pattern, dictionary))
+        query_str = ' '.join(plain_words)
+
     sentences = nltk.sent_tokenize(query_str)
     for sentence in sentences:
         words = nltk.word_tokenize(sentence)
@@ -236,6 +711,17 @@ def process_query(query_str):
 
     return query_weight
 
+def expand_wildcard(pattern, dictionary):
+    """
+    Return the terms of the dictionary matching a wildcard pattern. Compact dictionaries
+    only look at the terms sharing the prefix of the pattern, python dictionaries are scanned.
+    """
+    if len(pattern.strip('*?')) == 0:
+        return []
+    if isinstance(dictionary, CompactDictionary):
+        return dictionary.match(pattern)
+    return fnmatch.filter(dictionary.keys(), pattern)
+
 def write_to_output_file(output_file, scores):
     """
     writes the scores to output_file
@@ -253,8 +739,63 @@ def write_to_output_file(output_file, scores):
     
     g.write('\n'.join([doc_name + ' ' + str(score) for doc_name, score in scores])) #just for debugging - remove later	
 
+def load(index, times, structure, function, *args):
+    """
+    Return the given structure of index, loading it with function (as the stage structure
+    of the search, see timed) if it is not loaded yet
+    """
+    if structure not in index:
+        index[structure] = timed(times, structure, function, *args)
+    return index[structure]
+
+def timed(times, step, function, *args):
+    """
+    Call function with the given arguments as the stage step of the search (see tracing.stage)
+    """
+    with tracing.stage(step, times):
+        return function(*args)
+
+def serve(scheduler, lines):
+    """
+    Long-running mode: every line of lines is of the form "query-file output-file" and is
+    answered on its own thread through scheduler (a QueryScheduler), so that queries arriving
+    together are batched. "output-file number-of-results" is printed when a query is done.
+    """
+    import threading
+    output_lock = threading.Lock()
+
+    def answer(query_file, output_file):
+        try:
+            scores, truncated = scheduler.search(query_file, output_file)
+            message = '%s %d' % (output_file, len(scores))
+        except Exception, e:
+            message = '%s error: %s' % (output_file, e)
+        with output_lock:
+            print message
+            sys.stdout.flush()
+
+    threads = []
+    for line in lines:
+        if line.strip() == '':
+            continue
+        query_file, output_file = line.split()
+        thread = threading.Thread(target=answer, args=(query_file, output_file))
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()
+
+def print_startup_report(startup_times):
+    """
+    Print how long each step of loading the index and the models took, to stderr
+    """
+    startup_times = [('imports', import_time)] + startup_times
+    for step, seconds in startup_times:
+        sys.stderr.write('startup: %-20s %.3fs\n' % (step, seconds))
+    sys.stderr.write('startup: %-20s %.3fs\n' % ('total', sum([t for _, t in startup_times])))
+
 def usage():
-    print 'usage: ' + sys.argv[0] + ' -d dictionary-file -p postings-file -q file-of-queries -o output-file-of-results -r output-debug-file'
+    print 'usage: ' + sys.argv[0] + ' -d dictionary-file -p postings-file -q file-of-queries -o output-file-of-results -r output-debug-file [-c ipc-profile-file] [-b time-budget-in-seconds] [-s] [-k cache-file] [-T trace-file] [-P cprofile|sample -F profile-file] [-S number-of-shards] [-L] [-f filter-file] [-Y min-year-max-year] [-I ipc,ipc,...] [-C min-citations] [-U duplicates-file] [-Q patent-number [-D neighbours-file]]'
 
 def print_result_info(scores, retrieve, not_retrieve, patent_info):
     """
@@ -301,6 +842,7 @@ def print_result_info(scores, retrieve, not_retrieve, patent_info):
     if not PRINT_IPC:
         return
     
+    from IPC import IPC
     print 'IPC subclasses in the top 50 documents: '
     top = Counter([str(IPC(patent_info[doc][2]).subclass()) for doc, score in scores[:50]])
     print top
@@ -348,35 +890,113 @@ def print_patent_info(retrieve, not_retrieve, patent_info):
 # MAIN
 ######################
 
-query_file = 'queries/q2.xml'
-dictionary_file = 'dictionary.txt'
-postings_file = 'postings.txt'
-output_file = 'output.txt'
-patent_info_file = 'patent_info.txt'
-retrieve = 'queries/q2-qrels+ve.txt'
-not_retrieve = 'queries/q2-qrels-ve.txt'
-
-last_dict_line = 0
-
-try:
-    opts, args = getopt.getopt(sys.argv[1:], 'q:d:p:o:r:n:')
-except getopt.GetoptError, err:
-    usage()
-    sys.exit(2)
-for o, a in opts:
-    if o == '-q':
-        query_file = a
-    elif o == '-d':
-        dictionary_file = a
-    elif o == '-p':
-        postings_file = a
-    elif o == '-o':
-        output_file = a
-    elif o == '-r':
-        retrieve = a
-    elif o == '-n':
-        not_retrieve = a
-    else:
-        assert False, 'unhandled option'
-
-search(query_file, dictionary_file, postings_file, output_file, patent_info_file, retrieve, not_retrieve)
+if __name__ == '__main__':
+    query_file = 'queries/q2.xml'
+    dictionary_file = 'dictionary.txt'
+    postings_file = 'postings.txt'
+    output_file = 'output.txt'
+    patent_info_file = 'patent_info.txt'
+    ipc_profile_file = 'ipc_profiles.txt'
+    time_budget = None
+    cache_file = None
+    trace_file = None
+    profile_mode = None
+    profile_file = 'search.prof'
+    shards = None
+    long_running = False
+    filter_file = 'filters.txt'
+    filters = {}
+    duplicates_file = None
+    patent = None
+    neighbours_file = 'neighbours.txt'
+    retrieve = 'queries/q2-qrels+ve.txt'
+    not_retrieve = 'queries/q2-qrels-ve.txt'
+
+    last_dict_line = 0
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'q:d:p:o:r:n:c:b:sk:T:P:F:S:Lf:Y:I:C:Q:D:U:')
+    except getopt.GetoptError, err:
+        usage()
+        sys.exit(2)
+    for o, a in opts:
+        if o == '-q':
+            query_file = a
+        elif o == '-d':
+            dictionary_file = a
+        elif o == '-p':
+            postings_file = a
+        elif o == '-o':
+            output_file = a
+        elif o == '-r':
+            retrieve = a
+        elif o == '-n':
+            not_retrieve = a
+        elif o == '-c':
+            ipc_profile_file = a
+        elif o == '-b':
+            time_budget = float(a)
+        elif o == '-s':
+            STARTUP_REPORT = True
+        elif o == '-k':
+            cache_file = a
+        elif o == '-T':
+            trace_file = a
+        elif o == '-P':
+            profile_mode = a
+        elif o == '-F':
+            profile_file = a
+        elif o == '-S':
+            shards = int(a) if int(a) > 1 else None
+        elif o == '-L':
+            long_running = True
+        elif o == '-f':
+            filter_file = a
+        elif o == '-Y':
+            min_year, max_year = a.split('-')
+            if min_year != '':
+                filters['min_year'] = int(min_year)
+            if max_year != '':
+                filters['max_year'] = int(max_year)
+        elif o == '-I':
+            filters['ipc'] = a.split(',')
+        elif o == '-C':
+            filters['min_cites'] = int(a)
+        elif o == '-U':
+            duplicates_file = a
+        elif o == '-Q':
+            patent = a
+        elif o == '-D':
+            neighbours_file = a
+        else:
+            assert False, 'unhandled option'
+
+    if patent is not None:
+        search_by_patent(patent, neighbours_file, output_file, filter_file, filters)
+        sys.exit(0)
+
+    cache = None
+    if cache_file is not None:
+        from QueryCache import QueryCache
+        cache = QueryCache(CACHE_SIZE, CACHE_TTL, cache_file)
+
+    if long_running:
+        # The scheduler searches through the search module, which is not this one (__main__)
+        from QueryScheduler import QueryScheduler
+        scheduler = QueryScheduler(dictionary_file, postings_file, patent_info_file, ipc_profile_file, cache=cache, shards=shards,
+                                   duplicates_file=duplicates_file, settings=get_settings())
+        serve(scheduler, iter(sys.stdin.readline, ''))
+        scheduler.close()
+        if cache is not None:
+            cache.save()
+        sys.exit(0)
+
+    profiler = None
+    if profile_mode is not None:
+        profiler = tracing.Profiler(profile_mode, profile_file)
+
+    scores, truncated = search(query_file, dictionary_file, postings_file, output_file, patent_info_file, retrieve, not_retrieve, ipc_profile_file, time_budget, cache, None, trace_file, profiler, shards, filter_file, filters, duplicates_file)
+    if cache is not None:
+        cache.save()
+    if truncated:
+        sys.stderr.write('search: time budget exceeded, results are truncated\n')
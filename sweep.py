@@ -0,0 +1,213 @@
+#!/usr/bin/python
+import sys
+import getopt
+import os
+import time
+import json
+import itertools
+import search
+import tracing
+
+# Grid used when none is given on the command line
+DEFAULT_GRID = [
+    ('USE_PHRASES', [True, False]),
+    ('USE_IPC', [True, False]),
+    ('IPC_DOCUMENTS', [5, 10]),
+    ('IPC_TERMS', [30, 120]),
+]
+
+def sweep(query_path, grid, index_files, cutoff, work_path):
+    """
+    Run every query of query_path that has relevance judgments with every combination of the
+    search settings in grid, and measure the quality and the cost of each combination.
+
+    Arguments:
+        grid            list of (setting name in search.py, list of values)
+        index_files     tuple (dictionary file, postings file, patent info file, ipc profile file)
+        cutoff          rank at which precision, recall and F-measure are computed
+
+    Returns:
+        list of dictionaries, one per combination, with the settings, MAP, mean F-measure,
+        latency percentiles and the mean postings work per query
+    """
+    queries = get_queries(query_path)
+    names = [name for name, values in grid]
+    original = dict([(name, getattr(search, name)) for name in names])
+
+    results = []
+    try:
+        for values in itertools.product(*[values for name, values in grid]):
+            settings = dict(zip(names, values))
+            for name, value in settings.iteritems():
+                setattr(search, name, value)
+            results.append(evaluate(queries, settings, index_files, cutoff, work_path))
+    finally:
+        for name, value in original.iteritems():
+            setattr(search, name, value)
+
+    mark_pareto_frontier(results)
+    return results
+
+def evaluate(queries, settings, index_files, cutoff, work_path):
+    """
+    Run all queries with the current settings of search.py and summarize the results
+    """
+    dictionary_file, postings_file, patent_info_file, ipc_profile_file = index_files
+    output_file = os.path.join(work_path, 'sweep_output.txt')
+
+    average_precisions = []
+    f_measures = []
+    latencies = []
+    work = dict([(counter, 0) for counter in tracing.COUNTERS])
+    for query_file, relevant in queries:
+        tracing.begin(query_file)
+        start = time.time()
+        scores, truncated = search.search(query_file, dictionary_file, postings_file, output_file, patent_info_file,
+                                          None, None, ipc_profile_file)
+        latencies.append(time.time() - start)
+        trace = tracing.end()
+        for stage in trace.stages:
+            for counter in tracing.COUNTERS:
+                work[counter] += stage[counter]
+
+        ranking = [doc for doc, score in scores]
+        average_precisions.append(average_precision(ranking, relevant))
+        f_measures.append(f_measure(ranking[:cutoff], relevant))
+
+    latencies.sort()
+    return {
+        'settings': settings,
+        'map': sum(average_precisions) / len(queries),
+        'f_measure': sum(f_measures) / len(queries),
+        'cutoff': cutoff,
+        'latency_mean': sum(latencies) / len(latencies),
+        'latency_p50': latencies[len(latencies) / 2],
+        'latency_max': latencies[-1],
+        'work_per_query': dict([(counter, work[counter] / float(len(queries))) for counter in work]),
+    }
+
+def get_queries(query_path):
+    """
+    Return (query file, set of relevant documents) for every query qN.xml of query_path
+    that has a qN-qrels+ve.txt file
+    """
+    queries = []
+    for name in sorted(os.listdir(query_path)):
+        base, extension = os.path.splitext(name)
+        qrels = os.path.join(query_path, base + '-qrels+ve.txt')
+        if extension != '.xml' or not os.path.exists(qrels):
+            continue
+        with open(qrels) as r:
+            relevant = set([l.strip() for l in r.readlines() if l.strip() != ''])
+        queries.append((os.path.join(query_path, name), relevant))
+    return queries
+
+def average_precision(ranking, relevant):
+    hits = 0
+    total = 0.0
+    for i, doc in enumerate(ranking):
+        if doc in relevant:
+            hits += 1
+            total += hits / float(i + 1)
+    return total / len(relevant) if len(relevant) > 0 else 0.0
+
+def f_measure(retrieved, relevant):
+    hits = len(set(retrieved) & relevant)
+    if hits == 0:
+        return 0.0
+    precision = hits / float(len(retrieved))
+    recall = hits / float(len(relevant))
+    return 2 * precision * recall / (precision + recall)
+
+def mark_pareto_frontier(results):
+    """
+    Flag the results for which no other result is both faster and better (in MAP)
+    """
+    for result in results:
+        result['pareto'] = not any([other['latency_mean'] <= result['latency_mean'] and other['map'] >= result['map'] and
+                                    (other['latency_mean'] < result['latency_mean'] or other['map'] > result['map'])
+                                    for other in results])
+
+def parse_grid_option(option):
+    """
+    Parse a grid option of the form NAME=value1,value2,...
+    """
+    name, values = option.split('=', 1)
+    if not hasattr(search, name):
+        raise RuntimeError, 'sweep: unknown setting %s' % name
+    return (name, [parse_value(v) for v in values.split(',')])
+
+def parse_value(value):
+    if value in ['True', 'False']:
+        return value == 'True'
+    try:
+        return int(value)
+    except ValueError:
+        pass
+    try:
+        return float(value)
+    except ValueError:
+        # e.g. POS_TAGGER=perceptron,lexicon
+        return value
+
+def print_results(results):
+    print '%-8s %-8s %-10s %-10s %-12s  %s' % ('pareto', 'MAP', 'F', 'latency', 'postings KB', 'settings')
+    for result in sorted(results, key=lambda r: r['latency_mean']):
+        print '%-8s %-8.4f %-10.4f %-10.4f %-12.1f  %s' % ('*' if result['pareto'] else '', result['map'], result['f_measure'],
+                                                          result['latency_mean'], result['work_per_query']['postings_bytes'] / 1024.0,
+                                                          ' '.join(['%s=%s' % item for item in sorted(result['settings'].items())]))
+
+def usage():
+    print "usage: " + sys.argv[0] + " [-q directory-of-queries] [-d dictionary-file] [-p postings-file] [-i patent-info-file] [-c ipc-profile-file] [-g SETTING=v1,v2,...]* [-k cutoff] [-o results-file]"
+
+
+######################
+# MAIN
+######################
+
+if __name__ == '__main__':
+    query_path = "queries/"
+    dictionary_file = "dictionary.txt"
+    postings_file = "postings.txt"
+    patent_info_file = "patent_info.txt"
+    ipc_profile_file = "ipc_profiles.txt"
+    grid = []
+    cutoff = 50
+    results_file = "sweep_results.jsonl"
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'q:d:p:i:c:g:k:o:')
+    except getopt.GetoptError, err:
+        usage()
+        sys.exit(2)
+    for o, a in opts:
+        if o == '-q':
+            query_path = a
+        elif o == '-d':
+            dictionary_file = a
+        elif o == '-p':
+            postings_file = a
+        elif o == '-i':
+            patent_info_file = a
+        elif o == '-c':
+            ipc_profile_file = a
+        elif o == '-g':
+            grid.append(parse_grid_option(a))
+        elif o == '-k':
+            cutoff = int(a)
+        elif o == '-o':
+            results_file = a
+        else:
+            assert False, "unhandled option"
+
+    if grid == []:
+        grid = DEFAULT_GRID
+
+    index_files = (dictionary_file, postings_file, patent_info_file, ipc_profile_file)
+    results = sweep(query_path, grid, index_files, cutoff, os.path.dirname(os.path.abspath(results_file)))
+
+    f = open(results_file, 'a')
+    for result in results:
+        f.write(json.dumps(result, sort_keys=True) + '\n')
+    f.close()
+    print_results(results)
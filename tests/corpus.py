@@ -0,0 +1,30 @@
+import os
+import index
+from generate_corpus import write_patent, write_query
+
+def build_index(path, patents, **options):
+    """
+    Write patents, a list of tuples (patent ID, title, abstract, IPC, year, cites), as a
+    corpus in path and index it with index.indexing and the given options.
+
+    Returns:
+        (dictionary file, postings file, patent info file)
+    """
+    corpus_path = os.path.join(path, 'corpus')
+    os.makedirs(corpus_path)
+    for pat_id, title, abstract, ipc, year, cites in patents:
+        write_patent(os.path.join(corpus_path, pat_id + '.xml'), pat_id, title.split(), abstract.split(),
+                     [('Publication Year', str(year)), ('Cited By Count', str(cites)), ('IPC Primary', ipc)])
+    index_files = tuple([os.path.join(path, name) for name in ['dictionary.txt', 'postings.txt', 'patent_info.txt']])
+    dictionary_file, postings_file, patent_info_file = index_files
+    index.indexing(corpus_path, postings_file, dictionary_file, patent_info_file, **options)
+    return index_files
+
+def query_file(path, name, title, description):
+    """
+    Write a query to path and return its file name. description follows the four words
+    the queries start their description with (see search.extract_query_words).
+    """
+    query_path = os.path.join(path, name)
+    write_query(query_path, title.split(), description.split())
+    return query_path
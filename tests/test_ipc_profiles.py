@@ -0,0 +1,58 @@
+import os
+import shutil
+import tempfile
+import unittest
+from IPCProfiles import IPCProfiles
+
+PATENTS = [
+    ('B08B5/00', {'clean': 3, 'diffus': 1, 'gas': 2}),
+    ('B08B3/02', {'clean': 1, 'nozzl': 2}),
+    ('D06F35/00', {'wash': 4, 'bubbl': 2, 'laundri': 1}),
+    ('B08B5/04', {'gas': 1, 'vacuum': 3}),
+    ('D06F39/08', {'wash': 1, 'foam': 2}),
+]
+DOC_FREQS = {'clean': 2, 'diffus': 1, 'ga': 2, 'nozzl': 1, 'wash': 2, 'bubbl': 1, 'laundri': 1, 'vacuum': 1, 'foam': 1}
+
+class IPCProfilesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def build(self, patents, profiles=None):
+        profiles = profiles if profiles is not None else IPCProfiles()
+        for ipc, term_counts in patents:
+            profiles.add_patent(ipc, term_counts)
+        return profiles
+
+    def write(self, profiles, name, depth=None):
+        profile_file = os.path.join(self.path, name)
+        profiles.write(profile_file, DOC_FREQS, len(PATENTS), depth)
+        return profile_file
+
+    def test_updated_profiles_match_a_full_build(self):
+        full = self.write(self.build(PATENTS), 'full.txt')
+
+        first = IPCProfiles.read(self.write(self.build(PATENTS[:3]), 'first.txt'))
+        self.assertEqual(first.depth, None)
+        updated = self.write(self.build(PATENTS[3:], first), 'updated.txt')
+
+        self.assertEqual(open(updated).read(), open(full).read())
+        self.assertEqual(IPCProfiles.read(updated).get_term_counts('B08B'), {'clean': 4, 'diffus': 1, 'gas': 3, 'nozzl': 2, 'vacuum': 3})
+
+    def test_update_merges_counts(self):
+        profiles = self.build(PATENTS[:3])
+        profiles.update(self.build(PATENTS[3:]).profiles)
+        self.assertEqual(profiles.profiles, self.build(PATENTS).profiles)
+
+    def test_truncated_profiles_cannot_be_updated(self):
+        truncated = IPCProfiles.read(self.write(self.build(PATENTS), 'truncated.txt', 2))
+        self.assertEqual(truncated.depth, 2)
+        self.assertEqual(len(truncated.get_term_counts('B08B')), 2)
+        self.assertRaises(RuntimeError, truncated.add_patent, 'B08B5/00', {'clean': 1})
+        self.assertRaises(RuntimeError, truncated.update, {'B08B': {'clean': 1}})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+import search
+from VectorSpaceModel import VectorSpaceModel
+from QueryScheduler import QueryScheduler
+from corpus import build_index, query_file
+from test_search import PATENTS
+
+class QuerySchedulerTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.path = tempfile.mkdtemp()
+        cls.dictionary_file, cls.postings_file, cls.patent_info_file = build_index(cls.path, PATENTS)
+        cls.queries = [query_file(cls.path, 'washer.xml', 'Laundry washer', 'washing with detergent in the drum'),
+                       query_file(cls.path, 'bubbler.xml', 'Aquarium bubbler', 'air bubbles through a porous stone')]
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.path)
+
+    def setUp(self):
+        self.settings = dict([(name, getattr(search, name)) for name in dir(search) if name.isupper()])
+
+    def tearDown(self):
+        for name, value in self.settings.iteritems():
+            setattr(search, name, value)
+
+    def search_together(self, settings=None):
+        """
+        Submit all the queries at once to a scheduler and return their scores and the number
+        of first passes scored on their own
+        """
+        scheduler = QueryScheduler(self.dictionary_file, self.postings_file, self.patent_info_file, batch_window=1, settings=settings)
+        single_passes = []
+        get_scores = VectorSpaceModel.get_scores
+        def recording_get_scores(VSM, query, *args):
+            single_passes.append(query)
+            return get_scores(VSM, query, *args)
+        results = {}
+        def ask(query):
+            results[query] = scheduler.search(query, query + '.out')[0]
+        VectorSpaceModel.get_scores = recording_get_scores
+        try:
+            threads = [threading.Thread(target=ask, args=(query,)) for query in self.queries]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            VectorSpaceModel.get_scores = get_scores
+            scheduler.close()
+        return results, len(single_passes)
+
+    def test_batches_score_their_first_passes_together(self):
+        results, single_passes = self.search_together()
+        self.assertEqual(single_passes, 0)
+        for query in self.queries:
+            scores, truncated = search.search(query, self.dictionary_file, self.postings_file, os.path.join(self.path, 'output.txt'),
+                                              self.patent_info_file, None, None)
+            self.assertEqual([doc for doc, score in results[query]], [doc for doc, score in scores])
+            for (doc, batch_score), (doc, score) in zip(results[query], scores):
+                self.assertAlmostEqual(batch_score, score)
+
+    def test_settings_are_handed_to_the_searches(self):
+        results, single_passes = self.search_together({'USE_PRF': False, 'USE_IPC': False, 'USE_PHRASES': False})
+        search.USE_PRF, search.USE_IPC, search.USE_PHRASES = False, False, False
+        for query in self.queries:
+            scores, truncated = search.search(query, self.dictionary_file, self.postings_file, os.path.join(self.path, 'output.txt'),
+                                              self.patent_info_file, None, None)
+            self.assertEqual(results[query], scores)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+import os
+import shutil
+import tempfile
+import unittest
+import search
+import phrasal_queries
+from VectorSpaceModel import VectorSpaceModel
+from QueryCache import QueryCache
+from corpus import build_index, query_file
+
+# Most patents are about laundry (D06F), so IPC expansion reads the laundry patents. The
+# aquarium patent only shares the term "bubbler" with the query, through its wildcard.
+PATENTS = [
+    ('EP0000001A1', 'Laundry washer', 'A washer drum rotates the laundry in water with detergent.', 'D06F37/00', 1999, 3),
+    ('EP0000002A1', 'Washing machine drum', 'The drum of a washing machine spins the laundry after the water is drained.', 'D06F37/20', 2001, 1),
+    ('EP0000003A1', 'Laundry detergent dispenser', 'A dispenser releases detergent into the washing water of the laundry.', 'D06F39/02', 2003, 0),
+    ('EP0000004A1', 'Washer with foam', 'The washer produces bubbles and foam that loosen dirt from the laundry.', 'D06F35/00', 2005, 2),
+    ('EP0000005A1', 'Aquarium bubbler', 'bubbler pumps air through porous stone into an aquarium tank.', 'B01F3/04', 2007, 0),
+]
+
+class SearchTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.path = tempfile.mkdtemp()
+        cls.dictionary_file, cls.postings_file, cls.patent_info_file = build_index(cls.path, PATENTS)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.path)
+
+    def setUp(self):
+        self.settings = dict([(name, getattr(search, name)) for name in dir(search) if name.isupper()])
+
+    def tearDown(self):
+        for name, value in self.settings.iteritems():
+            setattr(search, name, value)
+
+    def search(self, query, cache=None):
+        scores, truncated = search.search(query, self.dictionary_file, self.postings_file, os.path.join(self.path, 'output.txt'),
+                                          self.patent_info_file, None, None, cache=cache)
+        return scores
+
+    def test_paraphrased_queries_share_a_cache_entry(self):
+        cache = QueryCache()
+        scores = self.search(query_file(self.path, 'washers.xml', 'Laundry washers', 'washing of the laundry with bubbles'), cache)
+        self.assertEqual((cache.hits, cache.misses), (0, 1))
+        # Other stop words, case, punctuation and word forms with the same stems
+        paraphrase = query_file(self.path, 'washer.xml', 'laundry washer', 'washing, laundry with a bubble')
+        self.assertEqual(self.search(paraphrase, cache), scores)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_reordered_queries_share_a_cache_entry_without_phrases(self):
+        cache = QueryCache()
+        reordered = query_file(self.path, 'reordered.xml', 'Washer laundry', 'washing of the laundry with bubbles')
+        self.search(query_file(self.path, 'ordered.xml', 'Laundry washer', 'washing of the laundry with bubbles'), cache)
+        # The phrases of the title differ
+        self.search(reordered, cache)
+        self.assertEqual(cache.hits, 0)
+
+        search.USE_PHRASES = False
+        scores = self.search(query_file(self.path, 'ordered.xml', 'Laundry washer', 'washing of the laundry with bubbles'), cache)
+        self.assertEqual(self.search(reordered, cache), scores)
+        self.assertEqual(cache.hits, 1)
+
+    def test_wildcard_terms_are_kept_by_the_expansion(self):
+        query = query_file(self.path, 'wildcard.xml', 'Laundry washer', 'washing with bubbl* in the drum')
+        search.USE_PRF = False
+        search.USE_IPC = False
+        first_pass = [doc for doc, score in self.search(query)]
+        self.assertIn('EP0000005A1', first_pass)
+
+        search.USE_IPC = True
+        search.INCREMENTAL_RESCORING = True
+        full_passes = []
+        rescored = []
+        get_scores, rescore = VectorSpaceModel.get_scores, VectorSpaceModel.rescore
+        def recording_get_scores(VSM, query, *args):
+            full_passes.append(query)
+            return get_scores(VSM, query, *args)
+        def recording_rescore(VSM, query, *args):
+            rescored.append(query)
+            return rescore(VSM, query, *args)
+        VectorSpaceModel.get_scores, VectorSpaceModel.rescore = recording_get_scores, recording_rescore
+        try:
+            expanded = [doc for doc, score in self.search(query)]
+        finally:
+            VectorSpaceModel.get_scores, VectorSpaceModel.rescore = get_scores, rescore
+        # The expanded query holds the terms of the wildcard, and none of its raw tokens...
+        self.assertEqual(len(rescored), 1)
+        self.assertIn('bubbler', rescored[0])
+        self.assertIn('bubbl', rescored[0])
+        self.assertEqual([term for term in rescored[0] if '*' in term], [])
+        self.assertIn('EP0000005A1', expanded)
+        # ... so it is rescored from the first pass, which is the only full pass
+        self.assertEqual(len(full_passes), 1)
+
+    def test_proximity_hits_move_documents_up(self):
+        # The dispenser patent matches most query terms, the first patent holds "washer drum"
+        query = query_file(self.path, 'proximity.xml', 'Washer drum', 'detergent dispenser releases washing water')
+        search.USE_PRF = False
+        search.USE_IPC = False
+        search.USE_PHRASES = False
+        self.assertEqual([doc for doc, score in self.search(query)][:2], ['EP0000003A1', 'EP0000001A1'])
+
+        search.USE_PHRASES = True
+        search.PHRASE_SCORING = 'proximity'
+        for candidates in [None, 2]:
+            search.CANDIDATES = candidates
+            scores = self.search(query)
+            self.assertEqual([doc for doc, score in scores][:2], ['EP0000001A1', 'EP0000003A1'])
+            self.assertEqual(scores[:2], sorted(scores[:2], key=lambda x: -x[1]))
+
+    def test_phrases_do_not_span_wildcards(self):
+        phrases = phrasal_queries.generate_phrasal_queries('Laundry washer bubbl* drum', '', 'lexicon')
+        self.assertEqual(phrases, ['Laundry washer', 'Laundry washer', 'drum'])
+
+if __name__ == '__main__':
+    unittest.main()
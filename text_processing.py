@@ -1,13 +1,25 @@
-import nltk
 import string
-from nltk.stem.porter import *
 
-__stemmer = PorterStemmer()
+# The stemmer and the stop word corpus are loaded on the first call to normalize,
+# so importing this module does not load nltk.
+__stemmer = None
 __use_stop_words = True
-__stops = set(nltk.corpus.stopwords.words('english'))
+__stops = None
 
 # Some additional stop words specific to this corpus. The effect of stopping those words is still unclear.
-__stops |= {'mechanism', 'technology', 'technique', 'using', 'means', 'apparatus', 'method', 'system', 'perform', 'include'}
+__extra_stops = {'mechanism', 'technology', 'technique', 'using', 'means', 'apparatus', 'method', 'system', 'perform', 'include'}
+
+def __load():
+    """
+    Create the stemmer and read the stop word corpus. The stemmer is set last: normalize
+    takes it as the sign that both are loaded, and may be called from several threads
+    (see QueryScheduler.py and StageExecutor.py).
+    """
+    global __stemmer, __stops
+    from nltk.corpus import stopwords
+    from nltk.stem.porter import PorterStemmer
+    __stops = set(stopwords.words('english')) | __extra_stops
+    __stemmer = PorterStemmer()
 
 def normalize(word):
     """
@@ -15,8 +27,10 @@ def normalize(word):
     If a term is stopped or otherwise needs to be ignored, None is returned.
     Otherwise the result of the normalization is returned.
     """
+    if __stemmer is None:
+        __load()
+
     if word in string.punctuation or (__use_stop_words and word in __stops):
         return None
 
     return __stemmer.stem(word.encode('utf-8').lower())
-    
\ No newline at end of file
@@ -0,0 +1,176 @@
+import time
+import json
+import signal
+import threading
+import operator
+from contextlib import contextmanager
+
+# Counters recorded for every stage of a traced search
+COUNTERS = ['postings_lists', 'postings_bytes', 'documents_scored', 'xml_parsed', 'low_tier_skipped']
+
+# The trace of the search currently running, if any. Like the stop words in
+# text_processing, this is module state, so that the scoring code can report
+# its work without a trace object being passed around.
+__trace = None
+# Counters of the work a thread does on behalf of a stage running in another thread, see collect
+__collected = threading.local()
+
+class Trace:
+    '''
+        Record of the work done in every stage of one search: wall time and the counters
+        in COUNTERS. Work done outside of any stage is recorded under the stage "other".
+    '''
+
+    def __init__(self, query):
+        self.query = query
+        self.start = time.time()
+        self.stages = []
+        self.current = None
+        self.other = None
+        self.info = {}
+
+    def begin_stage(self, name):
+        self.current = self.__new_stage(name)
+
+    def end_stage(self, seconds):
+        self.current['seconds'] = seconds
+        self.current = None
+
+    def count(self, counter, amount):
+        current = self.current
+        if current is None:
+            if self.other is None:
+                self.other = self.__new_stage('other')
+                self.other['seconds'] = None
+            current = self.other
+        current[counter] += amount
+
+    def __new_stage(self, name):
+        new_stage = dict([('stage', name)] + [(counter, 0) for counter in COUNTERS])
+        self.stages.append(new_stage)
+        return new_stage
+
+    def to_dict(self):
+        result = {'query': self.query, 'time': self.start, 'seconds': time.time() - self.start, 'stages': self.stages}
+        result.update(self.info)
+        return result
+
+def begin(query):
+    """
+    Start tracing a search for the given query
+    """
+    global __trace
+    __trace = Trace(query)
+    return __trace
+
+def end(trace_file=None):
+    """
+    Stop tracing and return the trace. If trace_file is given, the trace is also appended
+    to it as one JSON line.
+    """
+    global __trace
+    trace = __trace
+    __trace = None
+    if trace is None or trace_file is None:
+        return trace
+    f = open(trace_file, 'a')
+    f.write(json.dumps(trace.to_dict(), sort_keys=True) + '\n')
+    f.close()
+    return trace
+
+def count(counter, amount=1):
+    """
+    Add amount to a counter of the current stage. Does nothing if no search is traced.
+    """
+    counters = getattr(__collected, 'counters', None)
+    if counters is not None:
+        counters[counter] = counters.get(counter, 0) + amount
+    elif __trace is not None:
+        __trace.count(counter, amount)
+
+def set_info(key, value):
+    """
+    Attach extra information (e.g. whether the search was truncated) to the current trace
+    """
+    if __trace is not None:
+        __trace.info[key] = value
+
+@contextmanager
+def collect(counters):
+    """
+    Add the counts of the calling thread to the dictionary counters instead of the current
+    stage, for work done by another thread or process than the one running the stage (see
+    StageExecutor.py). The stage adds them with count once the work is done.
+    """
+    __collected.counters = counters
+    try:
+        yield
+    finally:
+        __collected.counters = None
+
+@contextmanager
+def stage(name, times):
+    """
+    Run a stage of the search: appends (name, seconds) to times and, if the search is
+    traced, records the counters of the stage.
+    """
+    if __trace is not None:
+        __trace.begin_stage(name)
+    stage_start = time.time()
+    try:
+        yield
+    finally:
+        seconds = time.time() - stage_start
+        times.append((name, seconds))
+        if __trace is not None:
+            __trace.end_stage(seconds)
+
+class Profiler:
+    '''
+        Per-query profiling hook. With mode "cprofile", the query runs under cProfile and
+        the statistics are dumped to profile_file (readable with pstats). With mode "sample",
+        the stack is sampled every interval seconds of CPU time with SIGPROF, which costs
+        much less, and the functions seen most often are written to profile_file.
+    '''
+
+    def __init__(self, mode, profile_file, interval=0.001):
+        if mode not in ['cprofile', 'sample']:
+            raise RuntimeError, 'Profiler: unknown mode %s' % mode
+        self.mode = mode
+        self.profile_file = profile_file
+        self.interval = interval
+        self.samples = {}
+
+    def start(self):
+        if self.mode == 'cprofile':
+            import cProfile
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+        else:
+            signal.signal(signal.SIGPROF, self.__sample)
+            signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def stop(self):
+        if self.mode == 'cprofile':
+            self.profile.disable()
+            self.profile.dump_stats(self.profile_file)
+            return
+
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        signal.signal(signal.SIGPROF, signal.SIG_DFL)
+        f = open(self.profile_file, 'w')
+        total = max(1, sum(self.samples.values()))
+        for function, samples in sorted(self.samples.items(), key=operator.itemgetter(1), reverse=True):
+            f.write('%6d %5.1f%%  %s\n' % (samples, 100.0 * samples / total, function))
+        f.close()
+
+    def __sample(self, signum, frame):
+        # Count every function on the stack once, giving inclusive sample counts
+        seen = set()
+        while frame is not None:
+            code = frame.f_code
+            function = '%s:%d(%s)' % (code.co_filename, code.co_firstlineno, code.co_name)
+            if function not in seen:
+                seen.add(function)
+                self.samples[function] = self.samples.get(function, 0) + 1
+            frame = frame.f_back